@@ -3,8 +3,8 @@ from .models import Dataset, DataTable
 
 @admin.register(Dataset)
 class DatasetAdmin(admin.ModelAdmin):
-    list_display = ('name', 'uploaded_at', 'processed')
-    list_filter = ('processed', 'uploaded_at')
+    list_display = ('name', 'uploaded_at', 'status')
+    list_filter = ('status', 'uploaded_at')
     search_fields = ('name',)
 
 @admin.register(DataTable)
@@ -12,5 +12,3 @@ class DataTableAdmin(admin.ModelAdmin):
     list_display = ('name', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('name',)
-
-print("Admin configuration created")
\ No newline at end of file
@@ -3,4 +3,10 @@ from django.apps import AppConfig
 
 class DataVizAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'data_viz_app'
\ No newline at end of file
+    name = 'data_viz_app'
+
+    def ready(self):
+        from django.conf import settings
+        from .utils.metrics import configure
+
+        configure(settings.METRICS_ENABLED)
@@ -0,0 +1,222 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from .upload_handlers import StreamingCSVUploadHandler
+from .utils.concurrency import KeyedLimiter
+from .utils.data_processor import dataframe_to_json
+from .utils.metrics import stage, note
+from .utils.profile import profile_column_types
+from .views import (
+    WORKSPACE_DATASET_ID, dataset_store, open_stored_frame, process_upload,
+    get_etag, get_not_modified, set_validators, get_chart_stats,
+    get_chart_request_data, parse_chart_spec, get_chart_cache_key, render_chart_spec, submit_chart_job,
+)
+
+logger = logging.getLogger(__name__)
+
+# Async variants of the upload, column and chart views, used by urls.py when
+# ASYNC_VIEWS is on. Under ASGI, Django runs every synchronous view on one shared
+# thread, so a slow chart holds up every other request; these keep the request on
+# the event loop and send pandas, Plotly, file and database work to this pool.
+# Threads are only started as work arrives; requests waiting for one hold no thread
+compute_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_COMPUTE_WORKERS, thread_name_prefix='data-viz-compute',
+)
+
+# Keyed by (session key, dataset id), like the dataset store; uploads by session
+dataset_limiter = KeyedLimiter(settings.ASYNC_DATASET_CONCURRENCY)
+
+# Keyed by dataset id alone, so many sessions on one dataset share a limit too
+shared_dataset_limiter = KeyedLimiter(settings.ASYNC_SHARED_DATASET_CONCURRENCY)
+
+@asynccontextmanager
+async def hold_dataset(key):
+    """
+    Wait for a compute slot for a (session key, dataset id) pair
+    Takes the session's slot first, so requests queued by one session do not
+    hold slots other sessions are waiting for
+    """
+    session_key, dataset_id = key
+    # A workspace belongs to its session only
+    shared_key = key if dataset_id == WORKSPACE_DATASET_ID else dataset_id
+    async with dataset_limiter.hold(key), shared_dataset_limiter.hold(shared_key):
+        yield
+
+def run_compute(func, *args, **kwargs):
+    """Await blocking work on the compute executor; metrics stages inside it join the request's trace"""
+    return sync_to_async(func, thread_sensitive=False, executor=compute_executor)(*args, **kwargs)
+
+def call_and_close_connection(func, *args):
+    """
+    Call func, then close the executor thread's database connection
+    Django only closes connections at the end of requests on its own threads
+    """
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+async def get_session_key(request):
+    """Return the session key, creating the session if needed"""
+    if not request.session.session_key:
+        await request.session.asave()
+    return request.session.session_key
+
+async def get_current_entry(request):
+    """
+    Resolve this session's active stored frame and its store key
+    Returns (None, None) without an active dataset
+    """
+    dataset_id = await request.session.aget('dataset_id')
+    if dataset_id is None:
+        return None, None
+    key = (await get_session_key(request), dataset_id)
+    entry = dataset_store.get(*key)
+    if entry is None:
+        # Reads the column cache or parses the CSV file, and queries the database
+        with stage('load'):
+            entry = (await run_compute(call_and_close_connection, open_stored_frame, *key))[0]
+    return entry, key
+
+def encode_records(df, start, stop):
+    """A block of rows as the comma-separated JSON records of dataframe_to_json"""
+    return json.dumps(dataframe_to_json(df.iloc[start:stop]), cls=DjangoJSONEncoder)[1:-1].encode('utf-8')
+
+async def stream_records(head, df, key):
+    """
+    Stream head (a JSON object) with the rows of df added as its "data" list
+    Each block of ASYNC_STREAM_ROWS rows is serialized on the compute executor,
+    so the whole dataset is never held as one JSON document
+    """
+    yield json.dumps(head, cls=DjangoJSONEncoder)[:-1].encode('utf-8') + b', "data": ['
+    for start in range(0, len(df), settings.ASYNC_STREAM_ROWS):
+        async with hold_dataset(key):
+            block = await run_compute(encode_records, df, start, start + settings.ASYNC_STREAM_ROWS)
+        yield block if start == 0 else b', ' + block
+    yield b']}'
+
+@csrf_exempt
+async def upload_file(request):
+    """
+    Async variant of views.upload_file
+    The ASGI server has received the whole body (spooled to disk when large)
+    before the view runs; parsing, storing and profiling it run on the compute
+    executor, one session's uploads sharing ASYNC_DATASET_CONCURRENCY threads
+    """
+    if request.method == 'POST':
+        # With ?async=1 the file is only written here and parsed by a background job
+        run_async = request.GET.get('async') in ('1', 'true')
+        request.upload_handlers.insert(0, StreamingCSVUploadHandler(request, parse=not run_async))
+    async with dataset_limiter.hold(('upload', await get_session_key(request))):
+        return await run_compute(call_and_close_connection, process_upload, request)
+
+async def get_columns(request):
+    """
+    Async variant of views.get_columns
+    With include_data=1 the records are streamed in blocks instead of being
+    built into one response
+    """
+    entry, key = await get_current_entry(request)
+    if entry is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'No data available',
+        })
+    current_df = entry.df
+
+    include_data = request.GET.get('include_data') in ('1', 'true')
+    async with hold_dataset(key):
+        # The content hash and profile are computed on first use, which scans the frame
+        fingerprint = await run_compute(getattr, entry, 'fingerprint')
+        etag = get_etag('columns', fingerprint, entry.version, include_data)
+        not_modified = get_not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        profile = await run_compute(getattr, entry, 'profile')
+
+    response = {
+        'success': True,
+        'columns': list(current_df.columns),
+        'column_types': profile_column_types(profile),
+        'row_count': len(current_df),
+        'version': entry.version,
+    }
+
+    if include_data:
+        return set_validators(StreamingHttpResponse(
+            stream_records(response, current_df, key), content_type='application/json',
+        ), etag)
+
+    return set_validators(JsonResponse(response), etag)
+
+@csrf_exempt
+async def generate_graph(request):
+    """
+    Async variant of views.generate_graph
+    Options are checked and the figure cache read on the event loop; hashing,
+    profiling and rendering run on the compute executor
+    """
+    if request.method in ('GET', 'POST'):
+        try:
+            data = get_chart_request_data(request)
+
+            entry, key = await get_current_entry(request)
+            if entry is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'No data available',
+                })
+            current_df = entry.df
+
+            spec, message = parse_chart_spec(data, current_df)
+            if spec is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': message,
+                }, status=400)
+
+            figure_cache = caches['figures']
+            async with hold_dataset(key):
+                cache_key = await run_compute(get_chart_cache_key, entry, spec)
+                # The ETag is known from the key, so a chart the browser holds is not even looked up
+                etag = get_etag('chart', cache_key)
+                not_modified = get_not_modified(request, etag)
+                if not_modified is not None:
+                    return not_modified
+
+                stats = await run_compute(get_chart_stats, entry, spec['x_column'], spec['y_columns'])
+                result = await figure_cache.aget(cache_key)
+                note(graph_type=spec['graph_type'], cached=result is not None)
+                cached = result is not None
+
+                if not cached:
+                    if data.get('async') and len(current_df) >= settings.JOB_CHART_MIN_ROWS:
+                        job = await run_compute(submit_chart_job, key[0], current_df, spec, cache_key)
+                        return JsonResponse({'success': True, 'queued': True, **job.to_dict()})
+
+                    result = await run_compute(render_chart_spec, current_df, spec)
+                    await figure_cache.aset(cache_key, result)
+
+            # Large figures take a while to serialize, so that is kept off the event loop too
+            with stage('response'):
+                response = await run_compute(JsonResponse, {'success': True, 'cached': cached, **result, **stats})
+            return set_validators(response, etag)
+        except Exception as e:
+            logger.exception("Error generating graph")
+            note(failed=True)
+            return JsonResponse({
+                'success': False,
+                'message': f'Error generating graph: {str(e)}',
+            })
+
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
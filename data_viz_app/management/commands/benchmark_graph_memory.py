@@ -0,0 +1,63 @@
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from data_viz_app.utils.visualizer import generate_plotly_figure, get_plotly_json
+
+
+def make_wide_frame(rows, width, seed=0):
+    """Synthetic dataset with `width` numeric columns, a quarter of them text"""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for position in range(width):
+        if position >= 2 and position % 4 == 3:
+            data[f"col_{position}"] = rng.choice(['alpha', 'beta', 'gamma', 'delta'], size=rows)
+        else:
+            data[f"col_{position}"] = rng.normal(size=rows)
+    return pd.DataFrame(data)
+
+
+def render_graph(df, graph_type, max_points):
+    """Everything generate_graph does with the frame for one request (stats come from the profile)"""
+    fig = generate_plotly_figure(df, graph_type, 'col_0', 'col_1', max_points=max_points)
+    plot_json = get_plotly_json(fig)
+    return plot_json
+
+
+class Command(BaseCommand):
+    help = 'Measure peak memory allocated by one graph request as the dataset gets wider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--widths', default='2,10,50,200',
+                            help='Comma-separated column counts to test')
+        parser.add_argument('--graph-type', default='scatter')
+        parser.add_argument('--max-points', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        widths = [int(width) for width in options['widths'].split(',')]
+
+        # Warm up Plotly's validators so one-off imports are not counted
+        render_graph(make_wide_frame(100, 2), options['graph_type'], options['max_points'])
+
+        self.stdout.write(
+            f"{'width':>6} {'frame':>10} {'peak alloc':>11} {'peak/frame':>11} {'time':>9}"
+        )
+        for width in widths:
+            df = make_wide_frame(options['rows'], width)
+            frame_bytes = df.memory_usage(deep=True).sum()
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            render_graph(df, options['graph_type'], options['max_points'])
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f"{width:>6} {frame_bytes / 2**20:>8.1f}MB {peak / 2**20:>9.1f}MB "
+                f"{peak / frame_bytes:>10.2f}x {elapsed * 1000:>7.0f}ms"
+            )
@@ -0,0 +1,189 @@
+import glob
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data_viz_app.utils.chunked_csv import PARALLEL_MIN_RANGE_SIZE, read_csv_parallel
+from data_viz_app.utils.data_processor import (
+    read_and_preprocess_csv,
+    read_and_preprocess_csv_rows,
+    create_dataframe_from_preprocessed_data,
+)
+
+
+def scale_csv(content, scale):
+    """Repeat the data rows of a CSV file to simulate larger exports"""
+    if scale <= 1:
+        return content
+    header, _, body = content.partition(b'\n')
+    if body and not body.endswith(b'\n'):
+        body += b'\n'
+    return header + b'\n' + body * scale
+
+
+def parse_to_dataframe(parse, content):
+    """Run one parser end to end, the same way upload_file does"""
+    header, cleaned_data = parse(io.BytesIO(content))
+    return create_dataframe_from_preprocessed_data(header, cleaned_data)
+
+
+def measure(parse, content, repeat):
+    """Return the best wall time, peak traced memory and resulting DataFrame"""
+    best = None
+    df = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = parse_to_dataframe(parse, content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Memory is traced in a separate run because tracemalloc skews timings
+    tracemalloc.start()
+    parse_to_dataframe(parse, content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, df
+
+
+def time_best(fn, repeat):
+    """Return the best wall time of fn() over `repeat` runs and its last result"""
+    best = result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the columnar CSV reader against the row-at-a-time path'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--datasets-dir',
+            default=os.path.join(settings.MEDIA_ROOT, 'datasets'),
+            help='Directory of CSV files to benchmark (default: MEDIA_ROOT/datasets)',
+        )
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Repeat the data rows of each file this many times')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of timed runs per file (best is reported)')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Only benchmark the first N files')
+        parser.add_argument('--workers', default=None,
+                            help='Comma-separated worker counts (e.g. 1,2,4,8) to measure how '
+                                 'parallel parsing scales instead of comparing the two parsers')
+        parser.add_argument('--min-range-mb', type=float, default=PARALLEL_MIN_RANGE_SIZE / 2**20,
+                            help='Smallest byte range handed to a worker in the --workers run')
+
+    def handle(self, *args, **options):
+        paths = sorted(glob.glob(os.path.join(options['datasets_dir'], '*.csv')))
+        if options['limit']:
+            paths = paths[:options['limit']]
+        if not paths:
+            raise CommandError(f"No CSV files found in {options['datasets_dir']}")
+
+        if options['workers']:
+            try:
+                workers = [int(count) for count in options['workers'].split(',')]
+            except ValueError:
+                raise CommandError('--workers takes comma-separated integers')
+            self.benchmark_workers(paths, workers, options)
+            return
+
+        self.stdout.write(
+            f"{'file':<40} {'rows':>9} {'rows path':>12} {'columnar':>12} "
+            f"{'speedup':>8} {'peak rows':>10} {'peak col':>10}  parity"
+        )
+
+        total_rows = total_columnar = 0.0
+        for path in paths:
+            with open(path, 'rb') as f:
+                content = scale_csv(f.read(), options['scale'])
+
+            columnar_time, columnar_peak, columnar_df = measure(
+                read_and_preprocess_csv, content, options['repeat'])
+
+            try:
+                rows_time, rows_peak, rows_df = measure(
+                    read_and_preprocess_csv_rows, content, options['repeat'])
+            except Exception as e:
+                # The row path cannot build a frame for ragged files; report columnar only
+                self.stdout.write(
+                    f"{os.path.basename(path):<40} {len(columnar_df):>9} {'failed':>12} "
+                    f"{columnar_time * 1000:>10.1f}ms {'-':>8} {'-':>10} "
+                    f"{columnar_peak / 2**20:>8.1f}MB  n/a ({str(e)[:40]})"
+                )
+                continue
+
+            try:
+                pd.testing.assert_frame_equal(
+                    rows_df, columnar_df,
+                    check_dtype=False, check_column_type=False, check_index_type=False,
+                )
+                parity = 'ok'
+            except AssertionError:
+                parity = 'MISMATCH'
+
+            total_rows += rows_time
+            total_columnar += columnar_time
+            self.stdout.write(
+                f"{os.path.basename(path):<40} {len(columnar_df):>9} "
+                f"{rows_time * 1000:>10.1f}ms {columnar_time * 1000:>10.1f}ms "
+                f"{rows_time / columnar_time:>7.1f}x "
+                f"{rows_peak / 2**20:>8.1f}MB {columnar_peak / 2**20:>8.1f}MB  {parity}"
+            )
+
+        if total_columnar:
+            self.stdout.write(self.style.SUCCESS(
+                f"Total: rows path {total_rows:.3f}s, columnar {total_columnar:.3f}s "
+                f"({total_rows / total_columnar:.1f}x faster)"
+            ))
+
+    def benchmark_workers(self, paths, workers, options):
+        """Time parallel parsing of each file with every worker count against the serial parser"""
+        min_range_size = int(options['min_range_mb'] * 2**20)
+        self.stdout.write(
+            f"{'file':<40} {'MB':>7} {'rows':>9} {'serial':>10} "
+            + ' '.join(f"{f'{count} workers':>18}" for count in workers)
+        )
+
+        for path in paths:
+            with open(path, 'rb') as f:
+                content = scale_csv(f.read(), options['scale'])
+            # Workers read their byte ranges from disk, so the scaled file is written out
+            with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f:
+                f.write(content)
+            try:
+                serial_time, (_, serial_df) = time_best(
+                    lambda: read_and_preprocess_csv(f.name), options['repeat'])
+
+                cells = []
+                for count in workers:
+                    elapsed, (_, df) = time_best(
+                        lambda: read_csv_parallel(f.name, count, min_range_size=min_range_size),
+                        options['repeat'],
+                    )
+                    try:
+                        pd.testing.assert_frame_equal(
+                            serial_df, df,
+                            check_dtype=False, check_column_type=False, check_index_type=False,
+                        )
+                        parity = ''
+                    except AssertionError:
+                        parity = ' MISMATCH'
+                    cells.append(f"{elapsed * 1000:>8.0f}ms {serial_time / elapsed:>5.2f}x{parity}")
+            finally:
+                os.remove(f.name)
+
+            self.stdout.write(
+                f"{os.path.basename(path):<40} {len(content) / 2**20:>7.1f} {len(serial_df):>9} "
+                f"{serial_time * 1000:>8.0f}ms " + ' '.join(f"{cell:>18}" for cell in cells)
+            )
@@ -0,0 +1,476 @@
+import csv
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import django
+import numpy as np
+import pandas as pd
+import plotly
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from data_viz_app.models import Dataset
+from data_viz_app.utils.data_processor import read_and_preprocess_csv
+from data_viz_app.utils.metrics import configure, metrics
+
+GRAPH_TYPES = ('scatter', 'line', 'bar', 'area', 'heatmap', 'contour', 'pie')
+
+# Synthetic files are generated this many rows at a time, so 10M-row files
+# never have to fit in memory; each block has its own seed
+BLOCK_ROWS = 250000
+
+# Timings shorter than this are too noisy to call a regression
+MIN_COMPARED_SECONDS = 0.005
+
+# Values of the categorical columns, after the files in media/datasets
+EDUCATION = ["some high school", "high school", "some college", "associate's degree",
+             "bachelor's degree", "master's degree"]
+COUNTRIES = [('United States', 'US', 'NA'), ('Canada', 'CA', 'NA'), ('India', 'IN', 'AS'),
+             ('Nepal', 'NP', 'AS'), ('Brazil', 'BR', 'SA'), ('Italy', 'IT', 'EU'),
+             ('Philippines', 'PH', 'AS'), ('Guatemala', 'GT', 'NA')]
+TRIGGERS = ['Rain', 'Downpour', 'Tropical cyclone', 'Snowfall snowmelt', 'Earthquake', 'Unknown']
+
+
+def make_narrow_numeric(rng, rows, start):
+    """Crop measurements: nine numeric columns"""
+    rainfall = rng.gamma(4, 60, rows)
+    return pd.DataFrame({
+        'ph': rng.normal(6.5, 0.5, rows),
+        'N': rng.normal(120, 30, rows),
+        'P': rng.normal(60, 15, rows),
+        'K': rng.normal(200, 40, rows),
+        'temperature': rng.normal(22, 4, rows),
+        'rainfall': rainfall,
+        'humidity': rng.uniform(40, 95, rows).round(1),
+        'planting_day': rng.integers(1, 366, rows),
+        'yield': 3000 + 8 * rainfall + rng.normal(0, 400, rows),
+    })
+
+
+def make_narrow_categorical(rng, rows, start):
+    """Student scores: five quoted categorical columns and three integer scores"""
+    math_score = rng.normal(66, 15, rows).clip(0, 100)
+    return pd.DataFrame({
+        'gender': rng.choice(['female', 'male'], rows),
+        'race/ethnicity': rng.choice([f'group {group}' for group in 'ABCDE'], rows),
+        'parental level of education': rng.choice(EDUCATION, rows),
+        'lunch': rng.choice(['standard', 'free/reduced'], rows),
+        'test preparation course': rng.choice(['none', 'completed'], rows),
+        'math score': math_score.round().astype(int),
+        'reading score': (math_score + rng.normal(3, 8, rows)).clip(0, 100).round().astype(int),
+        'writing score': (math_score + rng.normal(1, 9, rows)).clip(0, 100).round().astype(int),
+    })
+
+
+def make_wide_numeric(rng, rows, start):
+    """Cell measurements: an id, a two-valued label and thirty numeric features"""
+    data = {
+        'id': np.arange(start, start + rows) + 842302,
+        'diagnosis': rng.choice(['M', 'B'], rows, p=[0.37, 0.63]),
+    }
+    radius = rng.normal(14, 3.5, rows)
+    for suffix, scale in (('mean', 1.0), ('se', 0.1), ('worst', 1.2)):
+        for feature, base in (('radius', 1), ('texture', 1.4), ('perimeter', 6.5), ('area', 50),
+                              ('smoothness', 0.007), ('compactness', 0.0075), ('concavity', 0.006),
+                              ('concave points', 0.0035), ('symmetry', 0.013), ('fractal_dimension', 0.0045)):
+            data[f'{feature}_{suffix}'] = (radius * base * scale * rng.lognormal(0, 0.1, rows)).round(5)
+    return pd.DataFrame(data)
+
+
+def make_wide_categorical(rng, rows, start):
+    """Landslide reports: 23 mostly text columns with blanks and quoted commas"""
+    country = rng.integers(len(COUNTRIES), size=rows)
+    names, codes, continents = (np.array(values, dtype=object) for values in zip(*COUNTRIES))
+    latitude = rng.uniform(-40, 60, rows).round(4)
+    longitude = rng.uniform(-120, 140, rows).round(4)
+    blank = np.array([''], dtype=object)
+    sparse_counts = rng.poisson(0.3, rows)
+    return pd.DataFrame({
+        'id': np.arange(start, start + rows),
+        'date': [f'{m}/{d}/{y:02d}' for m, d, y in zip(
+            rng.integers(1, 13, rows), rng.integers(1, 29, rows), rng.integers(7, 17, rows))],
+        'time': rng.choice(['Night', 'Morning', 'Afternoon', 'Overnight', ''], rows),
+        'continent_code': continents[country],
+        'country_name': names[country],
+        'country_code': codes[country],
+        'state/province': rng.choice(['Virginia', 'Kerala', 'Bagmati', 'Liguria', 'Ontario'], rows),
+        'population': rng.integers(0, 100000, rows),
+        'city/town': rng.choice(['Cherry Hill', 'Munnar', 'Dhunche', 'Genoa', 'Cebu City'], rows),
+        'distance': rng.exponential(5, rows).round(5),
+        'location_description': rng.choice(['Unknown', 'Urban area', 'Mine', 'Below road', ''], rows),
+        'latitude': latitude,
+        'longitude': longitude,
+        'geolocation': [f'({lat}, {lon})' for lat, lon in zip(latitude, longitude)],
+        'hazard_type': 'Landslide',
+        'landslide_type': rng.choice(['Landslide', 'Mudslide', 'Rockfall', 'Complex'], rows),
+        'landslide_size': rng.choice(['Small', 'Medium', 'Large'], rows),
+        'trigger': rng.choice(TRIGGERS, rows),
+        'storm_name': np.where(rng.random(rows) < 0.05, 'Tropical Storm Noel', blank),
+        'injuries': np.where(sparse_counts > 0, sparse_counts.astype(str), blank),
+        'fatalities': np.where(rng.random(rows) < 0.3, rng.poisson(2, rows).astype(str), blank),
+        'source_name': rng.choice(['NBC 4 news', 'Reuters', 'The Hindu', 'Xinhua'], rows),
+        'source_link': [f'http://news.example.com/{n}/detail.html' for n in range(start, start + rows)],
+    })
+
+
+# Dataset shapes: generator, CSV quoting, and the x, y and category columns charted
+SHAPES = {
+    'narrow-numeric': (make_narrow_numeric, csv.QUOTE_MINIMAL, 'rainfall', 'yield', 'planting_day'),
+    'narrow-categorical': (make_narrow_categorical, csv.QUOTE_ALL,
+                           'math score', 'reading score', 'parental level of education'),
+    'wide-numeric': (make_wide_numeric, csv.QUOTE_MINIMAL, 'radius_mean', 'area_mean', 'diagnosis'),
+    'wide-categorical': (make_wide_categorical, csv.QUOTE_MINIMAL, 'longitude', 'latitude', 'country_name'),
+}
+
+
+def write_dataset(shape, rows, data_dir, seed):
+    """Write (or reuse) the synthetic CSV file of a shape and row count"""
+    path = os.path.join(data_dir, f'{shape}-{rows}-{seed}.csv')
+    if os.path.exists(path):
+        return path
+    make_frame, quoting = SHAPES[shape][:2]
+    partial = path + '.partial'
+    with open(partial, 'w', newline='', encoding='utf-8') as f:
+        for start in range(0, rows, BLOCK_ROWS):
+            rng = np.random.default_rng([seed, start // BLOCK_ROWS])
+            block = make_frame(rng, min(BLOCK_ROWS, rows - start), start)
+            block.to_csv(f, index=False, header=start == 0, quoting=quoting)
+    os.replace(partial, path)
+    return path
+
+
+def get_chart_request(shape, graph_type):
+    """generate_graph request body for a chart of the shape's columns"""
+    x_column, y_column, category = SHAPES[shape][2:]
+    if graph_type in ('bar', 'pie'):
+        # Grouped charts are drawn per category
+        return {'graph_type': graph_type, 'x_column': category, 'y_column': y_column, 'agg': 'mean'}
+    return {'graph_type': graph_type, 'x_column': x_column, 'y_column': y_column}
+
+
+def time_best(fn, repeat, setup=None):
+    """Best wall time of fn() over `repeat` runs (setup() runs untimed before each) and its last result"""
+    best = result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_memory(fn, setup=None):
+    """Peak memory traced during one more run of fn(); traced apart because tracemalloc skews timings"""
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_stage_times(url_name):
+    """Median time of each stage recorded by the metrics layer for an endpoint, in ms"""
+    prefix = f'http.{url_name}.'
+    return {
+        name[len(prefix):-len('_ms')]: round(histogram['p50'], 3)
+        for name, histogram in metrics.snapshot()['histograms'].items()
+        if name.startswith(prefix) and name.endswith('_ms') and name != f'{prefix}total_ms'
+    }
+
+
+def get_environment():
+    """What the numbers were measured on, stored with every result file"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plotly': plotly.__version__,
+    }
+
+
+def compare_results(baseline, results, tolerance):
+    """
+    Compare every case present in both runs
+    Returns (case, metric, baseline value, new value, ratio, verdict) rows, where
+    verdict is 'regression', 'improvement' or 'changed' (payload sizes, which
+    are deterministic) for differences beyond the tolerance, and '' otherwise
+    """
+    rows = []
+    for key, case in results['cases'].items():
+        previous = baseline.get('cases', {}).get(key)
+        if previous is None:
+            continue
+        for metric in ('seconds', 'peak_mb', 'payload_bytes'):
+            old, new = previous.get(metric), case.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            verdict = ''
+            if metric == 'payload_bytes':
+                verdict = 'changed' if new != old else ''
+            elif metric == 'seconds' and max(old, new) < MIN_COMPARED_SECONDS:
+                pass
+            elif ratio > 1 + tolerance:
+                verdict = 'regression'
+            elif ratio < 1 - tolerance:
+                verdict = 'improvement'
+            rows.append((key, metric, old, new, ratio, verdict))
+    return rows
+
+
+def format_number(value):
+    return f'{value:,}' if isinstance(value, int) else f'{value:.4g}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark CSV ingestion, every chart type, plot serialization and full-data JSON on '
+        'synthetic datasets through the test client, and compare with a saved baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='10000,100000',
+                            help='Comma-separated row counts (e.g. 10000,100000,1000000,10000000)')
+        parser.add_argument('--shapes', default=','.join(SHAPES),
+                            help=f"Comma-separated dataset shapes ({', '.join(SHAPES)})")
+        parser.add_argument('--graph-types', default=','.join(GRAPH_TYPES),
+                            help='Comma-separated chart types to render')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Number of timed runs per case (best is reported)')
+        parser.add_argument('--max-json-rows', type=int, default=100000,
+                            help='Largest dataset whose rows are all fetched as JSON (get_columns?include_data=1)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--data-dir', default=None,
+                            help='Keep generated CSV files here and reuse them on later runs '
+                                 '(default: a temporary directory removed afterwards)')
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmark_baseline.json'),
+                            help='Results file to compare against, when it exists')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write this run to --baseline instead of comparing with it')
+        parser.add_argument('--output', default=None, help='Also write this run to a JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.15,
+                            help='Relative change in time or memory reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when any case regressed')
+
+    def handle(self, *args, **options):
+        try:
+            row_counts = [int(count) for count in options['rows'].split(',')]
+        except ValueError:
+            raise CommandError('--rows takes comma-separated integers')
+        shapes = options['shapes'].split(',')
+        graph_types = options['graph_types'].split(',')
+        for name, known in ((shapes, SHAPES), (graph_types, GRAPH_TYPES)):
+            unknown = sorted(set(name) - set(known))
+            if unknown:
+                raise CommandError(f"Unknown: {', '.join(unknown)} (choose from {', '.join(known)})")
+
+        results = {
+            'environment': get_environment(),
+            'options': {'repeat': options['repeat'], 'seed': options['seed']},
+            'cases': {},
+        }
+        data_dir = options['data_dir'] or tempfile.mkdtemp(prefix='benchmark-data-')
+        os.makedirs(data_dir, exist_ok=True)
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+
+        # Requests run against a throwaway database and MEDIA_ROOT, never the real uploads.
+        # Stage timings come from the metrics layer, with its per-request log lines muted
+        setup_test_environment()
+        old_database = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        metrics_enabled = metrics.enabled
+        metrics_logger = logging.getLogger('data_viz_app.utils.metrics')
+        metrics_level = metrics_logger.level
+        configure(True)
+        metrics_logger.setLevel(logging.WARNING)
+        try:
+            self.stdout.write(
+                f"{'case':<46} {'time':>10} {'rows/s':>13} {'peak':>10} {'payload':>11}"
+            )
+            with override_settings(MEDIA_ROOT=media_root):
+                for shape in shapes:
+                    for rows in row_counts:
+                        path = write_dataset(shape, rows, data_dir, options['seed'])
+                        self.benchmark_dataset(shape, rows, path, graph_types, options, results['cases'])
+        finally:
+            configure(metrics_enabled)
+            metrics_logger.setLevel(metrics_level)
+            connection.creation.destroy_test_db(old_database, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+            if not options['data_dir']:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+        if options['output']:
+            self.write_results(options['output'], results)
+        if options['save_baseline']:
+            self.write_results(options['baseline'], results)
+        elif os.path.exists(options['baseline']):
+            self.compare(options['baseline'], results, options)
+
+    def benchmark_dataset(self, shape, rows, path, graph_types, options, cases):
+        """Run every case on one generated file"""
+        repeat = options['repeat']
+        size = os.path.getsize(path)
+        prefix = f'{shape}/{rows}'
+
+        # The parser on its own, as when a dataset without a column cache is reopened
+        parse = lambda: read_and_preprocess_csv(path)
+        seconds, _ = time_best(parse, repeat)
+        self.record(cases, f'{prefix}/parse', rows, seconds, peak_memory(parse), input_bytes=size)
+
+        # The upload endpoint: streamed parse, profile and column cache write.
+        # Datasets are deleted before each run so identical content is parsed again
+        # (peak memory includes the multipart body the test client encodes)
+        client = Client()
+        with open(path, 'rb') as f:
+            content = f.read()
+        upload_url = reverse('data_viz_app:upload_file')
+
+        def upload():
+            response = client.post(upload_url, {
+                'name': shape, 'file': SimpleUploadedFile(os.path.basename(path), content, 'text/csv'),
+            })
+            return self.check_response(response, f'{prefix}/upload')
+
+        self.run_case(cases, f'{prefix}/upload', rows, upload, 'upload_file', repeat,
+                      setup=lambda: Dataset.objects.all().delete(), input_bytes=size)
+        del content
+
+        # Every chart type, rendered from scratch each time
+        figure_cache = caches['figures']
+        graph_url = reverse('data_viz_app:generate_graph')
+        for graph_type in graph_types:
+            body = json.dumps(get_chart_request(shape, graph_type))
+            key = f'{prefix}/chart:{graph_type}'
+
+            def render():
+                return self.check_response(
+                    client.post(graph_url, body, content_type='application/json'), key)
+
+            self.run_case(cases, key, rows, render, 'generate_graph', repeat, setup=figure_cache.clear)
+
+        # The whole dataset as JSON records (dataframe_to_json)
+        if rows <= options['max_json_rows']:
+            columns_url = reverse('data_viz_app:get_columns') + '?include_data=1'
+            self.run_case(
+                cases, f'{prefix}/rows_json', rows,
+                lambda: self.check_response(client.get(columns_url), f'{prefix}/rows_json'),
+                'get_columns', repeat,
+            )
+
+    def run_case(self, cases, key, rows, fn, url_name, repeat, setup=None, **extra):
+        """Time a request, collect its stage timings, then trace its memory"""
+        metrics.reset()
+        try:
+            seconds, response = time_best(fn, repeat, setup)
+        except CommandError as e:
+            cases[key] = {'rows': rows, 'error': str(e)}
+            self.stdout.write(self.style.ERROR(f"{key:<46} {str(e)}"))
+            return
+        stages = get_stage_times(url_name)
+        extra['payload_bytes'] = len(response.content)
+        points = response.json().get('points')
+        if points:
+            extra['points'] = points.get('rendered')
+        self.record(cases, key, rows, seconds, peak_memory(fn, setup), stages=stages, **extra)
+
+    def record(self, cases, key, rows, seconds, peak, stages=None, **extra):
+        case = {
+            'rows': rows,
+            'seconds': round(seconds, 6),
+            'rows_per_second': round(rows / seconds) if seconds else None,
+            'peak_mb': round(peak / 2**20, 3),
+            **extra,
+        }
+        if 'input_bytes' in extra and seconds:
+            case['mb_per_second'] = round(extra['input_bytes'] / 2**20 / seconds, 3)
+        if stages:
+            case['stages_ms'] = stages
+        cases[key] = case
+
+        payload = f"{case['payload_bytes'] / 2**10:>9.1f}KB" if 'payload_bytes' in case else f"{'-':>11}"
+        self.stdout.write(
+            f"{key:<46} {seconds * 1000:>8.1f}ms {case['rows_per_second'] or 0:>13,} "
+            f"{case['peak_mb']:>8.1f}MB {payload}"
+        )
+
+    def check_response(self, response, key):
+        """Return a successful JSON response, or raise with the endpoint's message"""
+        if response.status_code != 200 or not response.json().get('success'):
+            raise CommandError(f"{key} failed ({response.status_code}): {response.content[:200]!r}")
+        return response
+
+    def write_results(self, path, results):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(f"Results written to {path}")
+
+    def compare(self, path, results, options):
+        """Print the change of every case against the baseline"""
+        with open(path) as f:
+            baseline = json.load(f)
+
+        environment = baseline.get('environment', {})
+        for key in ('machine', 'cpus', 'python', 'pandas', 'numpy', 'plotly'):
+            if environment.get(key) != results['environment'][key]:
+                self.stdout.write(self.style.WARNING(
+                    f"Baseline was measured with {key}={environment.get(key)} "
+                    f"(now {results['environment'][key]}); timings may not be comparable"
+                ))
+
+        rows = compare_results(baseline, results, options['tolerance'])
+        self.stdout.write(
+            f"\nCompared with {path} ({environment.get('created')}, commit {environment.get('commit')})"
+        )
+        self.stdout.write(f"{'case':<46} {'metric':<14} {'baseline':>12} {'now':>12} {'change':>8}")
+        regressions = 0
+        for key, metric, old, new, ratio, verdict in rows:
+            line = (f"{key:<46} {metric:<14} {format_number(old):>12} {format_number(new):>12} "
+                    f"{(ratio - 1) * 100:>+7.1f}%")
+            if verdict == 'regression':
+                regressions += 1
+                self.stdout.write(self.style.ERROR(f"{line}  regression"))
+            elif verdict:
+                self.stdout.write(self.style.WARNING(f"{line}  {verdict}") if verdict == 'changed'
+                                  else self.style.SUCCESS(f"{line}  {verdict}"))
+            else:
+                self.stdout.write(line)
+
+        missing = sorted(set(baseline.get('cases', {})) - set(results['cases']))
+        if missing:
+            self.stdout.write(f"{len(missing)} baseline cases were not run")
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{regressions} regressions beyond {options['tolerance']:.0%}")
+        self.stdout.write(self.style.SUCCESS(f"{len(rows)} comparisons, {regressions} regressions"))
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import shutil
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from data_viz_app.models import Dataset, get_content_path, get_column_cache_path
+
+
+def hash_file(path, block_size=1024 * 1024):
+    """SHA-256 of a file, read one block at a time"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def move_column_cache(dataset, content_hash):
+    """Re-key a dataset's column cache from its primary key to its content hash"""
+    source = get_column_cache_path(dataset.pk)
+    if not os.path.isdir(source):
+        return
+    target = get_column_cache_path(content_hash)
+    if os.path.exists(target):
+        shutil.rmtree(source, ignore_errors=True)
+    else:
+        os.replace(source, target)
+
+
+class Command(BaseCommand):
+    help = 'Hash uploaded dataset files and make datasets with identical content share one file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would change without touching files or rows')
+        parser.add_argument('--remove-orphans', action='store_true',
+                            help='Also delete files in MEDIA_ROOT/datasets no dataset refers to')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        groups = defaultdict(list)
+        for dataset in Dataset.objects.order_by('pk'):
+            content_hash = dataset.content_hash
+            if not content_hash:
+                try:
+                    content_hash = hash_file(os.path.join(settings.MEDIA_ROOT, dataset.file.name))
+                except OSError as e:
+                    self.stderr.write(f"Skipping dataset {dataset.pk}: {str(e)}")
+                    continue
+                if not dry_run:
+                    move_column_cache(dataset, content_hash)
+                    dataset.content_hash = content_hash
+                    dataset.save(update_fields=['content_hash'])
+            groups[content_hash].append(dataset)
+
+        # Point every dataset of a group at one content-addressed file
+        replaced = set()
+        stored = set()
+        for content_hash, datasets in groups.items():
+            storage_name = get_content_path(content_hash)
+            target = os.path.join(settings.MEDIA_ROOT, storage_name)
+            for dataset in datasets:
+                if dataset.file.name == storage_name:
+                    continue
+                if not os.path.exists(target) and content_hash not in stored:
+                    # The first copy is moved into place rather than removed
+                    stored.add(content_hash)
+                    if not dry_run:
+                        os.replace(os.path.join(settings.MEDIA_ROOT, dataset.file.name), target)
+                else:
+                    replaced.add(dataset.file.name)
+                if dry_run:
+                    continue
+                dataset.file = storage_name
+                dataset.save(update_fields=['file'])
+
+        # Files still in use once every group points at its content-addressed file
+        referenced = {get_content_path(content_hash) for content_hash in groups}
+        referenced.update(
+            name for name in Dataset.objects.values_list('file', flat=True) if name not in replaced
+        )
+
+        candidates = set(replaced)
+        if options['remove_orphans']:
+            datasets_dir = os.path.join(settings.MEDIA_ROOT, 'datasets')
+            if os.path.isdir(datasets_dir):
+                candidates.update(os.path.join('datasets', name) for name in os.listdir(datasets_dir))
+
+        removed = freed = 0
+        for name in sorted(candidates - referenced):
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            if not os.path.isfile(path):
+                continue
+            removed += 1
+            freed += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+
+        action = 'Would remove' if dry_run else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(groups)} distinct contents across {sum(map(len, groups.values()))} datasets; "
+            f"{action.lower()} {removed} files ({freed / 2**20:.1f}MB)"
+        ))
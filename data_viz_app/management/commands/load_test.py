@@ -0,0 +1,454 @@
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark_suite import SHAPES, get_chart_request, write_dataset
+
+# Endpoints in the order a session calls them, for the report
+ENDPOINTS = ('index', 'upload', 'get_columns', 'generate_graph', 'apply_changes', 'process_data')
+
+# Rows of the dataset posted back by each process_data edit (the spreadsheet's window)
+EDIT_WINDOW_ROWS = 200
+
+# Seconds to wait for a started server to accept requests
+SERVER_START_TIMEOUT = 60
+
+PERCENTILES = (50, 95, 99)
+
+
+class ServerConfig:
+    """
+    How the server under test is started
+    "runserver" and "runserver-nothreading" use Django's development server
+    (one process, a thread per request or one request at a time);
+    "gunicorn:WxT" runs W worker processes with T threads each;
+    "uvicorn:W" serves the ASGI application and its async views from W worker
+    processes.
+    """
+    def __init__(self, spec):
+        self.spec = spec
+        if spec in ('runserver', 'runserver-nothreading'):
+            self.kind = 'runserver'
+            self.workers, self.threads = 1, (None if spec == 'runserver' else 1)
+            return
+        kind, _, shape = spec.partition(':')
+        try:
+            if kind == 'uvicorn':
+                # Threads are the async views' compute executor, set by ASYNC_COMPUTE_WORKERS
+                workers, threads = int(shape), None
+            else:
+                workers, threads = (int(value) for value in shape.split('x'))
+        except ValueError:
+            raise CommandError(f"Unknown server config '{spec}' (use runserver, "
+                               "runserver-nothreading, gunicorn:WORKERSxTHREADS or uvicorn:WORKERS)")
+        if kind not in ('gunicorn', 'uvicorn'):
+            raise CommandError(f"Unknown server '{kind}' in '{spec}'")
+        if importlib.util.find_spec(kind) is None:
+            raise CommandError(f"'{spec}' needs {kind}, which is not installed")
+        self.kind = kind
+        self.workers, self.threads = workers, threads
+
+    def command(self, port):
+        address = f'127.0.0.1:{port}'
+        if self.kind == 'runserver':
+            command = [sys.executable, 'manage.py', 'runserver', address, '--noreload']
+            if self.threads == 1:
+                command.append('--nothreading')
+            return command
+        if self.kind == 'uvicorn':
+            return [
+                sys.executable, '-m', 'uvicorn', 'data_viz_proj.asgi:application',
+                '--host', '127.0.0.1', '--port', str(port), '--workers', str(self.workers),
+            ]
+        return [
+            sys.executable, '-m', 'gunicorn', 'data_viz_proj.wsgi:application',
+            '--bind', address, '--workers', str(self.workers), '--threads', str(self.threads),
+            '--timeout', '300',
+        ]
+
+
+class LocalServer:
+    """A server started on a free port against a scratch database and MEDIA_ROOT"""
+    def __init__(self, config, metrics=False):
+        self.config = config
+        self.directory = tempfile.mkdtemp(prefix='load-test-')
+        self.env = {
+            **os.environ,
+            'DATA_VIZ_DB_PATH': os.path.join(self.directory, 'db.sqlite3'),
+            'DATA_VIZ_MEDIA_ROOT': os.path.join(self.directory, 'media'),
+            'DATA_VIZ_METRICS': '1' if metrics else '0',
+            'DATA_VIZ_ASYNC_VIEWS': '1' if config.kind == 'uvicorn' else '0',
+        }
+        self.log_path = os.path.join(self.directory, 'server.log')
+        self.process = None
+        self.url = None
+
+    def start(self):
+        subprocess.run(
+            [sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+            cwd=settings.BASE_DIR, env=self.env, check=True,
+        )
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+        with open(self.log_path, 'wb') as log:
+            self.process = subprocess.Popen(
+                self.config.command(port), cwd=settings.BASE_DIR, env=self.env,
+                stdout=log, stderr=subprocess.STDOUT,
+            )
+
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"Server '{self.config.spec}' exited:\n{self.read_log()}")
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise CommandError(f"Server '{self.config.spec}' did not start within {SERVER_START_TIMEOUT}s")
+
+    def read_log(self, limit=4000):
+        with open(self.log_path, 'rb') as f:
+            return f.read()[-limit:].decode('utf-8', 'replace')
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def encode_multipart(fields, files):
+    """Multipart form body and content type for fields and (name, content) files"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: text/csv\r\n\r\n'.encode()
+        )
+        parts.append(content)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class UserSession:
+    """One simulated dashboard user, with its own cookies and so its own Django session"""
+    def __init__(self, base_url, timeout, samples):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.samples = samples
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def request(self, endpoint, path, body=None, content_type=None, expect_json=True):
+        """
+        Send one request and record (endpoint, latency, ok, status)
+        Returns the JSON body (the page text when expect_json is false), or None if it failed
+        """
+        request = Request(self.base_url + path, data=body)
+        if content_type is not None:
+            request.add_header('Content-Type', content_type)
+        csrf_token = next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), None)
+        if csrf_token is not None:
+            request.add_header('X-CSRFToken', csrf_token)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, content = response.status, response.read()
+        except HTTPError as e:
+            status, content = e.code, e.read()
+        except (URLError, OSError):
+            status, content = 0, b''
+        elapsed = time.perf_counter() - start
+
+        if not expect_json:
+            self.samples.append((endpoint, elapsed, status == 200, status))
+            return content.decode('utf-8', 'replace') if status == 200 else None
+        try:
+            data = json.loads(content)
+        except ValueError:
+            data = None
+        ok = status == 200 and isinstance(data, dict) and bool(data.get('success'))
+        self.samples.append((endpoint, elapsed, ok, status))
+        return data if ok else None
+
+    def post_json(self, endpoint, path, payload):
+        return self.request(endpoint, path, json.dumps(payload).encode(), 'application/json')
+
+
+def run_session(base_url, number, content, shape, options, samples):
+    """
+    Replay one dashboard session: the page, an upload, get_columns, a chart of
+    every type, a few edits, and the first chart again on the edited data
+    """
+    rng = np.random.default_rng(number)
+    user = UserSession(base_url, options['timeout'], samples)
+
+    def think():
+        if options['think_time']:
+            time.sleep(options['think_time'])
+
+    # Each session uploads different content (its first data row repeated
+    # number + 1 extra times), so deduplication does not skip the parse
+    header, _, body = content.partition(b'\n')
+    first_row = body.partition(b'\n')[0] + b'\n'
+    if not body.endswith(b'\n'):
+        body += b'\n'
+    upload, content_type = encode_multipart(
+        {'name': f'load-test-{number}'},
+        {'file': (f'load-test-{number}.csv', header + b'\n' + body + first_row * (number + 1))},
+    )
+    # The page sets the CSRF cookie the upload form needs
+    if user.request('index', '/', expect_json=False) is None:
+        return
+    if user.request('upload', '/upload/', upload, content_type) is None:
+        return
+    think()
+
+    columns = user.request('get_columns', '/get_columns/')
+    if columns is None:
+        return
+    version = columns.get('version')
+    row_count = columns['row_count']
+    think()
+
+    charts = [get_chart_request(shape, graph_type) for graph_type in options['graph_types']]
+    for chart in charts:
+        user.post_json('generate_graph', '/generate_graph/', chart)
+        think()
+
+    y_column = SHAPES[shape][3]
+    for _ in range(options['edits']):
+        if options['edit_endpoint'] == 'apply_changes':
+            changes = [
+                {'row': int(row), 'column': y_column, 'value': float(rng.integers(0, 100))}
+                for row in rng.integers(0, row_count, options['edit_size'])
+            ]
+            result = user.post_json('apply_changes', '/apply_changes/', {'version': version, 'changes': changes})
+            if result is not None:
+                version = result['version']
+        else:
+            # The spreadsheet window posted back whole, as the older editing flow did
+            window = user.request('get_rows', f'/get_rows/?offset=0&limit={EDIT_WINDOW_ROWS}')
+            if window is None:
+                continue
+            records = [dict(zip(window['columns'], values)) for values in zip(*window['data'])]
+            for row in rng.integers(0, len(records), min(options['edit_size'], len(records))):
+                records[row][y_column] = float(rng.integers(0, 100))
+            user.post_json('process_data', '/process_data/', {'data': records})
+        think()
+
+    # Re-plot after editing; the edited content misses the figure cache
+    if charts:
+        user.post_json('generate_graph', '/generate_graph/', charts[0])
+
+
+def run_load(base_url, content, shape, options):
+    """Run users * sessions_per_user sessions with `users` at a time; returns (samples, wall seconds)"""
+    samples = []
+    counter = iter(range(options['users'] * options['sessions_per_user']))
+    lock = threading.Lock()
+
+    def user_loop():
+        while True:
+            with lock:
+                number = next(counter, None)
+            if number is None:
+                return
+            run_session(base_url, number, content, shape, options, samples)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options['users']) as executor:
+        for future in [executor.submit(user_loop) for _ in range(options['users'])]:
+            future.result()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples, wall):
+    """Requests, error rate, throughput and latency percentiles (ms) per endpoint and overall"""
+    groups = {}
+    for endpoint, elapsed, ok, status in samples:
+        groups.setdefault(endpoint, []).append((elapsed, ok, status))
+    groups['all'] = [(elapsed, ok, status) for _, elapsed, ok, status in samples]
+
+    summary = {}
+    for endpoint, rows in groups.items():
+        latencies = np.array([elapsed for elapsed, _, _ in rows]) * 1000
+        errors = sum(not ok for _, ok, _ in rows)
+        statuses = {}
+        for _, ok, status in rows:
+            if not ok:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary[endpoint] = {
+            'requests': len(rows),
+            'errors': errors,
+            'error_rate': errors / len(rows),
+            'error_statuses': statuses,
+            'throughput': len(rows) / wall,
+            'mean_ms': float(latencies.mean()),
+            **{f'p{q}_ms': float(np.percentile(latencies, q)) for q in PERCENTILES},
+            'max_ms': float(latencies.max()),
+        }
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate concurrent dashboard users (upload, get_columns, generate_graph, edits) against '
+        'locally started servers and report throughput, latency percentiles and error rates per endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=4, help='Sessions running at the same time')
+        parser.add_argument('--sessions-per-user', type=int, default=3)
+        parser.add_argument('--configs', default='runserver',
+                            help='Comma-separated server configs to compare: runserver, '
+                                 'runserver-nothreading, gunicorn:WORKERSxTHREADS (e.g. gunicorn:2x4), uvicorn:WORKERS')
+        parser.add_argument('--url', default=None,
+                            help='Load an already running server instead of starting one '
+                                 '(it must be safe to upload to)')
+        parser.add_argument('--shape', default='narrow-categorical', choices=sorted(SHAPES),
+                            help='Synthetic dataset shape uploaded by every session (see benchmark_suite)')
+        parser.add_argument('--rows', type=int, default=10000, help='Rows of the uploaded dataset')
+        parser.add_argument('--graph-types', default='scatter,line,bar,heatmap,pie',
+                            help='Charts requested by each session, in order')
+        parser.add_argument('--edits', type=int, default=3, help='Edit requests per session')
+        parser.add_argument('--edit-size', type=int, default=5, help='Cells changed per edit')
+        parser.add_argument('--edit-endpoint', choices=('apply_changes', 'process_data'),
+                            default='apply_changes',
+                            help='apply_changes sends cell edits (what the spreadsheet uses); '
+                                 'process_data posts an edited window of rows back whole')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Seconds each user waits between requests')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Seconds before a request fails')
+        parser.add_argument('--server-metrics', action='store_true',
+                            help='Run started servers with METRICS_ENABLED and report their stage timings')
+        parser.add_argument('--output', default=None, help='Write the results to a JSON file')
+
+    def handle(self, *args, **options):
+        options['graph_types'] = [graph_type for graph_type in options['graph_types'].split(',') if graph_type]
+        if options['users'] < 1 or options['sessions_per_user'] < 1:
+            raise CommandError('--users and --sessions-per-user must be at least 1')
+        configs = [] if options['url'] else [ServerConfig(spec) for spec in options['configs'].split(',')]
+
+        data_dir = tempfile.mkdtemp(prefix='load-test-data-')
+        try:
+            with open(write_dataset(options['shape'], options['rows'], data_dir, seed=0), 'rb') as f:
+                content = f.read()
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        self.stdout.write(
+            f"{options['users']} users x {options['sessions_per_user']} sessions, "
+            f"{options['shape']} dataset of {options['rows']} rows ({len(content) / 2**20:.1f}MB)"
+        )
+
+        results = {}
+        if options['url']:
+            results[options['url']] = self.run_config(options['url'].rstrip('/'), content, options)
+        else:
+            for config in configs:
+                server = LocalServer(config, metrics=options['server_metrics'])
+                try:
+                    server.start()
+                    self.stdout.write(f"\nServer: {config.spec}")
+                    results[config.spec] = self.run_config(server.url, content, options)
+                finally:
+                    server.stop()
+
+        if len(results) > 1:
+            self.write_comparison(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'options': {
+                    key: options[key] for key in ('users', 'sessions_per_user', 'shape', 'rows', 'graph_types',
+                                                  'edits', 'edit_size', 'edit_endpoint', 'think_time')
+                }, 'results': results}, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def run_config(self, base_url, content, options):
+        samples, wall = run_load(base_url, content, options['shape'], options)
+        summary = summarize(samples, wall)
+        self.stdout.write(
+            f"{'endpoint':<16} {'requests':>9} {'errors':>8} {'req/s':>8} {'mean':>9} "
+            + ' '.join(f"{f'p{q}':>9}" for q in PERCENTILES) + f" {'max':>9}"
+        )
+        for endpoint in [*ENDPOINTS, 'get_rows', 'all']:
+            if endpoint not in summary:
+                continue
+            row = summary[endpoint]
+            line = (
+                f"{endpoint:<16} {row['requests']:>9} {row['error_rate']:>7.1%} {row['throughput']:>8.2f} "
+                f"{row['mean_ms']:>7.0f}ms " + ' '.join(f"{row[f'p{q}_ms']:>7.0f}ms" for q in PERCENTILES)
+                + f" {row['max_ms']:>7.0f}ms"
+            )
+            self.stdout.write(self.style.ERROR(line) if row['errors'] else line)
+            if row['error_statuses']:
+                self.stdout.write(f"{'':<16} failed by status: {row['error_statuses']}")
+        self.stdout.write(f"Wall time {wall:.1f}s")
+
+        result = {'wall_seconds': wall, 'endpoints': summary}
+        if options['server_metrics']:
+            result['server_metrics'] = self.fetch_server_metrics(base_url)
+        return result
+
+    def fetch_server_metrics(self, base_url):
+        """Median and p95 of every stage the server recorded (one worker's view under gunicorn)"""
+        try:
+            with build_opener().open(base_url + '/metrics/', timeout=10) as response:
+                histograms = json.loads(response.read())['histograms']
+        except (URLError, OSError, ValueError, KeyError):
+            self.stdout.write(self.style.WARNING('Could not read server metrics'))
+            return None
+        self.stdout.write(f"{'server stage':<46} {'count':>7} {'p50':>10} {'p95':>10}")
+        for name, histogram in histograms.items():
+            if name.endswith('_ms'):
+                self.stdout.write(
+                    f"{name:<46} {histogram['count']:>7} {histogram['p50']:>8.1f}ms {histogram['p95']:>8.1f}ms"
+                )
+        return histograms
+
+    def write_comparison(self, results):
+        self.stdout.write(
+            f"\n{'config':<24} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>8}  slowest endpoint (p95)"
+        )
+        for spec, result in results.items():
+            overall = result['endpoints']['all']
+            slowest = max(
+                (name for name in result['endpoints'] if name != 'all'),
+                key=lambda name: result['endpoints'][name]['p95_ms'],
+            )
+            self.stdout.write(
+                f"{spec:<24} {overall['throughput']:>8.2f} {overall['p50_ms']:>7.0f}ms "
+                f"{overall['p95_ms']:>7.0f}ms {overall['p99_ms']:>7.0f}ms {overall['error_rate']:>7.1%}  "
+                f"{slowest} ({result['endpoints'][slowest]['p95_ms']:.0f}ms)"
+            )
@@ -0,0 +1,66 @@
+import json
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data_viz_app.utils.chunked_csv import ChunkedCSVReader
+from data_viz_app.utils.profile import profile_dataframe
+from data_viz_app.utils.tasks import profile_csv_file, read_csv_file
+
+
+class Command(BaseCommand):
+    help = 'Profile a CSV file chunk by chunk with mergeable sketches, without loading it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to profile')
+        parser.add_argument('--chunk-size', type=int, default=settings.UPLOAD_PARSE_CHUNK_SIZE,
+                            help='Bytes parsed per chunk')
+        parser.add_argument('--compare', action='store_true',
+                            help='Also load the whole file and report the error of each estimate')
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            profile = profile_csv_file(options['path'], options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        if not options['compare']:
+            self.stdout.write(json.dumps(profile, indent=2))
+            self.stdout.write(self.style.SUCCESS(
+                f"Profiled {profile['rows']} rows in {elapsed:.2f}s (peak {peak / 2**20:.1f}MB)"
+            ))
+            return
+
+        exact = profile_dataframe(load_csv(options['path'], options['chunk_size']), exact=True)
+        self.stdout.write(
+            f"{'column':<30} {'type':<12} {'distinct':>10} {'estimate':>10} {'max quantile error':>19}"
+        )
+        for sketched, column in zip(profile['columns'], exact['columns']):
+            error = '-'
+            if column['type'] == 'numeric' and 'quantiles' in column:
+                error = max(
+                    abs(sketched['quantiles'][q] - value) for q, value in column['quantiles'].items()
+                )
+                spread = (column['max'] - column['min']) or 1
+                error = f"{error / spread:.4%} of range"
+            self.stdout.write(
+                f"{column['name'][:30]:<30} {column['type']:<12} {column['distinct']:>10} "
+                f"{sketched['distinct']:>10} {error:>19}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Sketched {profile['rows']} rows in {elapsed:.2f}s (peak {peak / 2**20:.1f}MB)"
+        ))
+
+
+def load_csv(path, chunk_size):
+    """Parse the whole file into a DataFrame, the way ingestion does"""
+    reader = ChunkedCSVReader(chunk_size)
+    read_csv_file(reader, path, chunk_size)
+    return reader.finish()[1]
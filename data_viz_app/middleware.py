@@ -0,0 +1,203 @@
+import gzip
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .utils.metrics import start_trace, end_trace
+
+# Optional encoders; gzip is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Fast levels: large payloads are compressed on every response that is not a
+# 304, and the lowest levels get most of the size reduction of JSON numbers
+# at a fraction of the time
+GZIP_LEVEL = 1
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+
+def get_encoders():
+    """Available content codings with their compress functions, most preferred first"""
+    encoders = {}
+    if zstandard is not None:
+        encoders['zstd'] = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress
+    if brotli is not None:
+        encoders['br'] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+    encoders['gzip'] = lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return encoders
+
+
+ENCODERS = get_encoders()
+
+
+def parse_accept_encoding(header):
+    """Map each coding in an Accept-Encoding header to its q-value"""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(header, available):
+    """The available coding the client prefers (server order breaks ties), or None"""
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every request as a trace named after its URL pattern ("http.<name>")
+    Views and the plotting code add their stages to the current trace; with
+    METRICS_ENABLED off this is a single flag check per request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trace = start_trace('http')
+        if trace is None:
+            return self.get_response(request)
+        response = self.get_response(request)
+        self.finish(trace, request, response)
+        return response
+
+    async def __acall__(self, request):
+        trace = start_trace('http')
+        if trace is None:
+            return await self.get_response(request)
+        response = await self.get_response(request)
+        self.finish(trace, request, response)
+        return response
+
+    def finish(self, trace, request, response):
+        match = request.resolver_match
+        values = {}
+        if not response.streaming:
+            values['response_bytes'] = len(response.content)
+        labels = {'method': request.method, 'status': response.status_code}
+        if response.has_header('Content-Encoding'):
+            labels['encoding'] = response['Content-Encoding']
+        end_trace(
+            trace,
+            name=f'http.{match.url_name}' if match is not None and match.url_name else 'http.other',
+            # Views that answer {"success": false} mark their trace as failed
+            error=response.status_code >= 400 or bool(trace.values.pop('failed', False)),
+            labels=labels,
+            **values,
+        )
+
+
+class CompressionMiddleware:
+    """
+    Compress JSON responses of at least RESPONSE_COMPRESSION_MIN_BYTES with the
+    best coding the client accepts: zstd or brotli when their packages are
+    installed, gzip otherwise. Smaller responses are sent as they are.
+    Only JSON is compressed: the HTML page carries the CSRF token, which
+    compression would expose to BREACH-style attacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (response.status_code != 200 or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith('application/json')):
+            return response
+
+        if response.streaming:
+            # Streamed bodies have no length up front; they are gzipped as they go
+            patch_vary_headers(response, ('Accept-Encoding',))
+            if choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), ['gzip']) is None:
+                return response
+            # Async views stream through async iterators, which must stay async
+            if response.is_async:
+                response.streaming_content = agzip_stream(response.streaming_content)
+            else:
+                response.streaming_content = gzip_stream(response.streaming_content)
+            response['Content-Encoding'] = 'gzip'
+            del response['Content-Length']
+            return response
+
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+        # Caches must keep compressed and plain copies apart
+        patch_vary_headers(response, ('Accept-Encoding',))
+        coding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), ENCODERS)
+        if coding is None:
+            return response
+
+        compressed = ENCODERS[coding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        # A compressed body is no longer byte-identical, so a strong ETag becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+def gzip_stream(chunks):
+    """Gzip an iterable of byte chunks, flushing after each so rows reach the client as they are made"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def agzip_stream(chunks):
+    """gzip_stream for the async iterators streamed by async views"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
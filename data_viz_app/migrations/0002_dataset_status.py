@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+def processed_to_status(apps, schema_editor):
+    """Datasets that finished processing are done; any others never completed"""
+    Dataset = apps.get_model('data_viz_app', 'Dataset')
+    Dataset.objects.filter(processed=True).update(status='done')
+    Dataset.objects.filter(processed=False).update(status='failed')
+
+
+def status_to_processed(apps, schema_editor):
+    Dataset = apps.get_model('data_viz_app', 'Dataset')
+    Dataset.objects.filter(status='done').update(processed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_viz_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10),
+        ),
+        migrations.RunPython(processed_to_status, status_to_processed),
+        migrations.RemoveField(
+            model_name='dataset',
+            name='processed',
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import pandas as pd
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+
+import data_viz_app.models
+from data_viz_app.utils.column_cache import pack_columns, unpack_columns
+from data_viz_app.utils.data_processor import dataframe_to_json
+
+
+def json_to_file(apps, schema_editor):
+    """Pack the rows of every saved table into a compressed column blob"""
+    DataTable = apps.get_model('data_viz_app', 'DataTable')
+    for table in DataTable.objects.all():
+        df = pd.DataFrame(table.data_json)
+        table.data_file.save(f"{table.pk}.npz", ContentFile(pack_columns(df)), save=False)
+        table.save(update_fields=['data_file'])
+
+
+def file_to_json(apps, schema_editor):
+    DataTable = apps.get_model('data_viz_app', 'DataTable')
+    for table in DataTable.objects.all():
+        with table.data_file.open('rb') as f:
+            table.data_json = dataframe_to_json(unpack_columns(f))
+        table.save(update_fields=['data_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_viz_app', '0003_column_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datatable',
+            name='data_file',
+            field=models.FileField(default='', upload_to=data_viz_app.models.get_table_path),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='datatable',
+            name='data_json',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(json_to_file, file_to_json),
+        migrations.RemoveField(
+            model_name='datatable',
+            name='data_json',
+        ),
+    ]
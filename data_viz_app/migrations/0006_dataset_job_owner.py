@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_viz_app', '0005_dataset_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='job_owner',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
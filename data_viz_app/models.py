@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 import uuid
 import os
@@ -8,21 +9,63 @@ def get_file_path(instance, filename):
     filename = f"{uuid.uuid4()}.{ext}"
     return os.path.join('datasets', filename)
 
+def get_content_path(content_hash):
+    """Content-addressed path of an uploaded file, named by the SHA-256 of its bytes"""
+    return os.path.join('datasets', f"{content_hash}.csv")
+
+def get_table_path(instance, filename):
+    """Generate a unique file path for saved tables"""
+    return os.path.join('tables', f"{uuid.uuid4()}.npz")
+
+def get_column_cache_path(key):
+    """Directory holding parsed columns, keyed by content hash (or primary key for older datasets)"""
+    return os.path.join(settings.MEDIA_ROOT, 'cache', 'columns', str(key))
+
 class Dataset(models.Model):
     """Model to store information about uploaded datasets"""
+    # Processing state: queued -> running -> done or failed
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
     name = models.CharField(max_length=255)
     file = models.FileField(upload_to=get_file_path)
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    processed = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # SHA-256 of the uploaded bytes; datasets with the same content share one file and column cache
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Column profile (types, null counts, moments, quantiles, top values) built at ingest
+    profile = models.JSONField(null=True, blank=True)
+    # "<host>:<pid>" of the process ingesting the dataset while it is queued or
+    # running; its jobs live in that process's memory only
+    job_owner = models.CharField(max_length=255, blank=True)
     
     def __str__(self):
         return self.name
 
+    @property
+    def column_cache_path(self):
+        return get_column_cache_path(self.content_hash or self.pk)
+
 class DataTable(models.Model):
     """Model to store data entered manually through the UI"""
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
-    data_json = models.JSONField()
+    # Columns packed into a compressed blob by pack_columns; the database only keeps the reference
+    data_file = models.FileField(upload_to=get_table_path)
+    # Column profile of the saved data
+    profile = models.JSONField(null=True, blank=True)
     
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+    @property
+    def column_cache_path(self):
+        return get_column_cache_path(f"table-{self.pk}")
\ No newline at end of file
@@ -1,3 +1,758 @@
-from django.test import TestCase
+import asyncio
+import base64
+import decimal
+import gzip
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import async_views, middleware
+from .models import Dataset
+from .upload_handlers import PROGRESS_INTERVAL, StreamingCSVUploadHandler, get_upload_progress, store_upload
+from .views import TABLE_ID_PREFIX, WORKSPACE_DATASET_ID, dataset_store
+from .utils.chunked_csv import (
+    ChunkedCSVReader, find_record_boundary, find_range_offsets, read_csv_parallel, read_file_header,
+)
+from .utils.binning import aggregate_by_x, histogram_2d, top_categories
+from .utils.column_cache import pack_columns, read_columns, unpack_columns, write_columns
+from .utils.data_processor import (
+    read_and_preprocess_csv, read_and_preprocess_csv_rows, create_dataframe_from_preprocessed_data,
+    apply_cell_changes,
+)
+from .utils.dataset_store import DatasetStore, StoredFrame, estimate_frame_bytes
+from .utils.downsample import downsample
+from .utils.job_queue import JobQueue, QUEUED, RUNNING, DONE, get_process_owner
+from .utils.profile import profile_dataframe
+from .utils.sketches import DatasetSketch, DistinctSketch, QuantileSketch, hash_values
+from .utils.visualizer import to_typed_array
+
+
+def write_temp_csv(test, data):
+    """Write bytes to a temporary .csv file that is removed after the test"""
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    test.addCleanup(os.remove, path)
+    return path
+
+
+def use_temp_media_root(test):
+    """Keep a test's uploads and column caches out of the project's media directory"""
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+    override = override_settings(MEDIA_ROOT=media_root)
+    override.enable()
+    test.addCleanup(override.disable)
+
+
+def read_serial(path):
+    header, cleaned_data = read_and_preprocess_csv(path)
+    return create_dataframe_from_preprocessed_data(header, cleaned_data)
+
+
+def read_both(data):
+    """Parse CSV bytes with the columnar reader and with the row-at-a-time reference"""
+    header, cleaned_data = read_and_preprocess_csv(io.BytesIO(data))
+    rows_header, rows_data = read_and_preprocess_csv_rows(io.BytesIO(data))
+    return (create_dataframe_from_preprocessed_data(header, cleaned_data),
+            create_dataframe_from_preprocessed_data(rows_header, rows_data))
+
+
+class CSVParsingTests(SimpleTestCase):
+    """The columnar reader against the row-at-a-time reference"""
+    def test_matches_row_reader(self):
+        data = (b'id,name,flag,score\n'
+                b'1,Ann,True,3.5\n'
+                b'\n'
+                b' , , , \n'
+                b'2,  Bob ,False,\n'
+                b'3,,true,-1e3\n'
+                b'4,5,TRUE, 7 \n')
+        df, expected = read_both(data)
+        pd.testing.assert_frame_equal(df, expected)
+        self.assertEqual(len(df), 4)
+        self.assertEqual(df['name'].tolist(), ['Ann', 'Bob', 0.0, 5.0])
+        self.assertEqual(df['flag'].tolist(), ['True', 'False', 'true', 'TRUE'])
+        self.assertEqual(df['score'].tolist(), [3.5, 0.0, -1000.0, 7.0])
+
+    def test_short_rows_are_filled_with_zero(self):
+        # Known divergence: the row reader leaves cells missing from short rows
+        # as NaN, and fails when every row is short (like the 569-row files whose
+        # header ends with a comma); the columnar reader fills them with 0
+        df, expected = read_both(b'a,b,c\n1,2,3\n4,5\n6\n')
+        self.assertEqual(df.to_numpy().tolist(), [[1, 2, 3], [4, 5, 0], [6, 0, 0]])
+        self.assertTrue(expected.iloc[1:].isna().any().any())
+
+        with self.assertRaises(Exception):
+            read_both(b'a,b,\n1,2\n3,4\n')
+        header, df = read_and_preprocess_csv(io.BytesIO(b'a,b,\n1,2\n3,4\n'))
+        self.assertEqual(df.to_numpy().tolist(), [[1, 2, 0], [3, 4, 0]])
+
+    def test_long_rows_are_rejected(self):
+        with self.assertRaises(ValueError):
+            read_and_preprocess_csv(io.BytesIO(b'a,b\n1,2\n3,4,5\n'))
+
+
+class ChunkedCSVTests(SimpleTestCase):
+    """Record boundaries, streamed parsing and byte-range parsing of CSV files"""
+    def get_data(self, rows=1500):
+        """A CSV with a stray quote in an unquoted cell and a quoted multiline cell"""
+        lines = [b'id,desc,value\n'] + [b'%d,item %d,%d.5\n' % (i, i, i) for i in range(rows)]
+        lines[3] = b'2,5" screen,1\n'
+        lines[rows // 2] = b'%d,"multi\nline, ""quoted""",2\n' % (rows // 2 - 1)
+        return b''.join(lines)
+
+    def test_stray_quote_is_text(self):
+        data = b'0,5" screen,1\n1,a,2\n'
+        self.assertEqual(find_record_boundary(data), len(data))
+        self.assertEqual(find_record_boundary(data, first=True), data.index(b'\n') + 1)
+
+    def test_newlines_in_quoted_cells_are_skipped(self):
+        data = b'0,"a\nb ""c""\nd",1\n1,"x\n'
+        self.assertEqual(find_record_boundary(data), data.index(b'1\n') + 2)
+        self.assertEqual(find_record_boundary(b'0,"open\ncell\n'), 0)
+        # Continuing inside a quoted cell from an earlier block
+        self.assertEqual(find_record_boundary(b'still open\n",1\n', inside_quotes=True), 15)
+
+    def test_reader_parses_in_bounded_chunks(self):
+        data = self.get_data()
+        reader = ChunkedCSVReader(parse_chunk_size=2048)
+        for start in range(0, len(data), 512):
+            reader.feed(data[start:start + 512])
+            # Records are parsed as chunks fill, so the buffer never grows past about one chunk
+            self.assertLess(len(reader._buffer), 2048 + 512)
+        header, df = reader.finish()
+        self.assertEqual(header, ['id', 'desc', 'value'])
+        self.assertTrue(df.equals(read_serial(write_temp_csv(self, data))))
+        self.assertEqual(df['desc'].iloc[2], '5" screen')
+        self.assertEqual(df['desc'].iloc[749], 'multi\nline, "quoted"')
+
+    def test_reader_rejects_unterminated_quoted_cell(self):
+        data = b'a,b\n1,"never closed\n' + b'2,x\n' * 2000
+        reader = ChunkedCSVReader(parse_chunk_size=1024)
+        with self.assertRaises(ValueError):
+            for start in range(0, len(data), 512):
+                reader.feed(data[start:start + 512])
+
+    def test_range_offsets_start_on_record_boundaries(self):
+        data = self.get_data()
+        path = write_temp_csv(self, data)
+        with open(path, 'rb') as f:
+            header, start = read_file_header(f)
+            offsets = find_range_offsets(f, start, len(data), 8)
+        self.assertEqual(len(offsets), 8)
+        # Every range starts a record: parsing from there gives whole rows
+        self.assertTrue(all(data[offset - 1:offset] == b'\n' for offset in offsets))
+        self.assertNotIn(data.index(b'multi\n') + 6, offsets)
+
+    def test_byte_ranges_match_serial_parse(self):
+        path = write_temp_csv(self, self.get_data())
+        header, df = read_csv_parallel(path, workers=1, min_range_size=1024)
+        self.assertEqual(header, ['id', 'desc', 'value'])
+        self.assertTrue(df.equals(read_serial(path)))
+
+
+class JobQueueTests(SimpleTestCase):
+    def test_job_runs_once_a_worker_starts_it(self):
+        queue = JobQueue(max_workers=1, result_ttl=60)
+        self.addCleanup(lambda: queue._executor.shutdown())
+        started = threading.Event()
+        finished = threading.Event()
+        first = queue.submit('test', time.sleep, 0.5, on_start=lambda job: started.set())
+        # Waits for the only worker, so it stays queued while the first job runs
+        second = queue.submit('test', time.sleep, 0, on_done=lambda job: finished.set())
+        self.assertTrue(started.wait(30))
+        self.assertEqual(first.status, RUNNING)
+        self.assertEqual(second.status, QUEUED)
+        self.assertTrue(finished.wait(30))
+        self.assertEqual(first.status, DONE)
+
+
+class OrphanedDatasetTests(TestCase):
+    def create_dataset(self, name, status, job_owner):
+        return Dataset.objects.create(name=name, file='datasets/missing.csv', status=status, job_owner=job_owner)
+
+    def test_datasets_of_exited_processes_fail(self):
+        host = socket.gethostname()
+        self.create_dataset('no owner', Dataset.RUNNING, '')
+        self.create_dataset('exited', Dataset.QUEUED, f'{host}:999999999')
+        self.create_dataset('this process', Dataset.QUEUED, get_process_owner())
+        self.create_dataset('other host', Dataset.RUNNING, 'elsewhere:1')
+        statuses = {dataset['name']: dataset['status'] for dataset in self.client.get('/list_datasets/').json()['datasets']}
+        self.assertEqual(statuses, {
+            'no owner': Dataset.FAILED,
+            'exited': Dataset.FAILED,
+            'this process': Dataset.QUEUED,
+            'other host': Dataset.RUNNING,
+        })
+
+
+class ChartSpecTests(TestCase):
+    def setUp(self):
+        use_temp_media_root(self)
+        data = b'x,y\n' + b''.join(b'%d,%d\n' % (i, i % 7) for i in range(20000))
+        response = self.client.post('/upload/', {'name': 'points', 'file': SimpleUploadedFile('points.csv', data)})
+        self.assertTrue(response.json()['success'])
+
+    def get_chart(self, **options):
+        return self.client.post('/generate_graph/', json.dumps({
+            'graph_type': 'line', 'x_column': 'x', 'y_column': 'y', **options,
+        }), content_type='application/json')
+
+    def test_point_budget_is_capped(self):
+        for max_points in (10 ** 9, '100000'):
+            response = self.get_chart(max_points=max_points)
+            self.assertEqual(response.json()['points']['rendered'], settings.GRAPH_MAX_POINTS)
+        self.assertEqual(self.get_chart(max_points='100').json()['points']['rendered'], 100)
+
+    def test_invalid_options_are_rejected(self):
+        for options in ({'max_points': 0}, {'max_points': -5}, {'max_points': 2.5}, {'max_points': True},
+                        {'max_points': 'many'}, {'downsample': 'none'}, {'downsample': 'fast'},
+                        {'top_n': True}, {'top_n': 2.5}, {'bins': True}, {'bins': 2.5}, {'bins': [10, False]},
+                        {'bins': '2.5'}):
+            response = self.get_chart(**options)
+            self.assertEqual(response.status_code, 400, options)
+            self.assertFalse(response.json()['success'])
+
+    def test_numeric_arrays_are_sent_as_typed_arrays(self):
+        response = self.get_chart(max_points='100', plot_encoding='base64').json()
+        trace = json.loads(response['plot'])['data'][0]
+        x = np.frombuffer(base64.b64decode(trace['x']['bdata']), dtype='<' + trace['x']['dtype'])
+        self.assertEqual((len(x), x[0], x[-1]), (100, 0, 19999))
+        # Digits 0-6 are shorter as a JSON list than as base64
+        self.assertIsInstance(trace['y'], list)
+        self.assertEqual(len(trace['y']), 100)
+        plain = json.loads(self.get_chart(max_points='100').json()['plot'])['data'][0]
+        self.assertEqual(plain['x'], x.tolist())
+        self.assertIsNone(to_typed_array(np.arange(10.0)))
+
+
+class ChartSeriesTests(TestCase):
+    def setUp(self):
+        use_temp_media_root(self)
+        data = b'x,a,b,group,region\n' + b''.join(
+            b'%d,%d,%d,g%d,%s\n' % (i, i, 2 * i, i % 3, b'ns'[i % 2:i % 2 + 1]) for i in range(300))
+        response = self.client.post('/upload/', {'name': 'series', 'file': SimpleUploadedFile('series.csv', data)})
+        self.assertTrue(response.json()['success'])
+
+    def get_chart(self, **options):
+        response = self.client.post('/generate_graph/', json.dumps({
+            'graph_type': 'line', 'x_column': 'x', **options,
+        }), content_type='application/json').json()
+        figure = json.loads(response['plot'])
+        traces = [(trace['name'], trace['xaxis'], len(trace['x'])) for trace in figure['data']]
+        panels = [annotation['text'] for annotation in figure['layout'].get('annotations', [])]
+        return response, traces, panels
+
+    def test_several_y_columns(self):
+        response, traces, panels = self.get_chart(y_columns=['a', 'b'])
+        self.assertEqual((traces, panels), ([('a', 'x', 300), ('b', 'x', 300)], []))
+        self.assertEqual((response['series_stats']['a']['max'], response['series_stats']['b']['max']), (299, 598))
+        _, traces, panels = self.get_chart(y_columns=['a', 'b'], subplots=True)
+        self.assertEqual((traces, panels), ([('a', 'x', 300), ('b', 'x2', 300)], ['a', 'b']))
+
+    def test_color_and_facet_split_the_series(self):
+        _, traces, _ = self.get_chart(y_columns=['a'], color_column='group')
+        self.assertEqual(traces, [('g0', 'x', 100), ('g1', 'x', 100), ('g2', 'x', 100)])
+        _, traces, panels = self.get_chart(y_columns=['a'], facet_column='region')
+        self.assertEqual((traces, panels), ([('a', 'x', 150), ('a', 'x2', 150)], ['region = n', 'region = s']))
+        _, traces, panels = self.get_chart(y_columns=['a', 'b'], color_column='group', facet_column='region')
+        self.assertEqual(len(traces), 12)
+        self.assertEqual(traces[:2], [('a · g0', 'x', 50), ('a · g0', 'x2', 50)])
+        self.assertEqual(panels, ['region = n', 'region = s'])
+
+    def test_unknown_series_columns_are_rejected(self):
+        for options in ({'y_columns': ['a', 'missing']}, {'y_columns': ['a'], 'color_column': 'missing'},
+                        {'y_columns': ['a'], 'facet_column': 'missing'}):
+            response = self.client.post('/generate_graph/', json.dumps({
+                'graph_type': 'line', 'x_column': 'x', **options,
+            }), content_type='application/json')
+            self.assertEqual(response.status_code, 400, options)
+
+
+class WorkspaceTests(TestCase):
+    def setUp(self):
+        use_temp_media_root(self)
+        data = b'name,score\n' + b''.join(b'student %d,%d\n' % (i, i) for i in range(100))
+        response = self.client.post('/upload/', {'name': 'scores', 'file': SimpleUploadedFile('scores.csv', data)})
+        self.assertTrue(response.json()['success'])
+        self.dataset_id = self.client.session['dataset_id']
+        self.session_key = self.client.session.session_key
+
+    def apply_changes(self, changes, version=None):
+        return self.client.post('/apply_changes/', json.dumps({'version': version, 'changes': changes}),
+                                content_type='application/json')
+
+    def test_edits_outlive_the_dataset_store(self):
+        response = self.apply_changes([
+            {'row': 0, 'column': 'score', 'value': '99'},
+            {'row': 100, 'column': 'name', 'value': 'new'},
+        ], version=0).json()
+        self.assertEqual((response['version'], response['row_count']), (1, 101))
+        self.assertEqual(self.client.session['dataset_id'], WORKSPACE_DATASET_ID)
+        # Evicted, or served by another worker process
+        dataset_store.discard(self.session_key, WORKSPACE_DATASET_ID)
+        rows = self.client.get('/get_rows/', {'offset': 0, 'limit': 200}).json()
+        self.assertEqual(rows['total_rows'], 101)
+        names, scores = rows['data']
+        self.assertEqual((scores[0], names[100]), (99, 'new'))
+        # The uploaded dataset keeps its content
+        original = dataset_store.get(self.session_key, self.dataset_id).df
+        self.assertEqual((len(original), original['score'].iloc[0]), (100, 0))
+
+    def test_change_sets_need_the_current_version(self):
+        response = self.apply_changes([{'row': 1, 'column': 'score', 'value': '50'}], version=0)
+        self.assertEqual(response.json()['version'], 1)
+        # A client that has not seen version 1 yet
+        response = self.apply_changes([{'row': 1, 'column': 'score', 'value': '60'}], version=0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.json()['conflict'], response.json()['version']), (True, 1))
+        self.assertEqual(self.client.get('/get_rows/', {'offset': 1, 'limit': 1}).json()['data'][1], [50])
+        # Adding a column and a row in one change set
+        response = self.apply_changes([
+            {'row': 100, 'column': 'name', 'value': 'new'},
+            {'row': 100, 'column': 'grade', 'value': 'A'},
+        ], version=1).json()
+        self.assertEqual((response['version'], response['row_count']), (2, 101))
+        self.assertEqual(response['columns'], ['name', 'score', 'grade'])
+        columns = self.client.get('/get_columns/').json()
+        self.assertEqual((columns['version'], columns['row_count']), (2, 101))
+        # Rows can only be appended directly after the last one
+        response = self.apply_changes([{'row': 105, 'column': 'score', 'value': '1'}], version=2).json()
+        self.assertFalse(response['success'])
+
+    def test_malformed_changes_are_rejected(self):
+        for change in ({'row': 1.7, 'column': 'score', 'value': '1'}, {'row': True, 'column': 'score', 'value': '1'},
+                       {'row': '1', 'column': 'score', 'value': '1'}, {'row': -1, 'column': 'score', 'value': '1'},
+                       {'row': 1, 'column': None, 'value': '1'}, {'row': 1, 'column': ['score'], 'value': '1'},
+                       {'column': 'score', 'value': '1'}, 'row 1'):
+            response = self.apply_changes([{'row': 0, 'column': 'score', 'value': '5'}, change]).json()
+            self.assertFalse(response['success'], change)
+        # Nothing from a rejected change set is applied, and the uploaded dataset stays open
+        self.assertEqual(self.client.session['dataset_id'], self.dataset_id)
+        self.assertEqual(self.client.get('/get_rows/', {'offset': 0, 'limit': 1}).json()['data'][1], [0])
+
+    def test_edits_invalidate_cached_charts(self):
+        caches['figures'].clear()
+
+        def get_chart():
+            return self.client.post('/generate_graph/', json.dumps({
+                'graph_type': 'bar', 'x_column': 'name', 'y_column': 'score',
+            }), content_type='application/json').json()
+
+        self.assertFalse(get_chart()['cached'])
+        self.assertTrue(get_chart()['cached'])
+        self.apply_changes([{'row': 0, 'column': 'score', 'value': '500'}])
+        chart = get_chart()
+        self.assertFalse(chart['cached'])
+        self.assertEqual(chart['y_stats']['max'], 500)
+        self.assertTrue(get_chart()['cached'])
+
+    def test_row_windows(self):
+        def get_row_ids(**params):
+            return self.client.get('/get_rows/', params).json()['row_ids']
+
+        rows = self.client.get('/get_rows/', {'offset': 95, 'limit': 10}).json()
+        self.assertEqual((rows['total_rows'], rows['row_ids']), (100, [95, 96, 97, 98, 99]))
+        self.assertEqual(rows['data'][0], ['student 95', 'student 96', 'student 97', 'student 98', 'student 99'])
+        self.assertEqual(get_row_ids(offset=0, limit=3, sort='score', order='desc'), [99, 98, 97])
+        filtered = self.client.get('/get_rows/', {'limit': 2, 'filter_column': 'name', 'filter_value': '1',
+                                                  'sort': 'score', 'order': 'desc'}).json()
+        self.assertEqual((filtered['total_rows'], filtered['row_ids']), (19, [91, 81]))
+        # Row orders are recomputed after an edit
+        self.apply_changes([{'row': 5, 'column': 'score', 'value': '1000'}])
+        self.assertEqual(get_row_ids(offset=0, limit=1, sort='score', order='desc'), [5])
+
+
+class DatasetStoreTests(SimpleTestCase):
+    def test_edits_update_the_store_size(self):
+        store = DatasetStore(max_bytes=10 ** 9)
+        other = store.put('session', 'other', pd.DataFrame({'a': range(10)}))
+        entry = store.put('session', 'workspace', pd.DataFrame({'name': ['a'] * 10}))
+        changes = [{'row': 10 + i, 'column': 'name', 'value': 'x' * 100} for i in range(500)]
+        store.record_edit('session', 'workspace', entry, apply_cell_changes(entry.df, changes), changes)
+        self.assertEqual(entry.nbytes, estimate_frame_bytes(entry.df))
+        self.assertEqual(store.stats()['bytes'], other.nbytes + entry.nbytes)
+        # Growing past the budget evicts the least recently used frame
+        store.max_bytes = entry.nbytes
+        changes = [{'row': 0, 'column': 'name', 'value': 'y'}]
+        store.record_edit('session', 'workspace', entry, apply_cell_changes(entry.df, changes), changes)
+        self.assertIsNone(store.get('session', 'other'))
+        self.assertEqual(store.stats()['bytes'], entry.nbytes)
+
+
+class BinningTests(SimpleTestCase):
+    def test_bars_bin_numeric_x(self):
+        x = np.arange(1000, dtype='float64')
+        bars = aggregate_by_x(x, np.ones(1000), bins=10, agg='sum')
+        self.assertEqual(bars['y'].tolist(), [100.0] * 10)
+        self.assertEqual((bars['x'][0], bars['width']), (49.95, 99.9))
+        # Few distinct values get one bar each
+        bars = aggregate_by_x(np.array([3.0, 1.0, 3.0]), np.array([1.0, 2.0, 4.0]), agg='mean')
+        self.assertEqual((bars['x'].tolist(), bars['y'].tolist(), bars['width']), ([1.0, 3.0], [2.0, 2.5], None))
+
+    def test_heatmap_grid(self):
+        x_centers, y_centers, grid = histogram_2d(np.array([0.0, 1.0, 1.0]), np.array([0.0, 0.0, 1.0]), 2, 2)
+        self.assertEqual(grid.tolist(), [[1, 1], [0, 1]])
+        self.assertEqual(x_centers.tolist(), [0.25, 0.75])
+
+    def test_top_categories_collapse_the_rest(self):
+        keys = np.array(['a', 'b', 'c', 'd', 'a'], dtype=object)
+        labels, sums = top_categories(keys, np.array([1.0, 5.0, 2.0, 1.0, 1.0]), n=2)
+        self.assertEqual(labels.tolist(), ['b', 'a', 'Other (2 categories)'])
+        self.assertEqual(sums.tolist(), [5.0, 2.0, 3.0])
+
+
+class DownsampleTests(SimpleTestCase):
+    def test_methods_stay_within_the_budget(self):
+        rng = np.random.default_rng(0)
+        x = np.arange(10000, dtype='float64')
+        y = rng.normal(size=10000)
+        y[1234] = 100.0
+        for method in ('lttb', 'minmax', 'grid'):
+            kept = downsample(x, y, 500, method)
+            self.assertLessEqual(len(kept), 500, method)
+            self.assertTrue(np.all(np.diff(kept) > 0), method)
+        # Line methods keep both ends and the spike
+        for method in ('lttb', 'minmax'):
+            kept = downsample(x, y, 500, method)
+            self.assertTrue({0, 1234, 9999} <= set(kept.tolist()), method)
+        self.assertEqual(len(downsample(x[:100], y[:100], 500, 'lttb')), 100)
+
+    def test_tiny_budgets_are_kept(self):
+        x = np.arange(1000, dtype='float64')
+        y = np.sin(x)
+        for max_points in (1, 2, 3):
+            for method in ('lttb', 'minmax', 'grid'):
+                kept = downsample(x, y, max_points, method)
+                self.assertLessEqual(len(kept), max_points, (method, max_points))
+                self.assertEqual(kept[0], 0, method)
+
+
+
+class SketchTests(SimpleTestCase):
+    def test_quantiles_are_close(self):
+        values = np.random.default_rng(0).permutation(100000).astype('float64')
+        sketch = QuantileSketch(k=256)
+        for chunk in np.array_split(values, 50):
+            part = QuantileSketch(k=256)
+            part.update(chunk)
+            sketch.merge(part)
+        self.assertFalse(sketch.exact)
+        for q, estimate in zip((0.05, 0.5, 0.95), sketch.quantiles((0.05, 0.5, 0.95))):
+            self.assertAlmostEqual(estimate / 100000, q, delta=0.02)
+
+    def test_distinct_counts(self):
+        sketch = DistinctSketch()
+        sketch.update(hash_values(np.array([1.0, 2.0, 2.0])))
+        sketch.update(hash_values(np.array(['2', 'x', 1], dtype=object)))
+        # A number hashes the same in numeric and text chunks
+        self.assertEqual(sketch.estimate(), 4)
+        sketch.update(hash_values(np.arange(100000, dtype='float64')))
+        self.assertFalse(sketch.exact)
+        self.assertAlmostEqual(sketch.estimate() / 100002, 1, delta=0.03)
+
+    def test_merged_chunks_match_the_profile(self):
+        df = pd.DataFrame({'n': np.arange(1000, dtype='float64') % 97, 't': ['a', 'b', 'b', 'c'] * 250})
+        sketch = DatasetSketch()
+        for start in range(0, 1000, 300):
+            part = DatasetSketch()
+            part.update(df.iloc[start:start + 300])
+            sketch.merge(part)
+        profile = sketch.to_profile(['n', 't'])
+        expected = profile_dataframe(df)
+        self.assertEqual(profile['rows'], 1000)
+        numeric, text = profile['columns']
+        self.assertEqual((numeric['type'], numeric['distinct'], numeric['min'], numeric['max']), ('numeric', 97, 0, 96))
+        self.assertAlmostEqual(numeric['mean'], expected['columns'][0]['mean'])
+        self.assertEqual(text['top'][0], ['b', 500])
+        self.assertEqual(text['type'], expected['columns'][1]['type'])
+
+
+class ProfileTests(SimpleTestCase):
+    def test_ingest_profiles_are_sketched(self):
+        df = pd.DataFrame({'n': np.random.default_rng(0).permutation(20000).astype('float64')})
+        sketched = profile_dataframe(df)['columns'][0]
+        exact = profile_dataframe(df, exact=True)['columns'][0]
+        self.assertTrue(sketched['approximate'])
+        self.assertNotIn('approximate', exact)
+        self.assertEqual((sketched['count'], sketched['min'], sketched['max']), (20000, 0, 19999))
+        self.assertAlmostEqual(sketched['mean'], exact['mean'])
+        for q, value in exact['quantiles'].items():
+            self.assertAlmostEqual(sketched['quantiles'][q] / 20000, value / 20000, delta=0.02)
+
+    def test_edits_are_merged_into_the_profile(self):
+        df = pd.DataFrame({'n': np.arange(1000, dtype='float64'), 't': ['a', 'b', 'b', 'c'] * 250})
+        entry = StoredFrame(df, profile=profile_dataframe(df))
+
+        def edit(changes):
+            previous = {}
+            entry.record_edit(apply_cell_changes(entry.df, changes, previous=previous), changes, previous)
+            return entry.profile['columns'], profile_dataframe(entry.df, exact=True)['columns']
+
+        (numeric, text), (exact_numeric, exact_text) = edit([
+            {'row': 1, 'column': 'n', 'value': '5000'},
+            {'row': 2, 'column': 't', 'value': 'c'},
+            {'row': 1000, 'column': 't', 'value': 'd'},
+        ])
+        self.assertTrue(numeric['approximate'])
+        self.assertEqual((numeric['count'], numeric['nulls'], numeric['min'], numeric['max']), (1000, 1, 0, 5000))
+        self.assertAlmostEqual(numeric['mean'], exact_numeric['mean'])
+        self.assertAlmostEqual(numeric['std'], exact_numeric['std'])
+        self.assertEqual((text['count'], text['top']), (1001, exact_text['top']))
+        # Editing the minimum away reads the column for the new one
+        (numeric, _), _ = edit([{'row': 0, 'column': 'n', 'value': '10'}])
+        self.assertEqual(numeric['min'], 2)
+        # Past PROFILE_REBUILD_FRACTION of the rows the profile is built again
+        edit([{'row': row, 'column': 'n', 'value': '1'} for row in range(3, 20)])
+        self.assertEqual(entry.profile, profile_dataframe(entry.df))
+
+
+class ColumnCacheTests(SimpleTestCase):
+    def test_cached_columns_are_memory_mapped(self):
+        path = os.path.join(tempfile.mkdtemp(), 'cache')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), True)
+        self.assertIsNone(read_columns(path))
+        df = pd.DataFrame({'n': np.arange(1000, dtype='float64'), 't': ['a', 'b'] * 500})
+        write_columns(df, path)
+        cached = read_columns(path)
+        pd.testing.assert_frame_equal(cached, df)
+        numbers = cached['n'].to_numpy()
+        self.assertFalse(numbers.flags.writeable)
+        while not isinstance(numbers, np.memmap) and numbers.base is not None:
+            numbers = numbers.base
+        self.assertIsInstance(numbers, np.memmap)
+        # An existing cache is kept unless it is overwritten
+        write_columns(df.iloc[:10], path)
+        self.assertEqual(len(read_columns(path)), 1000)
+        write_columns(df.iloc[:10], path, overwrite=True)
+        self.assertEqual(len(read_columns(path)), 10)
+
+    def test_tables_round_trip(self):
+        df = pd.DataFrame({
+            'n': np.arange(5, dtype='float64'),
+            'mixed': pd.Series(['a', 1.5, np.nan, 'a', 2.0], dtype=object),
+            'when': pd.date_range('2024-01-01', periods=5),
+        })
+        table = unpack_columns(pack_columns(df))
+        pd.testing.assert_frame_equal(table, df)
+
+    def test_objects_json_cannot_hold_are_packed(self):
+        values = [pd.Timestamp('2024-01-02'), decimal.Decimal('1.5'), np.datetime64('2024-03-04', 'ns'), 'x', None]
+        df = pd.DataFrame({'objects': pd.Series(values, dtype=object)})
+        table = unpack_columns(pack_columns(df))
+        self.assertEqual(table['objects'].tolist()[:4], ['2024-01-02T00:00:00', 1.5, '2024-03-04T00:00:00', 'x'])
+        self.assertTrue(pd.isna(table['objects'][4]))
+
+
+@override_settings(UPLOAD_PARSE_CHUNK_SIZE=64 * 1024)
+class UploadProgressTests(TestCase):
+    def setUp(self):
+        use_temp_media_root(self)
+
+    def test_rows_are_parsed_while_the_file_arrives(self):
+        data = b'a,b\n' + b''.join(b'%d,%d\n' % (i, i) for i in range(400000))
+        handler = StreamingCSVUploadHandler(RequestFactory().post('/upload/?upload_id=stream'))
+        handler.handle_raw_input(None, {}, len(data), b'boundary')
+        # Later handlers are skipped once this one takes the file
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('file', 'big.csv', 'text/csv', len(data))
+        rows = []
+        # Progress is published once per PROGRESS_INTERVAL bytes received
+        for start in range(0, len(data), PROGRESS_INTERVAL):
+            handler.receive_data_chunk(data[start:start + PROGRESS_INTERVAL], start)
+            if start + PROGRESS_INTERVAL <= len(data):
+                progress = get_upload_progress('stream')
+                self.assertEqual((progress['status'], progress['total_bytes']), ('receiving', len(data)))
+                self.assertEqual(progress['bytes_read'], start + PROGRESS_INTERVAL)
+                rows.append(progress['rows_processed'])
+        self.assertTrue(0 < rows[0] < rows[-1] < 400000)
+        upload = handler.file_complete(len(data))
+        self.addCleanup(upload.close)
+        self.assertEqual((len(upload.dataframe), upload.profile['rows']), (400000, 400000))
+        progress = get_upload_progress('stream')
+        self.assertEqual((progress['status'], progress['bytes_read']), ('processing', len(data)))
+
+    def test_finished_uploads_report_their_rows(self):
+        data = b'a,b\n' + b'1,2\n' * 1000
+        response = self.client.post('/upload/?upload_id=small',
+                                    {'name': 'small', 'file': SimpleUploadedFile('small.csv', data)})
+        self.assertTrue(response.json()['success'])
+        progress = self.client.get('/upload_progress/', {'upload_id': 'small'}).json()
+        self.assertEqual((progress['status'], progress['rows_processed']), ('done', 1000))
+        self.assertEqual(progress['bytes_read'], len(data))
+        self.assertFalse(self.client.get('/upload_progress/', {'upload_id': 'other'}).json()['success'])
+
+
+class OpenDatasetTests(TestCase):
+    def setUp(self):
+        use_temp_media_root(self)
+        data = b'name,score\n' + b''.join(b'student %d,%d\n' % (i, i) for i in range(100))
+        response = self.client.post('/upload/', {'name': 'scores', 'file': SimpleUploadedFile('scores.csv', data)})
+        self.assertTrue(response.json()['success'])
+        self.dataset = Dataset.objects.get(pk=self.client.session['dataset_id'])
+        self.session_key = self.client.session.session_key
+
+    def open(self, **ids):
+        response = self.client.post('/open_dataset/', json.dumps(ids), content_type='application/json').json()
+        self.assertTrue(response['success'], response)
+        self.assertEqual(response['rows_processed'], 100)
+        return response['tier']
+
+    def test_datasets_open_from_the_fastest_tier(self):
+        self.assertEqual(self.open(dataset_id=self.dataset.pk), 'memory')
+        dataset_store.discard(self.session_key, str(self.dataset.pk))
+        self.assertEqual(self.open(dataset_id=self.dataset.pk), 'cache')
+        # Without its column cache the CSV is parsed again, and the cache rewritten
+        dataset_store.discard(self.session_key, str(self.dataset.pk))
+        shutil.rmtree(self.dataset.column_cache_path)
+        self.assertEqual(self.open(dataset_id=self.dataset.pk), 'csv')
+        dataset_store.discard(self.session_key, str(self.dataset.pk))
+        self.assertEqual(self.open(dataset_id=self.dataset.pk), 'cache')
+        self.assertEqual(self.client.session['dataset_id'], str(self.dataset.pk))
+
+    def test_saved_tables_open_from_their_blob_then_the_cache(self):
+        response = self.client.post('/save_data/', json.dumps({'name': 'saved'}), content_type='application/json')
+        table_id = response.json()['id']
+        self.assertEqual(self.open(table_id=table_id), 'blob')
+        dataset_store.discard(self.session_key, f"{TABLE_ID_PREFIX}{table_id}")
+        self.assertEqual(self.open(table_id=table_id), 'cache')
+        rows = self.client.get('/get_rows/', {'offset': 0, 'limit': 2}).json()
+        self.assertEqual(rows['data'], [['student 0', 'student 1'], [0, 1]])
+
+
+class ResponseCachingTests(TestCase):
+    def setUp(self):
+        use_temp_media_root(self)
+        data = b'name,score\n' + b''.join(b'student %d,%d\n' % (i, i) for i in range(1000))
+        response = self.client.post('/upload/', {'name': 'scores', 'file': SimpleUploadedFile('scores.csv', data)})
+        self.assertTrue(response.json()['success'])
+
+    def test_unchanged_responses_are_revalidated(self):
+        params = {'offset': 0, 'limit': 10}
+        response = self.client.get('/get_rows/', params)
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/get_rows/', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/get_rows/', {'offset': 10, 'limit': 10},
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        spec = json.dumps({'graph_type': 'line', 'x_column': 'score', 'y_column': 'score'})
+        chart_etag = self.client.get('/generate_graph/', {'spec': spec})['ETag']
+        self.assertEqual(self.client.get('/generate_graph/', {'spec': spec},
+                                         HTTP_IF_NONE_MATCH=chart_etag).status_code, 304)
+        # An edit changes the data behind both
+        self.client.post('/apply_changes/', json.dumps({'changes': [{'row': 0, 'column': 'score', 'value': '5'}]}),
+                         content_type='application/json')
+        response = self.client.get('/get_rows/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()['data'][1][0]), (200, 5))
+        self.assertEqual(self.client.get('/generate_graph/', {'spec': spec},
+                                         HTTP_IF_NONE_MATCH=chart_etag).status_code, 200)
+
+    def test_large_json_is_compressed(self):
+        params = {'offset': 0, 'limit': 500}
+        plain = self.client.get('/get_rows/', params)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        response = self.client.get('/get_rows/', params, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), plain.json())
+        # Small responses are sent as they are
+        small = self.client.get('/get_rows/', {'offset': 0, 'limit': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+    def test_content_coding_negotiation(self):
+        available = ['zstd', 'br', 'gzip']
+        self.assertEqual(middleware.choose_encoding('gzip, br, zstd', available), 'zstd')
+        self.assertEqual(middleware.choose_encoding('gzip;q=1.0, br;q=0.5', available), 'gzip')
+        self.assertEqual(middleware.choose_encoding('*;q=0.1, zstd;q=0', available), 'br')
+        self.assertIsNone(middleware.choose_encoding('identity', available))
+        self.assertIsNone(middleware.choose_encoding('br', ['gzip']))
+        # Codings from optional packages are used when the client accepts them
+        with mock.patch.dict(middleware.ENCODERS, {'br': lambda data: b'br:' + data[:10]}):
+            response = self.client.get('/get_rows/', {'offset': 0, 'limit': 500}, HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual((response['Content-Encoding'], response.content[:3]), ('br', b'br:'))
+        # Without them, a client accepting only those codings gets plain JSON
+        with mock.patch.dict(middleware.ENCODERS, {'gzip': middleware.ENCODERS['gzip']}, clear=True):
+            response = self.client.get('/get_rows/', {'offset': 0, 'limit': 500}, HTTP_ACCEPT_ENCODING='br, zstd')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class StoreUploadTests(SimpleTestCase):
+    def test_concurrent_identical_uploads_share_one_file(self):
+        use_temp_media_root(self)
+        data = b'a,b\n' + b'1,2\n' * 1000000
+        results = []
+
+        def store():
+            results.append(store_upload(SimpleUploadedFile('a.csv', data)))
+
+        threads = [threading.Thread(target=store) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(results)), 1)
+        storage_name, content_hash = results[0]
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'datasets')), [os.path.basename(storage_name)])
+        with open(os.path.join(settings.MEDIA_ROOT, storage_name), 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+
+class DatasetLimiterTests(SimpleTestCase):
+    def get_peak(self, keys):
+        """Most holders of hold_dataset at once while one task per key runs"""
+        running = peak = 0
+
+        async def work(key):
+            nonlocal running, peak
+            async with async_views.hold_dataset(key):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        async def main():
+            await asyncio.gather(*(work(key) for key in keys))
+
+        asyncio.run(main())
+        return peak
+
+    def test_sessions_share_a_dataset_limit(self):
+        limit = async_views.shared_dataset_limiter.limit
+        self.assertEqual(self.get_peak([(f'session {i}', '1') for i in range(limit * 3)]), limit)
+        # Workspaces belong to their session, so they are only limited per session
+        self.assertEqual(self.get_peak([(f'session {i}', WORKSPACE_DATASET_ID) for i in range(limit * 3)]), limit * 3)
+        self.assertEqual(self.get_peak([('session', '1')] * 10), async_views.dataset_limiter.limit)
+
+
+@override_settings(DEBUG=False)
+class MetricsAccessTests(TestCase):
+    def test_only_staff_can_read_metrics(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        user = User.objects.create_user('viewer', password='secret')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertTrue(self.client.get('/metrics/').json()['success'])
+
+    def test_reset_needs_a_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(User.objects.create_user('admin', password='secret', is_staff=True))
+        response = client.post('/metrics/', json.dumps({'reset': True}), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
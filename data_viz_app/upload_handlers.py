@@ -0,0 +1,214 @@
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from .models import get_file_path, get_content_path
+from .utils.chunked_csv import ChunkedCSVReader
+from .utils.sketches import DatasetSketch
+
+UPLOAD_ID_PATTERN = re.compile(r'^[\w-]{1,64}$')
+
+# Progress is published after at least this many new bytes have been received
+PROGRESS_INTERVAL = 1024 * 1024
+
+
+def get_upload_id(request):
+    """Return the client-chosen upload id from the query string, if it is valid"""
+    upload_id = request.GET.get('upload_id', '')
+    return upload_id if UPLOAD_ID_PATTERN.match(upload_id) else None
+
+def get_upload_progress(upload_id):
+    """Return the progress recorded for an upload, or None"""
+    return cache.get(f"upload_progress:{upload_id}")
+
+def update_upload_progress(upload_id, **fields):
+    """Merge fields into the progress recorded for an upload"""
+    if not upload_id:
+        return
+    progress = get_upload_progress(upload_id) or {}
+    progress.update(fields)
+    cache.set(f"upload_progress:{upload_id}", progress, settings.UPLOAD_PROGRESS_TIMEOUT)
+
+class StreamedCSVUpload(UploadedFile):
+    """
+    An uploaded CSV that was written to MEDIA_ROOT and parsed while it arrived
+    storage_name is the file's name relative to MEDIA_ROOT; header and dataframe
+    hold the parsed data and profile its column profile, or error says why
+    parsing failed. content_hash is the SHA-256 of the received bytes.
+    """
+    def __init__(self, file, name, storage_name, size, content_type, header, dataframe, error,
+                 profile=None, content_hash=None):
+        super().__init__(file, name, content_type, size)
+        self.storage_name = storage_name
+        self.content_hash = content_hash
+        self.header = header
+        self.dataframe = dataframe
+        self.error = error
+        self.profile = profile
+
+    @property
+    def parsed(self):
+        """False when the handler only wrote the file, leaving parsing to a job"""
+        return self.dataframe is not None or self.error is not None
+
+    def discard(self):
+        """Remove the written file when no dataset ends up pointing to it"""
+        self.close()
+        try:
+            os.remove(os.path.join(settings.MEDIA_ROOT, self.storage_name))
+        except OSError:
+            pass
+
+
+class StreamingCSVUploadHandler(FileUploadHandler):
+    """
+    Upload handler that writes the dataset file straight into MEDIA_ROOT and
+    parses it chunk by chunk as it is received
+    The content is hashed as it arrives, so duplicates can be detected without
+    reading the file again. Only the raw text of the chunk being parsed is held in memory, and the file
+    is never copied from a temporary location after the upload. Progress is
+    published to the cache under the request's upload_id. With parse=False the
+    file is only written, for uploads ingested by a background job.
+    """
+    field_name = 'file'
+
+    def __init__(self, request=None, parse=True):
+        super().__init__(request)
+        self.parse = parse
+        self.upload_id = get_upload_id(request) if request is not None else None
+        self.activated = False
+        self.total_bytes = None
+        self.bytes_read = 0
+        self.reported_bytes = 0
+        self.rows_processed = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.total_bytes = content_length
+        self.report('receiving')
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name != self.field_name:
+            return
+
+        self.activated = True
+        self.storage_name = get_file_path(None, self.file_name)
+        path = os.path.join(settings.MEDIA_ROOT, self.storage_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'w+b')
+        self.hasher = hashlib.sha256()
+        self.reader = None
+        if self.parse:
+            self.reader = ChunkedCSVReader(settings.UPLOAD_PARSE_CHUNK_SIZE, sketch=DatasetSketch())
+        self.error = None
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activated:
+            return raw_data
+
+        self.file.write(raw_data)
+        self.hasher.update(raw_data)
+        self.bytes_read += len(raw_data)
+        if self.reader is not None and self.error is None:
+            try:
+                self.reader.feed(raw_data)
+                self.rows_processed = self.reader.rows_processed
+            except Exception as e:
+                # Keep receiving so the request completes; the view reports the error
+                self.error = str(e)
+
+        if self.bytes_read - self.reported_bytes >= PROGRESS_INTERVAL:
+            self.report('receiving')
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+
+        header, dataframe, profile = [], None, None
+        if self.reader is not None and self.error is None:
+            try:
+                header, dataframe = self.reader.finish()
+                profile = self.reader.sketch.to_profile(header)
+                self.rows_processed = self.reader.rows_processed
+            except Exception as e:
+                self.error = str(e)
+        self.reader = None
+
+        self.file.seek(0)
+        self.report('processing')
+        return StreamedCSVUpload(
+            self.file, self.file_name, self.storage_name, file_size,
+            self.content_type, header, dataframe, self.error, profile,
+            self.hasher.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        if self.activated:
+            self.file.close()
+            try:
+                os.remove(self.file.name)
+            except OSError:
+                pass
+            self.report('failed', message='Upload interrupted')
+
+    def report(self, status, **fields):
+        """Publish bytes read and rows parsed so far"""
+        self.reported_bytes = self.bytes_read
+        update_upload_progress(
+            self.upload_id,
+            status=status,
+            bytes_read=self.bytes_read,
+            total_bytes=self.total_bytes,
+            rows_processed=self.rows_processed,
+            **fields,
+        )
+
+
+def store_upload(uploaded_file):
+    """
+    Move an uploaded file to its content-addressed path
+    Returns the storage name and the SHA-256 of the content. When identical
+    content is already stored, the new copy is dropped and the stored file is used.
+    Files are renamed into place, so a concurrent upload of the same content
+    never sees a partial file; if both rename, the bytes are the same anyway.
+    """
+    if isinstance(uploaded_file, StreamedCSVUpload):
+        content_hash = uploaded_file.content_hash
+        storage_name = get_content_path(content_hash)
+        target = os.path.join(settings.MEDIA_ROOT, storage_name)
+        if os.path.exists(target):
+            uploaded_file.discard()
+        else:
+            os.replace(os.path.join(settings.MEDIA_ROOT, uploaded_file.storage_name), target)
+        uploaded_file.storage_name = storage_name
+        return storage_name, content_hash
+
+    # Files received by Django's own upload handlers are hashed after the fact
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    content_hash = hasher.hexdigest()
+    storage_name = get_content_path(content_hash)
+    target = os.path.join(settings.MEDIA_ROOT, storage_name)
+    if not os.path.exists(target):
+        # Written under a unique name first, like streamed uploads
+        tmp_path = os.path.join(settings.MEDIA_ROOT, get_file_path(None, 'upload.part'))
+        os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in uploaded_file.chunks():
+                    f.write(chunk)
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    return storage_name, content_hash
@@ -1,13 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 
 app_name = 'data_viz_app'
 
+# Under an ASGI server the upload, column and chart endpoints can use their async variants
+data_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.index, name='index'),
-    path('upload/', views.upload_file, name='upload_file'),
+    path('upload/', data_views.upload_file, name='upload_file'),
+    path('upload_progress/', views.upload_progress, name='upload_progress'),
     path('process_data/', views.process_data, name='process_data'),
-    path('get_columns/', views.get_columns, name='get_columns'),
-    path('generate_graph/', views.generate_graph, name='generate_graph'),
+    path('apply_changes/', views.apply_changes, name='apply_changes'),
+    path('get_columns/', data_views.get_columns, name='get_columns'),
+    path('get_rows/', views.get_rows, name='get_rows'),
+    path('generate_graph/', data_views.generate_graph, name='generate_graph'),
+    path('job_status/', views.job_status, name='job_status'),
+    path('job_result/', views.job_result, name='job_result'),
     path('save_data/', views.save_data, name='save_data'),
+    path('list_datasets/', views.list_datasets, name='list_datasets'),
+    path('open_dataset/', views.open_dataset, name='open_dataset'),
+    path('metrics/', views.get_metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+AGGREGATIONS = ('count', 'sum', 'mean', 'min', 'max')
+
+# Default number of bins per axis for binned charts
+DEFAULT_BINS = 50
+
+# Default number of categories shown before the rest are collapsed into "Other"
+DEFAULT_TOP_N = 10
+
+
+def bin_edges(values, bins):
+    """Equal-width bin edges spanning the values (a constant column gets a unit-wide span)"""
+    low, high = float(values.min()), float(values.max())
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, bins + 1)
+
+
+def bin_codes(values, edges):
+    """Bin index of every value; the top edge falls in the last bin"""
+    bins = len(edges) - 1
+    scaled = (values - edges[0]) / (edges[-1] - edges[0]) * bins
+    return np.clip(scaled.astype(np.int64), 0, bins - 1)
+
+
+def bin_centers(edges):
+    return (edges[:-1] + edges[1:]) / 2
+
+
+def aggregate_codes(codes, size, values=None, agg='count'):
+    """
+    Aggregate values by integer group code into an array of length `size`
+    Groups without rows are 0 for count and sum, and NaN for mean, min and max
+    """
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{agg}'")
+
+    counts = np.bincount(codes, minlength=size)
+    if agg == 'count':
+        return counts
+    if values is None:
+        raise ValueError(f"Aggregation '{agg}' needs a value column")
+
+    if agg in ('sum', 'mean'):
+        sums = np.bincount(codes, weights=values, minlength=size)
+        if agg == 'sum':
+            return sums
+        with np.errstate(invalid='ignore'):
+            return sums / counts
+
+    result = np.full(size, np.inf if agg == 'min' else -np.inf)
+    (np.minimum if agg == 'min' else np.maximum).at(result, codes, values)
+    result[counts == 0] = np.nan
+    return result
+
+
+def histogram_2d(x, y, x_bins, y_bins, values=None, agg='count'):
+    """
+    Aggregate points over an x_bins by y_bins grid of equal-width cells
+    Returns the x and y bin centers and a (y_bins, x_bins) grid, the layout
+    Plotly heatmaps and contours expect for z
+    """
+    x_edges = bin_edges(x, x_bins)
+    y_edges = bin_edges(y, y_bins)
+    codes = bin_codes(y, y_edges) * x_bins + bin_codes(x, x_edges)
+    grid = aggregate_codes(codes, x_bins * y_bins, values, agg).reshape(y_bins, x_bins)
+    return bin_centers(x_edges), bin_centers(y_edges), grid
+
+
+def group_by(keys, values=None, agg='count'):
+    """
+    Aggregate values per distinct key
+    Returns the sorted distinct keys, the aggregated values and the row count of
+    each key
+    """
+    codes, uniques = pd.factorize(keys, sort=True)
+    result = aggregate_codes(codes, len(uniques), values, agg)
+    return np.asarray(uniques), result, np.bincount(codes, minlength=len(uniques))
+
+
+def aggregate_by_x(x, y, bins=DEFAULT_BINS, agg='sum', max_categories=None):
+    """
+    Aggregate y per x value for bar charts
+    Numeric x with more than `bins` distinct values is split into `bins`
+    equal-width bins; otherwise there is one group per distinct value. With
+    max_categories, only the most frequent categories are kept.
+    Returns a dict with the group positions ('x'), aggregated values ('y'), row
+    counts ('counts') and bar width ('width', None for categories). Empty bins
+    are left out.
+    """
+    x = np.asarray(x)
+    numeric = x.dtype.kind in 'iuf'
+    if numeric and len(pd.unique(x)) > bins:
+        edges = bin_edges(x, bins)
+        codes = bin_codes(x, edges)
+        counts = np.bincount(codes, minlength=bins)
+        result = aggregate_codes(codes, bins, y, agg)
+        filled = counts > 0
+        return {
+            'x': bin_centers(edges)[filled],
+            'y': result[filled],
+            'counts': counts[filled],
+            'width': float(edges[1] - edges[0]),
+        }
+
+    keys, result, counts = group_by(x, y, agg)
+    if not numeric:
+        keys = keys.astype(str)
+    if max_categories is not None and len(keys) > max_categories:
+        # Most frequent categories, still in key order
+        kept = np.sort(np.argsort(-counts, kind='stable')[:max_categories])
+        keys, result, counts = keys[kept], result[kept], counts[kept]
+    return {'x': keys, 'y': result, 'counts': counts, 'width': None}
+
+
+def format_labels(keys):
+    """Category keys as text, writing whole-number floats without a trailing .0"""
+    if keys.dtype.kind == 'f' and np.isfinite(keys).all() and (keys == np.trunc(keys)).all():
+        keys = keys.astype(np.int64)
+    return keys.astype(str)
+
+
+def top_categories(keys, values, n=DEFAULT_TOP_N):
+    """
+    Sum values per key, keeping the n largest groups and collapsing the rest
+    into a single "Other" group
+    Returns labels and sums, largest first with "Other" last, so the result
+    never has more than n + 1 entries
+    """
+    labels, sums, _ = group_by(keys, values, 'sum')
+    labels = format_labels(labels)
+    order = np.argsort(-sums, kind='stable')
+    if len(order) <= n + 1:
+        return labels[order], sums[order]
+
+    top, rest = order[:n], order[n:]
+    return (
+        np.append(labels[top], f'Other ({len(rest)} categories)'),
+        np.append(sums[top], sums[rest].sum()),
+    )
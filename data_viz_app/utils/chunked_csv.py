@@ -0,0 +1,322 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from .data_processor import read_csv_columns, clean_raw_frame
+from .metrics import stage
+from .sketches import DatasetSketch
+
+QUOTE = ord('"')
+NEWLINE = ord('\n')
+# Bytes after which a quote starts a new field, and may open a quoted cell
+FIELD_SEPARATORS = np.array([ord(','), NEWLINE, ord('\r')], dtype=np.uint8)
+
+# Byte ranges a file is split into for parallel parsing: never smaller than the
+# minimum (starting processes costs more than parsing a small range), and never
+# larger than the maximum, so each worker holds a bounded amount of raw text
+PARALLEL_MIN_RANGE_SIZE = 16 * 1024 * 1024
+PARALLEL_MAX_RANGE_SIZE = 128 * 1024 * 1024
+
+# Bytes read at a time while looking for the header and the range boundaries
+SCAN_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Chunks ChunkedCSVReader buffers while looking for the end of one record
+# before giving up; only an unterminated quoted cell makes a record that long
+MAX_RECORD_CHUNKS = 4
+
+
+def find_unquoted_newlines(data, inside_quotes=False, previous=NEWLINE):
+    """
+    Positions of the newlines in `data` (a uint8 array) that are outside quoted
+    cells, and whether `data` ends inside one
+    Quotes are read like pandas does: only a quote at the start of a field
+    opens a quoted cell, so stray quotes in unquoted cells (5" screen) are
+    text. Inside a cell a run of quotes closes it when its length is odd
+    ("" is an escaped quote). `previous` is the byte before `data`.
+    Works on runs of quotes rather than bytes, so it stays vectorized.
+    """
+    newlines = np.flatnonzero(data == NEWLINE)
+    quotes = np.flatnonzero(data == QUOTE)
+    breaks = np.flatnonzero(np.diff(quotes) != 1)
+    run_starts = quotes[np.r_[0, breaks + 1]] if len(quotes) else quotes
+    run_ends = quotes[np.r_[breaks, len(quotes) - 1]] + 1 if len(quotes) else quotes
+    # Even runs are escaped quotes, or an empty cell, and never change the state
+    odd = (run_ends - run_starts) % 2 == 1
+    run_starts, run_ends = run_starts[odd], run_ends[odd]
+    if len(run_starts) == 0:
+        return newlines[:0] if inside_quotes else newlines, inside_quotes
+    before = np.where(run_starts > 0, data[np.maximum(run_starts - 1, 0)], previous)
+    at_field_start = np.isin(before, FIELD_SEPARATORS)
+
+    # An odd run at a field start switches between inside and outside; any other
+    # odd run closes the open cell, or is stray text outside one. So after a
+    # run of the second kind the scan is outside, and the runs at field starts
+    # that follow it alternate between opening and closing.
+    runs = np.arange(len(run_starts))
+    last_outside = np.maximum.accumulate(np.where(at_field_start, -1, runs))
+    inside_after = at_field_start & (
+        ((runs - last_outside) % 2 == 1) ^ ((last_outside < 0) & inside_quotes))
+
+    last_run = np.searchsorted(run_ends, newlines, side='right') - 1
+    quoted = np.where(last_run >= 0, inside_after[np.maximum(last_run, 0)], inside_quotes)
+    return newlines[~quoted], bool(inside_after[-1])
+
+
+def find_record_boundary(buffer, first=False, inside_quotes=False):
+    """
+    Return the offset just past the last (or first) complete CSV record in
+    `buffer`, or 0 if it holds no complete record
+    Newlines inside quoted cells are skipped (see find_unquoted_newlines).
+    `buffer` must start at a record boundary, or inside a quoted cell when
+    inside_quotes is set.
+    """
+    newlines, _ = find_unquoted_newlines(np.frombuffer(buffer, dtype=np.uint8), inside_quotes)
+    if len(newlines) == 0:
+        return 0
+    return int(newlines[0 if first else -1]) + 1
+
+
+def read_header(block, final=True):
+    """
+    Parse the first non-blank record of `block` as the header
+    Returns the header and the offset of the bytes after it. Without final, a
+    header record that is not complete yet gives (None, offset of its start);
+    with final, what is left of the block is the header.
+    """
+    start = 0
+    while start < len(block):
+        end = find_record_boundary(block[start:], first=True)
+        if end == 0:
+            if not final:
+                return None, start
+            end = len(block) - start
+        try:
+            header = pd.read_csv(io.BytesIO(block[start:start + end]), nrows=1, dtype=str, header=None,
+                                 keep_default_na=False, encoding='utf-8').iloc[0].tolist()
+            return header, start + end
+        except pd.errors.EmptyDataError:
+            start += end
+    return None, start
+
+
+def parse_block(block, width):
+    """Parse and clean a block of complete CSV records into a DataFrame"""
+    raw = read_csv_columns(io.BytesIO(block), width)
+
+    def reread_as_text(positions):
+        return read_csv_columns(io.BytesIO(block), width, usecols=positions, dtype=str)
+
+    return clean_raw_frame(raw, reread_as_text)
+
+
+def combine_chunks(chunks, header):
+    """
+    Join lists of cleaned column arrays column by column into one DataFrame,
+    releasing each chunk's arrays as it goes
+    """
+    columns = {}
+    for position in range(len(header)):
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk[position])
+            chunk[position] = None
+        # Columns that held text in any chunk end up as object arrays,
+        # just like when the whole file is cleaned at once
+        columns[position] = np.concatenate(parts) if parts else np.empty(0, dtype='float64')
+
+    df = pd.DataFrame(columns, copy=False)
+    df.columns = header
+    return df
+
+
+class ChunkedCSVReader:
+    """
+    Incremental version of read_and_preprocess_csv for files arriving in pieces
+    Bytes passed to feed() are buffered until parse_chunk_size is reached, then
+    every complete record in the buffer is parsed and cleaned, so no more than
+    about one chunk of raw text is held at a time. finish() parses what is left
+    and returns the header and the cleaned DataFrame.
+    Each cleaned chunk is also added to `sketch` (a DatasetSketch) when one is
+    given; with keep_rows=False only the sketch is built and finish() returns
+    None instead of a DataFrame, so files of any size can be profiled.
+    """
+    def __init__(self, parse_chunk_size=8 * 1024 * 1024, sketch=None, keep_rows=True):
+        self.parse_chunk_size = parse_chunk_size
+        self.sketch = sketch
+        self.keep_rows = keep_rows
+        self.header = None
+        self.rows_processed = 0
+        self._buffer = bytearray()
+        # Buffer size at which the next complete records are looked for
+        self._scan_size = parse_chunk_size
+        # Cleaned column arrays of every parsed chunk
+        self._chunks = []
+
+    def feed(self, data):
+        """Add received bytes, parsing the buffered records once a chunk is full"""
+        self._buffer += data
+        if len(self._buffer) < self._scan_size:
+            return
+        end = find_record_boundary(self._buffer)
+        if end == 0:
+            # One record spans the whole buffer; look again a chunk later
+            if len(self._buffer) >= MAX_RECORD_CHUNKS * self.parse_chunk_size:
+                raise ValueError("A record is longer than the parse chunk size allows; "
+                                 "the file may have a quoted cell that is never closed")
+            self._scan_size = len(self._buffer) + self.parse_chunk_size
+            return
+        self._parse(end)
+        self._scan_size = self.parse_chunk_size
+
+    def finish(self):
+        """Parse the remaining bytes and return (header, DataFrame)"""
+        self._parse(len(self._buffer))
+        if self.header is None:
+            return [], pd.DataFrame() if self.keep_rows else None
+        return self.header, self._combine() if self.keep_rows else None
+
+    def _parse(self, end):
+        if end == 0:
+            return
+        block = bytes(self._buffer[:end])
+        del self._buffer[:end]
+
+        if self.header is None:
+            self.header, offset = read_header(block)
+            block = block[offset:]
+            if self.header is None:
+                return
+
+        width = len(self.header)
+        with stage('parse'):
+            cleaned = parse_block(block, width)
+        if len(cleaned):
+            if self.sketch is not None:
+                with stage('profile'):
+                    self.sketch.update(cleaned)
+            if self.keep_rows:
+                self._chunks.append([cleaned.iloc[:, position].to_numpy() for position in range(width)])
+            self.rows_processed += len(cleaned)
+
+    def _combine(self):
+        chunks, self._chunks = self._chunks, []
+        with stage('parse'):
+            return combine_chunks(chunks, self.header)
+
+
+def read_file_header(f):
+    """Read the header of an open CSV file; returns it and the offset of the first data record"""
+    block = b''
+    while True:
+        data = f.read(SCAN_BLOCK_SIZE)
+        block += data
+        header, offset = read_header(block, final=not data)
+        if header is not None or not data:
+            return header, offset
+
+
+def find_range_offsets(f, start, end, parts):
+    """
+    Start offsets of about `parts` byte ranges of similar size between start and end
+    Each range starts just past a newline outside quotes, so no record is
+    split. Whether the scan is inside a quoted cell is carried from `start`
+    block by block (see find_unquoted_newlines), which is much cheaper than
+    parsing the records.
+    """
+    targets = [start + (end - start) * i // parts for i in range(1, parts)]
+    offsets = [start]
+    inside_quotes = False
+    previous = NEWLINE
+    position = start
+    carry = b''
+    f.seek(start)
+    while targets:
+        data = f.read(SCAN_BLOCK_SIZE)
+        block = carry + data
+        if not block:
+            break
+        # A run of quotes at the end of a block may go on in the next one
+        carry = block[len(block.rstrip(b'"')):] if data else b''
+        block = block[:len(block) - len(carry)]
+        if not block:
+            continue
+        newlines, ends_inside = find_unquoted_newlines(
+            np.frombuffer(block, dtype=np.uint8), inside_quotes, previous)
+        boundaries = position + newlines + 1
+        while targets:
+            index = np.searchsorted(boundaries, targets[0], side='right')
+            if index == len(boundaries):
+                # The record goes on into the next block
+                break
+            offsets.append(int(boundaries[index]))
+            targets = [target for target in targets[1:] if target > offsets[-1]]
+        inside_quotes, previous = ends_inside, block[-1]
+        position += len(block)
+    return [offset for offset in offsets if offset < end] or [start]
+
+
+def parse_byte_range(path, start, end, width, profile=False):
+    """
+    Parse and clean the records between two byte offsets of a CSV file
+    Runs in a worker process of read_csv_parallel; returns the cleaned column
+    arrays and, with profile, a DatasetSketch of them
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        block = f.read(end - start)
+    cleaned = parse_block(block, width)
+    sketch = None
+    if profile:
+        sketch = DatasetSketch()
+        if len(cleaned):
+            sketch.update(cleaned)
+    return [cleaned.iloc[:, position].to_numpy() for position in range(width)], sketch
+
+
+def read_csv_parallel(path, workers, sketch=None, min_range_size=PARALLEL_MIN_RANGE_SIZE,
+                      max_range_size=PARALLEL_MAX_RANGE_SIZE):
+    """
+    Parallel version of read_and_preprocess_csv for a CSV file on disk
+    The data records are split into byte ranges that start on record
+    boundaries, and each range is parsed and cleaned in a worker process.
+    Cleaning is per cell, so cleaning ranges separately gives the same values
+    as cleaning the whole file; a column that holds text in any range ends up
+    as an object array, like in the serial path. The sketches of the ranges
+    are merged into `sketch` (a DatasetSketch) when one is given.
+    Returns the header and the cleaned DataFrame.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header, start = read_file_header(f)
+        if header is None:
+            return [], pd.DataFrame()
+        data_size = size - start
+        parts = max(
+            min(workers, -(-data_size // min_range_size)),
+            -(-data_size // max_range_size),
+            1,
+        )
+        offsets = find_range_offsets(f, start, size, parts)
+
+    ends = offsets[1:] + [size]
+    width = len(header)
+    profile = sketch is not None
+    if workers > 1 and len(offsets) > 1:
+        # Spawned like the job queue's workers; forking a threaded server is unsafe
+        with ProcessPoolExecutor(max_workers=min(workers, len(offsets)),
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = list(executor.map(
+                parse_byte_range, repeat(path), offsets, ends, repeat(width), repeat(profile),
+            ))
+    else:
+        results = [parse_byte_range(path, start, end, width, profile) for start, end in zip(offsets, ends)]
+
+    if profile:
+        for _, range_sketch in results:
+            sketch.merge(range_sketch)
+    return header, combine_chunks([columns for columns, _ in results], header)
@@ -0,0 +1,191 @@
+import datetime
+import decimal
+import io
+import json
+import numbers
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Bumped whenever the on-disk layout changes so stale caches are ignored
+CACHE_FORMAT_VERSION = 1
+
+META_FILE = 'meta.json'
+
+# Bumped whenever the layout of packed tables changes
+TABLE_FORMAT_VERSION = 1
+
+# Name of the JSON schema stored inside a packed table
+SCHEMA_ARRAY = 'schema'
+
+
+def to_json_value(value):
+    """
+    Convert a distinct value of a coded column to something JSON can hold
+    Numbers such as Decimal become floats, dates and times ISO 8601 text, and
+    any other object its str(), so every frame can be cached and packed
+    """
+    if isinstance(value, np.datetime64):
+        # .item() of a nanosecond datetime64 is a bare integer
+        value = pd.Timestamp(value)
+    elif isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (numbers.Real, decimal.Decimal)):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_column(column):
+    """
+    Split a column into a NumPy array and JSON-serializable metadata
+    Numeric, boolean and datetime columns are stored as-is. Anything else is
+    factorized into int32 codes plus the list of distinct values, which keeps
+    numbers and strings in mixed columns apart; distinct values JSON cannot
+    hold are converted by to_json_value.
+    """
+    if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'biufcmM':
+        return column.to_numpy(), {'kind': 'array'}
+
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+    values = [to_json_value(value) for value in uniques]
+    return codes.astype(np.int32), {'kind': 'coded', 'dtype': str(column.dtype), 'values': values}
+
+
+def decode_column(array, meta):
+    """Rebuild a column from the array and metadata written by encode_column"""
+    if meta['kind'] == 'array':
+        return array
+
+    lookup = np.empty(len(meta['values']) + 1, dtype=object)
+    lookup[:-1] = meta['values']
+    lookup[-1] = np.nan
+    values = lookup.take(array)
+    if meta['dtype'] == 'object':
+        return values
+    return pd.array(values, dtype=meta['dtype'])
+
+
+def write_columns(df, path, overwrite=False):
+    """
+    Persist a DataFrame as one .npy file per column under `path`
+    The directory is written under a temporary name and renamed into place,
+    so readers never see a partially written cache. An existing cache is kept
+    unless overwrite is set.
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = os.path.join(parent, f".{os.path.basename(path)}.{uuid.uuid4().hex}")
+    os.makedirs(tmp_path)
+
+    try:
+        columns = []
+        for position, name in enumerate(df.columns):
+            array, meta = encode_column(df.iloc[:, position])
+            file_name = f"{position}.npy"
+            np.save(os.path.join(tmp_path, file_name), array, allow_pickle=False)
+            columns.append({'name': name, 'file': file_name, **meta})
+
+        with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+            json.dump({
+                'version': CACHE_FORMAT_VERSION,
+                'rows': len(df),
+                'columns': columns,
+            }, f)
+
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            if not overwrite:
+                # Another worker already wrote this cache
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return
+            # A directory cannot be renamed over a non-empty one, so the old cache is moved aside first
+            old_path = f"{tmp_path}.old"
+            os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def read_columns(path):
+    """
+    Load a DataFrame written by write_columns, or return None if there is none
+    Array columns are memory-mapped read-only, so every worker process that
+    opens the same cache shares one copy of the data through the page cache
+    """
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('version') != CACHE_FORMAT_VERSION:
+        return None
+
+    data = {}
+    for position, column in enumerate(meta['columns']):
+        array = np.load(os.path.join(path, column['file']), mmap_mode='r', allow_pickle=False)
+        data[position] = decode_column(array, column)
+
+    df = pd.DataFrame(data, index=pd.RangeIndex(meta['rows']), copy=False)
+    df.columns = [column['name'] for column in meta['columns']]
+    return df
+
+
+def remove_columns(path):
+    """Delete a column cache if it exists"""
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def pack_columns(df):
+    """
+    Serialize a DataFrame into one compressed, self-describing blob
+    Columns are encoded as in the column cache and stored in a deflate-compressed
+    .npz archive together with a JSON schema (names, encodings and row count)
+    """
+    arrays = {}
+    columns = []
+    for position, name in enumerate(df.columns):
+        array, meta = encode_column(df.iloc[:, position])
+        key = f"c{position}"
+        arrays[key] = array
+        columns.append({'name': name, 'array': key, **meta})
+
+    schema = json.dumps({
+        'version': TABLE_FORMAT_VERSION,
+        'rows': len(df),
+        'columns': columns,
+    })
+    arrays[SCHEMA_ARRAY] = np.frombuffer(schema.encode('utf-8'), dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def unpack_columns(source):
+    """Load a DataFrame from a blob (bytes or a binary file) written by pack_columns"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    with np.load(source, allow_pickle=False) as archive:
+        schema = json.loads(archive[SCHEMA_ARRAY].tobytes().decode('utf-8'))
+        if schema.get('version') != TABLE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported table format version {schema.get('version')}")
+        data = {
+            position: decode_column(archive[column['array']], column)
+            for position, column in enumerate(schema['columns'])
+        }
+
+    df = pd.DataFrame(data, index=pd.RangeIndex(schema['rows']), copy=False)
+    df.columns = [column['name'] for column in schema['columns']]
+    return df
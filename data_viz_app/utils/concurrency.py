@@ -0,0 +1,34 @@
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+
+class KeyedLimiter:
+    """
+    Caps how many tasks hold the same key at once (e.g. work on one dataset)
+    Each key gets its own semaphore while it is in use, so waiting on a busy
+    key never holds up other keys. Semaphores are dropped when their last
+    holder or waiter leaves, so memory follows the number of active keys.
+    Limits apply per event loop, i.e. per ASGI worker process.
+    """
+    def __init__(self, limit):
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        self.limit = limit
+        # loop -> key -> [semaphore, tasks holding or waiting for it]
+        self._loops = weakref.WeakKeyDictionary()
+
+    @asynccontextmanager
+    async def hold(self, key):
+        slots = self._loops.setdefault(asyncio.get_running_loop(), {})
+        slot = slots.get(key)
+        if slot is None:
+            slot = slots[key] = [asyncio.Semaphore(self.limit), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del slots[key]
@@ -3,11 +3,152 @@ import numpy as np
 import json
 import csv
 import io
+import os
+import hashlib
+import warnings
 
-def read_and_preprocess_csv(uploaded_file):
+# Options shared by every columnar read: blanks become NaN so they can be filled
+# per column, and nothing else is treated as missing
+CSV_READ_OPTIONS = {
+    'header': None,
+    'keep_default_na': False,
+    'na_values': [''],
+    'skipinitialspace': True,
+    'skip_blank_lines': True,
+    'encoding': 'utf-8',
+}
+
+def read_and_preprocess_csv(uploaded_file, workers=1):
     """
     Read and preprocess an uploaded CSV file
-    Returns header and cleaned data as lists
+    Parses the byte stream straight into typed columns and returns the header
+    and a DataFrame of cleaned data (blank rows dropped, blank cells filled with 0)
+    `uploaded_file` may also be a path. With workers > 1, a file on disk is
+    split into byte ranges that are parsed in that many processes.
+    """
+    path = get_csv_path(uploaded_file)
+    if workers > 1 and path is not None:
+        # Imported here because chunked_csv builds on this module
+        from .chunked_csv import read_csv_parallel
+        return read_csv_parallel(path, workers)
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        with open(uploaded_file, 'rb') as f:
+            return read_and_preprocess_csv(f)
+
+    # Read header
+    try:
+        header = pd.read_csv(uploaded_file, nrows=1, dtype=str, header=None,
+                             keep_default_na=False, encoding='utf-8').iloc[0].tolist()
+    except pd.errors.EmptyDataError:
+        return [], pd.DataFrame()
+
+    # Rewind and parse the data rows column by column in the C parser
+    # (header=0 skips the header record even when blank lines come before it)
+    uploaded_file.seek(0)
+    raw = read_csv_columns(uploaded_file, len(header), header=0)
+
+    def reread_as_text(positions):
+        uploaded_file.seek(0)
+        return read_csv_columns(uploaded_file, len(header), header=0,
+                                usecols=positions, dtype=str)
+
+    cleaned_df = clean_raw_frame(raw, reread_as_text)
+    cleaned_df.columns = header
+
+    return header, cleaned_df
+
+def get_csv_path(source):
+    """Path of a CSV source on disk (a path, or a file opened from one), or None"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    name = getattr(source, 'name', None)
+    if isinstance(name, str) and os.path.isabs(name) and os.path.isfile(name):
+        return name
+    return None
+
+def read_csv_columns(source, width, **kwargs):
+    """Parse CSV rows into `width` columns, failing on rows with extra cells"""
+    try:
+        with warnings.catch_warnings():
+            # pandas only warns (and drops data) when a row is wider than the header
+            warnings.simplefilter('error', pd.errors.ParserWarning)
+            return pd.read_csv(source, names=range(width), index_col=False,
+                               **{**CSV_READ_OPTIONS, **kwargs})
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=range(width))
+    except pd.errors.ParserWarning as e:
+        raise ValueError(f"Row has more cells than the header: {str(e)}")
+
+def clean_raw_frame(raw, reread_as_text=None):
+    """
+    Clean a DataFrame of parsed CSV columns
+    Drops rows with no content, replaces empty cells (including cells missing from
+    short rows) with 0 and converts every cell that parses as a number to float.
+    Columns the parser could not type as numbers are cleaned per distinct value,
+    with the same rules as the row-at-a-time path.
+    """
+    # Skip empty rows
+    raw = raw[~raw.isna().all(axis=1)]
+
+    # The parser reads True/False as booleans; the original text is needed instead
+    boolean = [
+        position for position in raw.columns
+        if pd.api.types.is_bool_dtype(raw[position])
+        or (raw[position].dtype == object and raw[position].map(type).eq(bool).any())
+    ]
+    if boolean and reread_as_text is not None:
+        text = reread_as_text(boolean)
+        text = text.loc[raw.index]
+        for position in boolean:
+            raw[position] = text[position]
+
+    cleaned = {}
+    for position in raw.columns:
+        column = raw[position]
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            cleaned[position] = column.fillna(0).astype('float64').to_numpy()
+        else:
+            cleaned[position] = _clean_text_column(column)
+
+    df = pd.DataFrame(cleaned, columns=raw.columns)
+    df.index = pd.RangeIndex(len(df))
+    return df
+
+def clean_cell(cell):
+    """Clean one cell: strip whitespace, treat blanks as 0 and convert numbers to float"""
+    if cell is None or (isinstance(cell, float) and np.isnan(cell)):
+        return 0.0
+    cell = str(cell).strip()
+    if cell == "":
+        cell = "0"
+    try:
+        return float(cell)
+    except ValueError:
+        return cell
+
+def _clean_text_column(column):
+    """Clean a column of text cells once per distinct value instead of once per cell"""
+    codes, uniques = pd.factorize(column, use_na_sentinel=True)
+
+    cleaned_uniques = [clean_cell(cell) for cell in uniques]
+
+    # Missing cells (NaN after parsing) are blanks and become 0
+    cleaned_uniques.append(0.0)
+    codes = np.where(codes < 0, len(cleaned_uniques) - 1, codes)
+
+    if all(isinstance(value, float) for value in cleaned_uniques):
+        return np.asarray(cleaned_uniques, dtype='float64').take(codes)
+    lookup = np.empty(len(cleaned_uniques), dtype=object)
+    lookup[:] = cleaned_uniques
+    return lookup.take(codes)
+
+def read_and_preprocess_csv_rows(uploaded_file):
+    """
+    Row-at-a-time reference implementation of read_and_preprocess_csv
+    Returns header and cleaned data as lists (kept for benchmarking and parity checks)
+    Short rows are the one known difference: they stay short here, so their
+    missing cells become NaN in the DataFrame (or creating it fails when every
+    row is short), while read_and_preprocess_csv fills them with 0
     """
     # Read uploaded CSV file
     decoded_file = uploaded_file.read().decode('utf-8')
@@ -61,6 +202,11 @@ def process_uploaded_file(file_path):
 def create_dataframe_from_preprocessed_data(header, cleaned_data):
     """Create a pandas DataFrame from preprocessed header and data"""
     try:
+        # The columnar reader already hands back a typed DataFrame
+        if isinstance(cleaned_data, pd.DataFrame):
+            cleaned_data.columns = header
+            return cleaned_data
+
         # Create DataFrame from cleaned data with proper column names
         df = pd.DataFrame(cleaned_data, columns=header)
         return df
@@ -74,6 +220,20 @@ def get_dataframe_from_json(data_json):
     except Exception as e:
         raise Exception(f"Error converting JSON to DataFrame: {str(e)}")
 
+def get_dataframe_fingerprint(df):
+    """
+    Content hash of a DataFrame: column names, dtypes and every value
+    Two frames with the same fingerprint render identical charts
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    digest.update(str(len(df)).encode('utf-8'))
+    for position in range(df.shape[1]):
+        # Hash column by column; hash_pandas_object works on the values directly
+        column = df.iloc[:, position]
+        digest.update(pd.util.hash_pandas_object(column, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
 def get_column_types(df):
     """Get the data types of each column in the DataFrame"""
     column_types = {}
@@ -90,10 +250,116 @@ def dataframe_to_json(df):
     """Convert a DataFrame to JSON for storage or transmission"""
     try:
         # Handle NaN values and convert to list of dictionaries
-        return json.loads(df.fillna('').to_json(orient='records'))
+        # Built directly as Python objects rather than round-tripping through a JSON string
+        return df.astype(object).where(df.notna(), '').to_dict(orient='records')
     except Exception as e:
         raise Exception(f"Error converting DataFrame to JSON: {str(e)}")
 
+def apply_cell_changes(df, changes, max_new_rows=None, previous=None):
+    """
+    Apply a batch of cell edits to a DataFrame in place
+    Each change is a dict with 'row' (row position), 'column' (name) and 'value'.
+    Values are cleaned like uploaded cells; a numeric column receiving text
+    becomes a mixed column. Unknown columns are added, and rows past the end
+    are appended. Returns the DataFrame, which is a new object only when
+    rows had to be appended.
+    New rows must directly follow the existing ones, without gaps, and at most
+    max_new_rows of them can be added. Rows must be non-negative integers and
+    columns strings (or integers, for frames with numbered columns). Otherwise
+    ValueError is raised and nothing is changed.
+    When previous is a dict, it receives the values the edited cells held
+    before, as {column: {row: value}}; cells of new rows or columns are NaN.
+    """
+    cleaned = {}
+    new_rows = set()
+    for change in changes:
+        if not isinstance(change, dict) or 'row' not in change or 'column' not in change:
+            raise ValueError("Each change needs a row and a column")
+        row = change['row']
+        # bool is an int subclass, but true/false are never row positions
+        if isinstance(row, bool) or not isinstance(row, int) or row < 0:
+            raise ValueError(f"Invalid row {row!r}")
+        if isinstance(change['column'], bool) or not isinstance(change['column'], (str, int)):
+            raise ValueError(f"Invalid column {change['column']!r}")
+        if row >= len(df):
+            new_rows.add(row)
+        cleaned.setdefault(change['column'], {})[row] = clean_cell(change.get('value'))
+
+    if max_new_rows is not None and len(new_rows) > max_new_rows:
+        raise ValueError(f"At most {max_new_rows} rows can be added at once")
+    last_row = max(new_rows, default=len(df) - 1)
+    if last_row - len(df) + 1 != len(new_rows):
+        raise ValueError(f"Invalid row {last_row}: new rows must follow row {len(df) - 1} without gaps")
+
+    if previous is not None:
+        for column, values in cleaned.items():
+            position = df.columns.get_loc(column) if column in df.columns else None
+            previous[column] = {
+                row: df.iat[row, position] if position is not None and row < len(df) else np.nan
+                for row in values
+            }
+
+    # Appending rows is the only edit that has to copy the frame
+    if last_row >= len(df):
+        extra = pd.DataFrame(index=pd.RangeIndex(len(df), last_row + 1), columns=df.columns)
+        df = pd.concat([df, extra.astype(df.dtypes.to_dict())])
+
+    for column, values in cleaned.items():
+        if column not in df.columns:
+            df[column] = np.nan
+
+        position = df.columns.get_loc(column)
+        rows = list(values.keys())
+        new_values = list(values.values())
+
+        current = df.iloc[:, position]
+        is_float = current.dtype.kind == 'f'
+        if is_float and not all(isinstance(value, float) for value in new_values):
+            current = current.astype(object)
+        elif not is_float and current.dtype != object and not all(isinstance(value, str) for value in new_values):
+            current = current.astype(object)
+        elif not current.to_numpy().flags.writeable:
+            # Memory-mapped from the column cache; take a private copy before writing
+            current = current.copy()
+
+        if current is not df.iloc[:, position]:
+            df.isetitem(position, current)
+        df.iloc[rows, position] = new_values
+
+    return df
+
+def get_row_order(df, sort_column=None, ascending=True, filter_column=None, filter_value=None):
+    """
+    Return the row positions of a DataFrame after an optional filter and sort
+    The filter keeps rows whose value contains filter_value (case-insensitive)
+    """
+    positions = np.arange(len(df))
+
+    if filter_column is not None and filter_value not in (None, ''):
+        column = df[filter_column].astype(str)
+        matches = column.str.contains(str(filter_value), case=False, regex=False)
+        positions = positions[matches.to_numpy(dtype=bool, na_value=False)]
+
+    if sort_column is not None:
+        column = df[sort_column].iloc[positions]
+        if column.dtype == object:
+            # Mixed numbers and text cannot be compared directly
+            column = column.astype(str)
+        order = np.argsort(column.to_numpy(), kind='stable')
+        if not ascending:
+            order = order[::-1]
+        positions = positions[order]
+
+    return positions
+
+def dataframe_window_to_columns(df, positions):
+    """Serialize selected rows column by column, with missing values as None"""
+    window = df.iloc[positions]
+    return [
+        window.iloc[:, i].astype(object).where(window.iloc[:, i].notna(), None).tolist()
+        for i in range(window.shape[1])
+    ]
+
 def get_column_stats(df, column):
     """Get basic statistics for a column"""
     stats = {}
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .data_processor import get_dataframe_fingerprint
+from .profile import PROFILE_REBUILD_FRACTION, merge_edits, profile_dataframe
+
+# Values sampled per text column when estimating the size of a frame
+SIZE_SAMPLE_VALUES = 1000
+
+
+def estimate_frame_bytes(df):
+    """
+    Approximate memory used by a DataFrame
+    Text columns are sized from an evenly spaced sample of their values, since
+    measuring every string takes longer than loading a cached frame
+    """
+    total = int(df.index.memory_usage())
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        if (isinstance(column.dtype, np.dtype) and column.dtype != object) or len(column) <= SIZE_SAMPLE_VALUES:
+            total += int(column.memory_usage(index=False, deep=True))
+        else:
+            sample = column.iloc[np.linspace(0, len(column) - 1, SIZE_SAMPLE_VALUES).astype(np.intp)]
+            total += int(sample.memory_usage(index=False, deep=True) * len(column) / SIZE_SAMPLE_VALUES)
+    return total
+
+
+class StoredFrame:
+    """A DataFrame held by the dataset store, with its size in bytes"""
+    def __init__(self, df, profile=None):
+        self.df = df
+        self.nbytes = estimate_frame_bytes(df)
+        self._fingerprint = None
+        # Column profile, usually computed at ingest; edits are merged into it
+        # until they reach PROFILE_REBUILD_FRACTION of the rows
+        self._profile = profile
+        self._edited_cells = 0
+        # Row orders computed for sorted/filtered grid windows, by query
+        self.row_orders = {}
+        # Incremented on every applied change set, for conflict detection
+        self.version = 0
+        # Held while a change set is checked and applied
+        self.edit_lock = threading.Lock()
+
+    @property
+    def fingerprint(self):
+        """Content hash of the frame, computed on first use"""
+        if self._fingerprint is None:
+            self._fingerprint = get_dataframe_fingerprint(self.df)
+        return self._fingerprint
+
+    @property
+    def profile(self):
+        """Column profile of the frame, computed on first use"""
+        if self._profile is None:
+            self._profile = profile_dataframe(self.df)
+            self._edited_cells = 0
+        return self._profile
+
+    def record_edit(self, df, changes, previous=None):
+        """
+        Account for a change set applied to the frame
+        The new fingerprint is derived from the old one and the changes, so
+        edits cost O(changes) instead of rehashing the whole frame. Frames held
+        by a DatasetStore are edited through DatasetStore.record_edit, which
+        also updates nbytes. previous holds the values the edited cells had,
+        as filled by apply_cell_changes; without it the profile is rebuilt.
+        """
+        payload = json.dumps(changes, sort_keys=True, default=str).encode('utf-8')
+        self._fingerprint = hashlib.blake2b(
+            self.fingerprint.encode('ascii') + payload, digest_size=16).hexdigest()
+        if previous is not None:
+            self._edited_cells += sum(len(cells) for cells in previous.values())
+        if previous is None or self._edited_cells > PROFILE_REBUILD_FRACTION * len(df):
+            self._profile = None
+        elif self._profile is not None:
+            self._profile = merge_edits(self._profile, df, previous)
+        self.df = df
+        self.row_orders = {}
+        self.version += 1
+
+
+class DatasetStore:
+    """
+    In-process store of DataFrames keyed by (session key, dataset id)
+    Entries are kept in least-recently-used order and evicted once the total
+    memory used by the stored frames goes over max_bytes
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_key, dataset_id):
+        """Return the stored frame for a session/dataset pair, or None"""
+        key = (session_key, dataset_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, session_key, dataset_id, df, profile=None):
+        """Store a frame, replacing any previous one, and evict old entries if needed"""
+        key = (session_key, dataset_id)
+        entry = StoredFrame(df, profile)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.nbytes
+            self._entries[key] = entry
+            self._total_bytes += entry.nbytes
+            self._evict()
+        return entry
+
+    def record_edit(self, session_key, dataset_id, entry, df, changes, previous=None):
+        """
+        Apply StoredFrame.record_edit and account for the frame's new size
+        Other frames are evicted if the edit takes the store over budget
+        """
+        nbytes = estimate_frame_bytes(df)
+        entry.record_edit(df, changes, previous)
+        key = (session_key, dataset_id)
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._total_bytes += nbytes - entry.nbytes
+                self._entries.move_to_end(key)
+            entry.nbytes = nbytes
+            self._evict()
+
+    def discard(self, session_key, dataset_id):
+        """Remove a frame from the store if present"""
+        with self._lock:
+            entry = self._entries.pop((session_key, dataset_id), None)
+            if entry is not None:
+                self._total_bytes -= entry.nbytes
+
+    def stats(self):
+        """Return the number of stored frames and the bytes they use"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _evict(self):
+        # The most recently stored frame is always kept, even if it alone is over budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.nbytes
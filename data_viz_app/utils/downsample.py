@@ -0,0 +1,136 @@
+import numpy as np
+
+DOWNSAMPLE_METHODS = ('auto', 'lttb', 'minmax', 'grid')
+
+# Method used by 'auto' for each graph type; None means the graph type is
+# never decimated because every row contributes to what is drawn
+AUTO_METHODS = {
+    'scatter': 'grid',
+    'line': 'lttb',
+    'area': 'lttb',
+    'bar': None,
+    'heatmap': None,
+    'contour': None,
+    'pie': None,
+}
+
+
+def resolve_method(graph_type, method):
+    """Return the concrete downsampling method for a graph type, or None"""
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}'")
+
+    # Unknown graph types are drawn as scatter plots
+    auto_method = AUTO_METHODS.get(graph_type, AUTO_METHODS['scatter'])
+    if auto_method is None:
+        return None
+    if method == 'auto':
+        return auto_method
+    return method
+
+
+def downsample(x, y, max_points, method):
+    """
+    Return the sorted indices of the points to keep so at most max_points remain
+    x and y are float arrays without NaN values
+    """
+    n = len(x)
+    if method is None or not max_points or n <= max_points:
+        return np.arange(n)
+
+    if method == 'lttb':
+        return lttb_indices(x, y, max_points)
+    if method == 'minmax':
+        return minmax_indices(y, max_points)
+    if method == 'grid':
+        return grid_indices(x, y, max_points)
+    raise ValueError(f"Unknown downsampling method '{method}'")
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets decimation
+    Keeps the first and last points and, from each bucket in between, the point
+    forming the largest triangle with the previously kept point and the average
+    of the next bucket. Points are taken in row order; when x is not sorted the
+    row position is used as the horizontal coordinate.
+    """
+    n = len(y)
+    if max_points < 3:
+        return endpoint_indices(n, max_points)
+
+    if not np.all(np.diff(x) >= 0):
+        x = np.arange(n, dtype='float64')
+
+    # Bucket boundaries for the n - 2 interior points
+    edges = (np.arange(max_points - 1) * (n - 2) / (max_points - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    # Average of every bucket, plus the last point as the final "next bucket"
+    counts = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        bx = x[start:end]
+        by = y[start:end]
+        area = np.abs(
+            (x[previous] - avg_x[bucket + 1]) * (by - y[previous])
+            - (x[previous] - bx) * (avg_y[bucket + 1] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+
+    return selected
+
+
+def endpoint_indices(n, max_points):
+    """Keep the first point, and the last one too when the budget allows"""
+    return np.array([0, n - 1][:max_points], dtype=np.int64)
+
+
+def minmax_indices(y, max_points):
+    """
+    Min-max bucket decimation for time series
+    Splits the rows into max_points / 2 equal buckets and keeps the lowest and
+    highest point of each, so spikes survive however dense the series is
+    """
+    n = len(y)
+    # One bucket plus both ends can already take four points
+    if max_points < 4:
+        return endpoint_indices(n, max_points)
+    buckets = (max_points - 2) // 2
+    bucket_ids = (np.arange(n) * buckets) // n
+
+    # Within each bucket, rows ordered by value: first is the min, last is the max
+    order = np.lexsort((y, bucket_ids))
+    boundaries = np.flatnonzero(np.diff(bucket_ids[order])) + 1
+    firsts = order[np.concatenate(([0], boundaries))]
+    lasts = order[np.concatenate((boundaries - 1, [n - 1]))]
+
+    return np.unique(np.concatenate((firsts, lasts, [0, n - 1])))
+
+
+def grid_indices(x, y, max_points):
+    """
+    Spatial binning for scatter plots
+    Lays a square grid of about max_points cells over the data and keeps the
+    first point falling in each occupied cell
+    """
+    cells_per_axis = max(int(np.sqrt(max_points)), 1)
+
+    def cell(values):
+        low, high = values.min(), values.max()
+        if high == low:
+            return np.zeros(len(values), dtype=np.int64)
+        scaled = (values - low) / (high - low) * cells_per_axis
+        return np.minimum(scaled.astype(np.int64), cells_per_axis - 1)
+
+    cell_ids = cell(x) * cells_per_axis + cell(y)
+    _, first_rows = np.unique(cell_ids, return_index=True)
+    return np.sort(first_rows)
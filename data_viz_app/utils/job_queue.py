@@ -0,0 +1,199 @@
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Set in each worker process by init_worker; job ids are put on it as jobs start
+_started_queue = None
+
+
+def init_worker(started_queue):
+    global _started_queue
+    _started_queue = started_queue
+
+
+def run_job(job_id, fn, args):
+    """Run a job in a worker process, first telling the queue that it has started"""
+    _started_queue.put(job_id)
+    return fn(*args)
+
+
+def get_process_owner():
+    """Name of this process as "<host>:<pid>", to record which process holds a job"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def is_owner_alive(owner):
+    """
+    Whether the process named by get_process_owner() may still be running
+    Only processes on this host can be checked; others are assumed alive
+    """
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        return bool(host)
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Job:
+    """A unit of work submitted to the job queue"""
+    def __init__(self, kind, on_start=None, on_done=None, **meta):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.meta = meta
+        self.future = None
+        self.on_start = on_start
+        self.on_done = on_done
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._finished = False
+
+    @property
+    def status(self):
+        if self._finished:
+            return FAILED if self.error is not None else DONE
+        return RUNNING if self.started_at is not None else QUEUED
+
+    def to_dict(self):
+        """JSON-serializable summary for the status endpoint"""
+        summary = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'finished_at': self.finished_at,
+        }
+        if self.error is not None:
+            summary['message'] = self.error
+        return summary
+
+
+class JobQueue:
+    """
+    Runs slow work (CSV ingestion, chart rendering) in a pool of worker processes
+    Jobs are tracked in memory by id, so they can only be polled through the
+    process that accepted them. Finished jobs are forgotten after result_ttl
+    seconds. The pool is started on first use with the "spawn" method, because
+    forking a multi-threaded web process is unsafe. Workers report each job
+    as they start it, so a job is only "running" once a worker has picked it up.
+    """
+    def __init__(self, max_workers, result_ttl):
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._started = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, on_start=None, on_done=None, **meta):
+        """
+        Run fn(*args) in a worker process and return its Job
+        on_start(job) is called in this process once a worker has started the
+        job. on_done(job) is called once the job has finished (with job.error
+        set if it failed) and before its status changes; it can raise to fail
+        the job
+        """
+        with self._lock:
+            self._prune()
+            # Registered first, so the start report can never arrive for an unknown job
+            job = Job(kind, on_start=on_start, on_done=on_done, **meta)
+            self._jobs[job.id] = job
+            try:
+                job.future = self._get_executor().submit(run_job, job.id, fn, args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for using too much memory); start a new pool
+                self._executor = None
+                job.future = self._get_executor().submit(run_job, job.id, fn, args)
+
+        job.future.add_done_callback(lambda future: self._finish(job))
+        return job
+
+    def get(self, job_id):
+        """Return a job by id, or None if it is unknown or expired"""
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """Return the number of jobs in each state"""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _get_executor(self):
+        if self._executor is None:
+            context = multiprocessing.get_context('spawn')
+            if self._started is None:
+                self._started = context.SimpleQueue()
+                threading.Thread(target=self._watch_started, name='job-queue-started', daemon=True).start()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(self._started,),
+            )
+        return self._executor
+
+    def _watch_started(self):
+        """Mark jobs as running as the workers report them, calling their on_start"""
+        while True:
+            job_id = self._started.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None or job._finished:
+                continue
+            job.started_at = time.time()
+            if job.on_start is not None:
+                try:
+                    job.on_start(job)
+                except Exception:
+                    logger.exception("Error starting %s job %s", job.kind, job.id)
+
+    def _finish(self, job):
+        try:
+            job.result = job.future.result()
+        except Exception as e:
+            job.error = str(e) or e.__class__.__name__
+        if job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                job.error = str(e) or e.__class__.__name__
+        job.finished_at = time.time()
+        job._finished = True
+        if metrics.enabled:
+            # Stages inside the worker process are not traced; only the job's duration is
+            metrics.increment(f'job.{job.kind}.count')
+            if job.error is not None:
+                metrics.increment(f'job.{job.kind}.errors')
+            metrics.observe(f'job.{job.kind}.total_ms', (job.finished_at - job.submitted_at) * 1000)
+
+    def _prune(self):
+        expiry = time.time() - self.result_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < expiry]:
+            del self._jobs[job_id]
@@ -0,0 +1,225 @@
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets grow by this factor, so percentiles are within about 5% of
+# the true value; values below MIN_BUCKET_VALUE share the first bucket
+BUCKET_GROWTH = 1.1
+MIN_BUCKET_VALUE = 0.01
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# Shared by every stage recorded while metrics are off or outside a trace
+NO_STAGE = nullcontext()
+
+
+class Histogram:
+    """
+    Log-bucketed histogram of positive values (timings in ms, sizes in bytes)
+    Memory grows with the spread of the values rather than their number, and
+    histograms of different processes can be merged by adding bucket counts.
+    """
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, value):
+        bucket = 0
+        if value > MIN_BUCKET_VALUE:
+            bucket = int(math.log(value / MIN_BUCKET_VALUE, BUCKET_GROWTH)) + 1
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Estimate the q-th quantile as the geometric middle of its bucket, within the observed range"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                break
+        estimate = MIN_BUCKET_VALUE
+        if bucket > 0:
+            estimate *= BUCKET_GROWTH ** (bucket - 0.5)
+        return min(max(estimate, self.min), self.max)
+
+    def to_dict(self):
+        summary = {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min if self.count else None,
+            'max': self.max,
+        }
+        for q in PERCENTILES:
+            summary[f'p{round(q * 100)}'] = self.percentile(q)
+        return summary
+
+
+class Metrics:
+    """
+    In-process registry of histograms and counters
+    Each web worker process keeps its own; nothing is recorded while disabled.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.started_at = time.time()
+        self._histograms = defaultdict(Histogram)
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self._lock:
+            self._histograms[name].add(value)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """JSON-serializable copy of every histogram and counter, sorted by name"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'since': self.started_at,
+                'histograms': {
+                    name: self._histograms[name].to_dict() for name in sorted(self._histograms)
+                },
+                'counters': dict(sorted(self._counters.items())),
+            }
+
+
+metrics = Metrics()
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+def configure(enabled):
+    """Turn recording on or off for this process"""
+    metrics.enabled = bool(enabled)
+
+
+class Trace:
+    """
+    Stage timings and sizes of one request (or job), recorded together
+    Stages with the same name add up, so a stage entered once per chunk or
+    series reports its total time.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.values = {}
+        self.token = None
+        self._start = time.perf_counter()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def finish(self, name=None, error=False, labels=None, **values):
+        """
+        Record the trace in the registry and write it as one structured log line
+        Timings are observed as "<name>.<stage>_ms" histograms and numeric
+        values (rows, bytes) as "<name>.<key>" histograms; labels (status,
+        method) are only logged
+        """
+        if name is not None:
+            self.name = name
+        self.values.update(values)
+        total = (time.perf_counter() - self._start) * 1000
+        metrics.increment(f'{self.name}.count')
+        if error:
+            metrics.increment(f'{self.name}.errors')
+        metrics.observe(f'{self.name}.total_ms', total)
+        for stage, elapsed in self.stages.items():
+            metrics.observe(f'{self.name}.{stage}_ms', elapsed)
+        for key, value in self.values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics.observe(f'{self.name}.{key}', value)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'event': self.name,
+                **(labels or {}),
+                'total_ms': round(total, 3),
+                'stages': {stage: round(elapsed, 3) for stage, elapsed in self.stages.items()},
+                **self.values,
+            }, default=str))
+        return total
+
+
+class _Stage:
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.trace.stages[self.name] = self.trace.stages.get(self.name, 0) + elapsed
+        return False
+
+
+def start_trace(name):
+    """
+    Start a trace and make it current for stage() and note() calls in this
+    thread or task; returns None when metrics are disabled
+    """
+    if not metrics.enabled:
+        return None
+    trace = Trace(name)
+    trace.token = _current_trace.set(trace)
+    return trace
+
+
+def end_trace(trace, **kwargs):
+    """Finish a trace from start_trace (see Trace.finish) and stop it being current"""
+    if trace is None:
+        return
+    _current_trace.reset(trace.token)
+    trace.finish(**kwargs)
+
+
+def stage(name):
+    """Time a block as a stage of the current trace; a shared no-op without one"""
+    trace = _current_trace.get()
+    if trace is None:
+        return NO_STAGE
+    return trace.stage(name)
+
+
+def note(**values):
+    """Attach values (row counts, payload bytes) to the current trace, if any"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.values.update(values)
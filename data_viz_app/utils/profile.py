@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+
+from .sketches import QUANTILES, TOP_K, ColumnSketch, Moments, to_json_number
+
+# Rows added to a column sketch at a time while profiling a frame
+PROFILE_CHUNK_ROWS = 65536
+
+# Edited cells, as a fraction of the rows, merged into a profile before it is
+# built again; merged edits leave quantiles and distinct counts approximate
+PROFILE_REBUILD_FRACTION = 0.01
+
+
+def get_column_type(column):
+    """Profile type of a column: numeric, datetime or categorical"""
+    if pd.api.types.is_numeric_dtype(column):
+        return 'numeric'
+    if pd.api.types.is_datetime64_dtype(column):
+        return 'datetime'
+    return 'categorical'
+
+
+def profile_column(column, exact=False):
+    """
+    Summarize one column: type, null and distinct counts, and either moments
+    and quantiles (numeric), range (datetime) or most frequent values (other)
+    Numeric and text columns are fed to a ColumnSketch in chunks, so large
+    columns get approximate quantiles and counts; exact=True computes them
+    from the whole column instead.
+    """
+    column_type = get_column_type(column)
+    if column_type == 'datetime':
+        count = int(column.count())
+        profile = {
+            'count': count,
+            'nulls': int(len(column) - count),
+            'distinct': int(column.nunique()),
+            'type': 'datetime',
+        }
+        if count:
+            profile['min'] = column.min().isoformat()
+            profile['max'] = column.max().isoformat()
+        return profile
+
+    if not exact:
+        if column_type == 'numeric':
+            values = column.to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            values = column.to_numpy(dtype=object)
+        sketch = ColumnSketch()
+        # An empty column still makes one update, so text columns are typed as such
+        for start in range(0, max(len(values), 1), PROFILE_CHUNK_ROWS):
+            sketch.update(values[start:start + PROFILE_CHUNK_ROWS])
+        return sketch.to_profile()
+
+    count = int(column.count())
+    profile = {
+        'count': count,
+        'nulls': int(len(column) - count),
+        'distinct': int(column.nunique()),
+        'type': column_type,
+    }
+    if column_type == 'numeric':
+        values = column.to_numpy(dtype='float64', na_value=np.nan)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return profile
+        profile.update({
+            'min': to_json_number(values.min()),
+            'max': to_json_number(values.max()),
+            'mean': to_json_number(values.mean()),
+            'std': to_json_number(values.std(ddof=1)) if len(values) > 1 else None,
+            'quantiles': {
+                str(q): to_json_number(value)
+                for q, value in zip(QUANTILES, np.quantile(values, QUANTILES))
+            },
+        })
+    else:
+        top = column.value_counts().head(TOP_K)
+        profile['top'] = [[str(value), int(n)] for value, n in top.items()]
+
+    return profile
+
+
+def profile_dataframe(df, exact=False):
+    """Profile every column of a DataFrame; columns are listed in frame order"""
+    return {
+        'rows': len(df),
+        'columns': [
+            {'name': str(name), **profile_column(df.iloc[:, position], exact=exact)}
+            for position, name in enumerate(df.columns)
+        ],
+    }
+
+
+def merge_edits(profile, df, previous):
+    """
+    Return a copy of a profile with a change set merged in, reading only the edited cells
+    previous maps each edited column to {row: value before the edit}, as
+    filled by apply_cell_changes; rows the edit appended held missing values.
+    Counts and moments stay exact. Quantiles, distinct counts and top values
+    cannot take values back out, so columns merged this way are marked
+    approximate. Columns that are new or changed type are profiled again.
+    """
+    entries = {entry['name']: entry for entry in profile['columns']}
+    edited = {str(column): cells for column, cells in previous.items()}
+    added_rows = len(df) - profile['rows']
+    columns = []
+    for position, name in enumerate(df.columns):
+        column = df.iloc[:, position]
+        entry = entries.get(str(name))
+        cells = edited.get(str(name))
+        if entry is None or entry['type'] != get_column_type(column):
+            entry = profile_column(column)
+        elif cells is not None:
+            entry = merge_column_edits(entry, column, cells)
+        elif added_rows:
+            # Appended rows are missing in every column they were not typed into
+            entry = dict(entry, nulls=entry['nulls'] + added_rows)
+        columns.append({'name': str(name), **entry})
+    return {'rows': len(df), 'columns': columns}
+
+
+def merge_column_edits(entry, column, cells):
+    """Merge the edited cells of one column into its profile entry"""
+    if entry['type'] == 'datetime' or (entry['type'] == 'numeric' and entry.get('mean') is None):
+        # Nothing to merge into: edits never write dates, and the column held
+        # no values (or infinite ones) before
+        return profile_column(column)
+    rows = np.fromiter(cells.keys(), dtype=np.intp, count=len(cells))
+    old = pd.Series(list(cells.values()), dtype=object)
+    new = column.iloc[rows]
+    count = entry['count'] - int(old.notna().sum()) + int(new.notna().sum())
+    merged = dict(entry, count=count, nulls=len(column) - count, approximate=True)
+
+    if entry['type'] == 'categorical':
+        counts = {value: n for value, n in entry['top']}
+        for value in old.dropna():
+            if str(value) in counts:
+                counts[str(value)] -= 1
+        for value in new.dropna():
+            counts[str(value)] = counts.get(str(value), 0) + 1
+        top = sorted((item for item in counts.items() if item[1] > 0), key=lambda item: -item[1])
+        merged['top'] = [list(item) for item in top[:TOP_K]]
+        return merged
+
+    old = old.dropna().to_numpy(dtype='float64')
+    new = new.dropna().to_numpy(dtype='float64')
+    moments = Moments()
+    std = entry.get('std') or 0.0
+    moments.count, moments.mean = entry['count'], entry['mean']
+    moments.m2 = std * std * (entry['count'] - 1)
+    moments.min, moments.max = entry['min'], entry['max']
+    moments.remove(old)
+    moments.update(new)
+    if moments.count == 0:
+        for key in ('min', 'max', 'mean', 'std', 'quantiles'):
+            merged.pop(key, None)
+        return merged
+
+    if len(old) and (old.min() <= entry['min'] or old.max() >= entry['max']):
+        # An edited cell held the minimum or maximum; the new range needs the whole column
+        values = column.to_numpy(dtype='float64', na_value=np.nan)
+        moments.min, moments.max = np.nanmin(values), np.nanmax(values)
+    merged.update({
+        'min': to_json_number(moments.min),
+        'max': to_json_number(moments.max),
+        'mean': to_json_number(moments.mean),
+        'std': to_json_number(moments.std) if moments.count > 1 else None,
+        # Each edited cell moves a quantile's rank by at most one row
+        'quantiles': {
+            q: to_json_number(min(max(value, moments.min), moments.max))
+            for q, value in entry['quantiles'].items()
+        },
+    })
+    return merged
+
+
+def get_column_profile(profile, column):
+    """Return the profile entry of a column, or None"""
+    for entry in profile['columns']:
+        if entry['name'] == str(column):
+            return entry
+    return None
+
+
+def profile_column_types(profile):
+    """Column types in the format returned by get_column_types"""
+    return {entry['name']: entry['type'] for entry in profile['columns']}
+
+
+def profile_column_stats(entry):
+    """Column statistics in the format returned by get_column_stats"""
+    if entry is None:
+        return {}
+    if entry['type'] == 'numeric':
+        quantiles = entry.get('quantiles', {})
+        return {
+            'min': entry.get('min'),
+            'max': entry.get('max'),
+            'mean': entry.get('mean'),
+            'median': quantiles.get('0.5'),
+            'std': entry.get('std'),
+        }
+    if entry['type'] == 'datetime':
+        return {'min': entry.get('min'), 'max': entry.get('max')}
+    return {'value_counts': dict(entry['top'][:5])}
@@ -0,0 +1,365 @@
+import numpy as np
+import pandas as pd
+
+# Quantiles recorded for numeric columns
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Most frequent values recorded for categorical columns
+TOP_K = 10
+
+# Items kept per level of a quantile sketch (rank error is roughly 1/k)
+QUANTILE_SKETCH_SIZE = 1024
+
+# HyperLogLog uses 2**precision registers (about 0.8% standard error at 14)
+DISTINCT_SKETCH_PRECISION = 14
+
+# Distinct values counted exactly (by hash) before switching to HyperLogLog
+EXACT_DISTINCT_LIMIT = 4096
+
+# Counters kept for frequent values; counts are off by at most rows / (counters + 1)
+FREQUENT_VALUE_COUNTERS = 256
+
+
+def to_json_number(value):
+    """Convert a NumPy scalar to a JSON-safe float (NaN and infinities become None)"""
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def hash_values(values):
+    """
+    64-bit hashes of the distinct non-missing values in an array
+    Numbers hash the same whether they sit in a numeric or a text column, so
+    sketches of chunks that were typed differently can be merged
+    """
+    uniques = pd.unique(values)
+    if uniques.dtype != object:
+        uniques = uniques.astype('float64')
+        return pd.util.hash_array(uniques[~np.isnan(uniques)])
+
+    is_number = np.fromiter((isinstance(value, (int, float)) for value in uniques), bool, len(uniques))
+    numbers = uniques[is_number].astype('float64')
+    text = uniques[~is_number]
+    return np.concatenate([
+        pd.util.hash_array(numbers[~np.isnan(numbers)]),
+        pd.util.hash_array(text[pd.notna(text)]),
+    ])
+
+
+class Moments:
+    """Count, mean, variance and range of a stream of numbers, merged with Chan's formulas"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        chunk = Moments()
+        chunk.count = len(values)
+        chunk.mean = float(values.mean())
+        chunk.m2 = float(((values - chunk.mean) ** 2).sum())
+        chunk.min = float(values.min())
+        chunk.max = float(values.max())
+        self.merge(chunk)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def remove(self, values):
+        """Take back values added earlier; min and max are left as they were"""
+        if len(values) == 0:
+            return
+        removed = len(values)
+        count = self.count - removed
+        if count <= 0:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        removed_mean = float(values.mean())
+        removed_m2 = float(((values - removed_mean) ** 2).sum())
+        mean = (self.mean * self.count - removed_mean * removed) / count
+        delta = removed_mean - mean
+        # Chan's merge solved for the remaining values; rounding can leave it just below zero
+        m2 = self.m2 - removed_m2 - delta * delta * count * removed / self.count
+        self.count, self.mean, self.m2 = count, mean, max(m2, 0.0)
+
+    @property
+    def std(self):
+        """Sample standard deviation, like Series.std()"""
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else None
+
+
+class QuantileSketch:
+    """
+    KLL-style quantile sketch
+    Items are kept in levels where an item at level h stands for 2**h values.
+    A level holding more than k items is sorted and every other item (starting
+    at a random offset) moves up a level, so memory grows with log(n / k).
+    Until the first compaction the sketch holds every value and is exact.
+    """
+    def __init__(self, k=QUANTILE_SKETCH_SIZE, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def exact(self):
+        return len(self.levels) == 1
+
+    def update(self, values):
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        for height, items in enumerate(other.levels):
+            if height == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[height] = np.concatenate([self.levels[height], items])
+        self._compress()
+
+    def quantiles(self, qs):
+        """Estimate the given quantiles (linear interpolation while exact, like np.quantile)"""
+        if self.exact:
+            return np.quantile(self.levels[0], qs)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([
+            np.full(len(level), 2 ** height, dtype=np.int64) for height, level in enumerate(self.levels)
+        ])
+        order = np.argsort(items, kind='stable')
+        items, ranks = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(ranks, np.asarray(qs) * (ranks[-1] - 1), side='right')
+        return items[np.minimum(positions, len(items) - 1)]
+
+    def _compress(self):
+        height = 0
+        while height < len(self.levels):
+            items = self.levels[height]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # An odd item out stays behind so the promoted items pair up exactly
+                kept = len(items) % 2
+                promoted = items[kept:][self._rng.integers(2)::2]
+                self.levels[height] = items[:kept]
+                if height + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[height + 1] = np.concatenate([self.levels[height + 1], promoted])
+            height += 1
+
+
+class DistinctSketch:
+    """
+    Distinct value counter: exact up to exact_limit values, HyperLogLog after that
+    Works on hashes from hash_values; merging takes the union of the counted values.
+    """
+    def __init__(self, precision=DISTINCT_SKETCH_PRECISION, exact_limit=EXACT_DISTINCT_LIMIT):
+        self.precision = precision
+        self.exact_limit = exact_limit
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.registers = None
+
+    @property
+    def exact(self):
+        return self.registers is None
+
+    def update(self, hashes):
+        if self.registers is None:
+            self.hashes = np.union1d(self.hashes, hashes)
+            if len(self.hashes) <= self.exact_limit:
+                return
+            hashes, self.hashes = self.hashes, None
+            self.registers = np.zeros(2 ** self.precision, dtype=np.uint8)
+        self._add(hashes)
+
+    def merge(self, other):
+        if other.registers is None:
+            self.update(other.hashes)
+            return
+        if self.registers is None:
+            hashes, self.hashes = self.hashes, None
+            self.registers = other.registers.copy()
+            self._add(hashes)
+        else:
+            np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        if self.registers is None:
+            return len(self.hashes)
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * size and empty:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = size * np.log(size / empty)
+        return estimate
+
+    def _add(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.intp)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        # Position of the leftmost 1 bit in the suffix; the float conversion is
+        # exact because suffixes are shorter than a double's mantissa
+        rank = suffix_bits + 1 - np.frexp(suffix.astype('float64'))[1]
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+
+class FrequentValues:
+    """
+    Misra-Gries summary of the most frequent values
+    Keeps at most `counters` values; when there are more, the (counters + 1)-th
+    largest count is subtracted from all of them and values that drop to zero
+    are forgotten. Merging two summaries the same way keeps the error bound.
+    """
+    def __init__(self, counters=FREQUENT_VALUE_COUNTERS):
+        self.counters = counters
+        self.counts = pd.Series([], dtype='int64')
+        self.exact = True
+
+    def update(self, values):
+        self._combine(pd.Series(values).value_counts(sort=False))
+
+    def merge(self, other):
+        self.exact = self.exact and other.exact
+        self._combine(other.counts)
+
+    def top(self, n):
+        """The n most frequent values as (value, count) pairs, most frequent first"""
+        top = self.counts.sort_values(ascending=False, kind='stable').head(n)
+        return list(top.items())
+
+    def _combine(self, counts):
+        if len(self.counts):
+            counts = pd.concat([self.counts, counts]).groupby(level=0, sort=False).sum()
+        if len(counts) > self.counters:
+            threshold = np.partition(counts.to_numpy(), -(self.counters + 1))[-(self.counters + 1)]
+            counts = counts[counts > threshold] - threshold
+            self.exact = False
+        self.counts = counts.astype('int64')
+
+
+class ColumnSketch:
+    """
+    Mergeable summary of one column, read chunk by chunk
+    A column is numeric only if every chunk was; moments and quantiles are only
+    tracked while it is, and frequent values are always tracked so a column
+    that turns out to hold text still gets its top values.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.count = 0
+        self.text = False
+        self.moments = Moments()
+        self.quantiles = QuantileSketch()
+        self.distinct = DistinctSketch()
+        self.frequent = FrequentValues()
+
+    @property
+    def approximate(self):
+        exact = self.distinct.exact and (self.frequent.exact if self.text else self.quantiles.exact)
+        return not exact
+
+    def update(self, values):
+        values = np.asarray(values)
+        self.rows += len(values)
+        values = values[pd.notna(values)]
+        self.count += len(values)
+
+        if values.dtype.kind in 'biuf':
+            if not self.text:
+                numbers = values.astype('float64')
+                self.moments.update(numbers)
+                self.quantiles.update(numbers)
+        else:
+            self.text = True
+        self.distinct.update(hash_values(values))
+        self.frequent.update(values)
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.count += other.count
+        self.text = self.text or other.text
+        if not self.text:
+            self.moments.merge(other.moments)
+            self.quantiles.merge(other.quantiles)
+        self.distinct.merge(other.distinct)
+        self.frequent.merge(other.frequent)
+
+    def to_profile(self):
+        """Column profile in the format of profile_column"""
+        profile = {
+            'count': self.count,
+            'nulls': self.rows - self.count,
+            'distinct': int(round(self.distinct.estimate())),
+        }
+        if self.approximate:
+            profile['approximate'] = True
+
+        if self.text:
+            profile['type'] = 'categorical'
+            profile['top'] = [[str(value), int(n)] for value, n in self.frequent.top(TOP_K)]
+            return profile
+
+        profile['type'] = 'numeric'
+        if self.moments.count == 0:
+            return profile
+        profile.update({
+            'min': to_json_number(self.moments.min),
+            'max': to_json_number(self.moments.max),
+            'mean': to_json_number(self.moments.mean),
+            'std': to_json_number(self.moments.std) if self.moments.count > 1 else None,
+            'quantiles': {
+                str(q): to_json_number(value)
+                for q, value in zip(QUANTILES, self.quantiles.quantiles(QUANTILES))
+            },
+        })
+        return profile
+
+
+class DatasetSketch:
+    """
+    Mergeable summaries of every column of a dataset read in chunks
+    Sketches of different chunks (or of parts of a file read by different
+    processes) can be merged, and to_profile() gives a profile in the format
+    of profile_dataframe without the data ever being held at once.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.columns = []
+
+    def update(self, df):
+        """Add a chunk of rows; columns are matched by position"""
+        while len(self.columns) < df.shape[1]:
+            self.columns.append(ColumnSketch())
+        for position in range(df.shape[1]):
+            self.columns[position].update(df.iloc[:, position].to_numpy())
+        self.rows += len(df)
+
+    def merge(self, other):
+        while len(self.columns) < len(other.columns):
+            self.columns.append(ColumnSketch())
+        for sketch, other_sketch in zip(self.columns, other.columns):
+            sketch.merge(other_sketch)
+        self.rows += other.rows
+
+    def to_profile(self, header):
+        columns = self.columns + [ColumnSketch() for _ in range(len(header) - len(self.columns))]
+        return {
+            'rows': self.rows,
+            'columns': [
+                {'name': str(name), **sketch.to_profile()}
+                for name, sketch in zip(header, columns)
+            ],
+        }
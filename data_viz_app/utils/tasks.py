@@ -0,0 +1,76 @@
+# Work that runs either in the request or in a job queue worker process.
+# Everything here takes and returns plain data (paths, DataFrames, dicts) so
+# it can be pickled to a worker without touching Django.
+from .chunked_csv import ChunkedCSVReader, read_csv_parallel
+from .column_cache import write_columns
+from .sketches import DatasetSketch
+from .visualizer import generate_plotly_figure, get_plotly_json, get_point_counts
+
+
+def ingest_csv_file(file_path, cache_path, parse_chunk_size, workers=1):
+    """
+    Parse a dataset's CSV file, write its column cache and profile its columns
+    The file is read one chunk at a time, so only one chunk of raw text is held
+    in memory; the web process memory-maps the cache once the job is done. The
+    profile is built from sketches of each chunk as it is parsed.
+    With workers > 1, byte ranges of the file are parsed in that many processes
+    and their sketches merged.
+    """
+    sketch = DatasetSketch()
+    if workers > 1:
+        header, df = read_csv_parallel(file_path, workers, sketch=sketch)
+    else:
+        reader = ChunkedCSVReader(parse_chunk_size, sketch=sketch)
+        read_csv_file(reader, file_path, parse_chunk_size)
+        header, df = reader.finish()
+
+    write_columns(df, cache_path)
+    return {
+        'columns': list(df.columns),
+        'rows_processed': len(df),
+        'profile': sketch.to_profile(header),
+    }
+
+
+def profile_csv_file(file_path, parse_chunk_size):
+    """
+    Profile a CSV file without keeping its rows
+    Memory use depends on the chunk size and the number of columns, not on the
+    number of rows, so this works for files too large to load.
+    """
+    reader = ChunkedCSVReader(parse_chunk_size, sketch=DatasetSketch(), keep_rows=False)
+    read_csv_file(reader, file_path, parse_chunk_size)
+    header, _ = reader.finish()
+    return reader.sketch.to_profile(header)
+
+
+def read_csv_file(reader, file_path, parse_chunk_size):
+    """Feed a file to a ChunkedCSVReader one block at a time"""
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(parse_chunk_size), b''):
+            reader.feed(block)
+
+
+def render_chart(df, graph_type, x_column, y_column, max_points, downsample_method, plot_encoding,
+                 bins=None, agg=None, top_n=None, color_column=None, facet_column=None, subplots=False):
+    """
+    Build the chart payload returned by generate_graph (the frame is only read)
+    Column statistics are not included; the view adds them from the column profile
+    """
+    fig = generate_plotly_figure(
+        df, graph_type, x_column, y_column,
+        max_points=max_points,
+        downsample_method=downsample_method,
+        bins=bins,
+        agg=agg,
+        top_n=top_n,
+        color_column=color_column,
+        facet_column=facet_column,
+        subplots=subplots,
+    )
+    plot_json = get_plotly_json(fig, encoding=plot_encoding)
+    return {
+        'plot': plot_json,
+        'plot_encoding': plot_encoding,
+        'points': get_point_counts(fig),
+    }
@@ -1,58 +1,122 @@
 import plotly.graph_objects as go
-import plotly.express as px
+from plotly.colors import qualitative
+from plotly.subplots import make_subplots
 import json
+import logging
 import numpy as np
 import pandas as pd
-import traceback
-
-def generate_plotly_figure(df, graph_type, x_column, y_column):
-    """Generate a Plotly figure based on the selected graph type and columns"""
-    # Print extensive debug information
-    print(f"DEBUG: Generating {graph_type} figure with x={x_column}, y={y_column}")
-    print(f"DEBUG: DataFrame shape: {df.shape}")
-    print(f"DEBUG: DataFrame columns: {df.columns.tolist()}")
-    print(f"DEBUG: DataFrame head:\n{df.head().to_string()}")
+import base64
+from .downsample import resolve_method, downsample
+from .metrics import stage, note
+from .binning import (
+    AGGREGATIONS, DEFAULT_BINS, DEFAULT_TOP_N, aggregate_by_x, histogram_2d, top_categories, format_labels,
+)
+
+logger = logging.getLogger(__name__)
+
+# Graph types drawn from aggregated bins rather than from individual rows
+BINNED_GRAPH_TYPES = ('bar', 'heatmap', 'contour')
+
+# Most bars drawn for a text x column; the most frequent categories are kept
+MAX_BAR_CATEGORIES = 1000
+
+# Graph types that cannot overlay series; several y columns get a panel each
+PANEL_GRAPH_TYPES = ('heatmap', 'contour', 'pie')
+
+# Most color groups and facet panels; less frequent values are merged into "Other"
+MAX_COLOR_GROUPS = 20
+MAX_FACETS = 12
+
+# Facet panels per row, and the height of each row of panels
+MAX_PANEL_COLUMNS = 3
+PANEL_HEIGHT = 300
+
+# Fewest points a series is downsampled to when several share max_points
+MIN_SERIES_POINTS = 200
+
+SERIES_COLORS = qualitative.Plotly
+
+CHART_NAMES = {
+    'scatter': 'Scatter Plot',
+    'line': 'Line Chart',
+    'bar': 'Bar Chart',
+    'area': 'Area Chart',
+    'heatmap': 'Heatmap',
+    'contour': 'Contour Plot',
+    'pie': 'Pie Chart',
+}
+
+def generate_plotly_figure(df, graph_type, x_column, y_column, max_points=None, downsample_method='auto',
+                           bins=None, agg=None, top_n=None, color_column=None, facet_column=None,
+                           subplots=False):
+    """
+    Generate a Plotly figure based on the selected graph type and columns
+    Line, area and scatter traces are decimated to at most max_points points.
+    Heatmaps and contours are binned on the server into a bins x bins grid of
+    counts, and bar charts get one bar per category or x bin holding the `agg`
+    of y, so their size depends on the bin count rather than the row count.
+    Pie charts show the top_n labels by summed value plus an "Other" slice.
+    y_column may also be a list of columns, drawn as one series each.
+    color_column splits every series by the values of a column, facet_column
+    draws one panel per value and subplots=True gives every y column its own
+    panel; all series are built from one projection of the needed columns.
+    The original and rendered point counts are recorded in layout.meta
+    """
+    y_columns = [y_column] if not isinstance(y_column, (list, tuple)) else list(dict.fromkeys(y_column))
+    logger.debug("Generating %s figure with x=%s, y=%s from %d rows", graph_type, x_column, y_columns, len(df))
+    note(rows=len(df))
     
     # Check if columns exist
-    if x_column not in df.columns:
-        raise ValueError(f"Column '{x_column}' not found in DataFrame")
-    if y_column not in df.columns:
-        raise ValueError(f"Column '{y_column}' not found in DataFrame")
-    
-    # Print data types and sample values
-    print(f"DEBUG: X column '{x_column}' dtype: {df[x_column].dtype}")
-    print(f"DEBUG: Y column '{y_column}' dtype: {df[y_column].dtype}")
-    print(f"DEBUG: X column sample: {df[x_column].head().tolist()}")
-    print(f"DEBUG: Y column sample: {df[y_column].head().tolist()}")
+    for column in [x_column, *y_columns, color_column, facet_column]:
+        if column is not None and column not in df.columns:
+            raise ValueError(f"Column '{column}' not found in DataFrame")
+    if not y_columns:
+        raise ValueError("At least one y column is required")
+    if color_column is not None and graph_type in PANEL_GRAPH_TYPES:
+        raise ValueError(f"{CHART_NAMES[graph_type]}s cannot be split by color")
     
     # Check for empty or all-NaN columns
     if df[x_column].isna().all():
         raise ValueError(f"X column '{x_column}' contains only NaN values")
-    if df[y_column].isna().all():
-        raise ValueError(f"Y column '{y_column}' contains only NaN values")
+    for column in y_columns:
+        if df[column].isna().all():
+            raise ValueError(f"Y column '{column}' contains only NaN values")
     
     # Force conversion to numeric, replacing non-numeric with NaN
-    try:
-        # Make a copy of the dataframe to avoid modifying the original
-        df_plot = df.copy()
-        
-        # Convert columns to numeric, coercing errors to NaN
-        df_plot[x_column] = pd.to_numeric(df_plot[x_column], errors='coerce')
-        df_plot[y_column] = pd.to_numeric(df_plot[y_column], errors='coerce')
-        
-        print(f"DEBUG: After conversion - X sample: {df_plot[x_column].head().tolist()}")
-        print(f"DEBUG: After conversion - Y sample: {df_plot[y_column].head().tolist()}")
-    except Exception as e:
-        print(f"ERROR: Numeric conversion failed: {str(e)}")
-        print(traceback.format_exc())
-        df_plot = df.copy()  # Use original if conversion fails
+    # Only the plotted columns are projected, once for every series; the
+    # source frame is never copied or modified
+    with stage('coerce'):
+        df_plot = project_plot_columns(df, graph_type, x_column, y_columns)
     
-    # Drop NaN values and check if we still have data
-    df_clean = df_plot.dropna(subset=[x_column, y_column])
-    print(f"DEBUG: Clean DataFrame shape: {df_clean.shape}")
+    # Heatmaps, contours and pies cannot be overlaid, so each series gets a panel
+    if len(y_columns) > 1 and graph_type in PANEL_GRAPH_TYPES:
+        subplots = True
     
-    if df_clean.empty:
-        print("WARNING: No valid data points after cleaning")
+    # One series per y column and color group, drawn in every facet panel
+    # Rows missing x or y are dropped here, as positions, without copying the frame
+    series = []
+    with stage('dropna'):
+        color_codes, color_labels = group_codes(df, color_column, MAX_COLOR_GROUPS)
+        facet_codes, facet_labels = group_codes(df, facet_column, MAX_FACETS)
+        x_values = df_plot[x_column]
+        for y_position, column in enumerate(y_columns):
+            valid = x_values.notna().to_numpy() & df_plot[column].notna().to_numpy()
+            codes = color_codes * len(facet_labels) + facet_codes
+            for group, rows in split_groups(codes, valid, len(color_labels) * len(facet_labels)):
+                color, facet = divmod(group, len(facet_labels))
+                series.append({
+                    'y_column': column,
+                    'y_position': y_position,
+                    'color': color,
+                    'color_label': color_labels[color],
+                    'facet': facet,
+                    'facet_label': facet_labels[facet],
+                    'rows': rows,
+                })
+    logger.debug("Built %d series", len(series))
+    
+    if not series:
+        logger.warning("No valid data points after cleaning for x=%s, y=%s", x_column, y_columns)
         # Create an empty figure with a message
         fig = go.Figure()
         fig.update_layout(
@@ -70,143 +134,118 @@ def generate_plotly_figure(df, graph_type, x_column, y_column):
         )
         return fig
     
-    # Print clean data sample
-    print(f"DEBUG: Clean X sample: {df_clean[x_column].head().tolist()}")
-    print(f"DEBUG: Clean Y sample: {df_clean[y_column].head().tolist()}")
-    
     try:
-        # Create figure based on graph type with explicit marker settings
-        if graph_type == 'scatter':
-            # Create a scatter plot with explicit marker settings
-            fig = go.Figure()
-            fig.add_trace(
-                go.Scatter(
-                    x=df_clean[x_column].tolist(),  # Convert to list to ensure serialization
-                    y=df_clean[y_column].tolist(),  # Convert to list to ensure serialization
-                    mode='markers',
-                    marker=dict(
-                        size=10,
-                        color='rgba(0, 123, 255, 0.8)',
-                        line=dict(width=1, color='rgb(0, 0, 0)')
-                    ),
-                    name=y_column
-                )
-            )
-            fig.update_layout(
-                title=f'Scatter Plot of {y_column} vs {x_column}',
-                xaxis_title=x_column,
-                yaxis_title=y_column
-            )
-        elif graph_type == 'line':
-            # Create a line chart with explicit line and marker settings
-            fig = go.Figure()
-            fig.add_trace(
-                go.Scatter(
-                    x=df_clean[x_column].tolist(),  # Convert to list to ensure serialization
-                    y=df_clean[y_column].tolist(),  # Convert to list to ensure serialization
-                    mode='lines+markers',
-                    line=dict(width=3, color='rgb(0, 123, 255)'),
-                    marker=dict(
-                        size=8,
-                        color='rgb(0, 123, 255)',
-                        line=dict(width=1, color='rgb(0, 0, 0)')
-                    ),
-                    name=y_column
-                )
-            )
-            fig.update_layout(
-                title=f'Line Chart of {y_column} vs {x_column}',
-                xaxis_title=x_column,
-                yaxis_title=y_column
-            )
-        elif graph_type == 'bar':
-            # Create a bar chart with explicit color
+        # Binned charts: bins per axis and how y is aggregated per bar
+        x_bins, y_bins = parse_bins(bins)
+        if agg is None:
+            agg = 'sum'
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation '{agg}'")
+        if top_n is None:
+            top_n = DEFAULT_TOP_N
+        
+        # The point budget is shared by all series
+        method = resolve_method(graph_type, downsample_method)
+        series_points = max_points
+        if max_points is not None and len(series) > 1:
+            series_points = max(max_points // len(series), MIN_SERIES_POINTS)
+        
+        single = len(series) == 1 and facet_column is None and not subplots
+        panel_rows, panel_columns = get_panel_grid(
+            len(y_columns) if subplots else 1, len(facet_labels) if facet_column is not None else 1,
+        )
+        if single:
             fig = go.Figure()
-            fig.add_trace(
-                go.Bar(
-                    x=df_clean[x_column].tolist(),  # Convert to list to ensure serialization
-                    y=df_clean[y_column].tolist(),  # Convert to list to ensure serialization
-                    marker_color='rgb(0, 123, 255)',
-                    name=y_column
-                )
-            )
-            fig.update_layout(
-                title=f'Bar Chart of {y_column} vs {x_column}',
-                xaxis_title=x_column,
-                yaxis_title=y_column
+        else:
+            fig = make_subplots(
+                rows=panel_rows,
+                cols=panel_columns,
+                specs=[[{'type': 'domain' if graph_type == 'pie' else 'xy'}] * panel_columns] * panel_rows,
+                subplot_titles=get_panel_titles(y_columns, facet_labels, subplots, facet_column),
             )
-        elif graph_type == 'area':
-            # Create an area chart
-            fig = go.Figure()
-            fig.add_trace(
-                go.Scatter(
-                    x=df_clean[x_column].tolist(),  # Convert to list to ensure serialization
-                    y=df_clean[y_column].tolist(),  # Convert to list to ensure serialization
-                    mode='lines',
-                    fill='tozeroy',
-                    line=dict(width=1, color='rgb(0, 123, 255)'),
-                    fillcolor='rgba(0, 123, 255, 0.3)',
-                    name=y_column
+        
+        x_array = x_values.to_numpy()
+        y_arrays = {column: df_plot[column].to_numpy(dtype='float64') for column in y_columns}
+        original_points = rendered_points = 0
+        downsampled = False
+        for index, item in enumerate(series):
+            x = x_array[item['rows']]
+            y = y_arrays[item['y_column']][item['rows']]
+            original_points += len(x)
+            
+            # Decimate point-based traces before they are built
+            if method is not None:
+                with stage('downsample'):
+                    keep = downsample(x.astype('float64'), y, series_points, method)
+                if len(keep) < len(x):
+                    x, y = x[keep], y[keep]
+                    downsampled = True
+            
+            with stage('trace_build'):
+                trace, points = build_trace(
+                    graph_type, x, y, x_column, item['y_column'],
+                    x_bins=x_bins, y_bins=y_bins, agg=agg, top_n=top_n,
                 )
-            )
+            rendered_points += points
+            
+            if single:
+                with stage('trace_build'):
+                    fig.add_trace(trace)
+                continue
+            
+            # Series with the same y column and color share a legend entry across panels
+            name = item['y_column'] if color_column is None else item['color_label']
+            if color_column is not None and len(y_columns) > 1:
+                name = f"{item['y_column']} · {item['color_label']}"
+            color_index = item['y_position'] * len(color_labels) + item['color']
+            style_trace(trace, graph_type, SERIES_COLORS[color_index % len(SERIES_COLORS)])
+            trace.update(name=name, legendgroup=name)
+            if graph_type in PANEL_GRAPH_TYPES or any(
+                    other['y_position'] == item['y_position'] and other['color'] == item['color']
+                    for other in series[:index]):
+                trace.update(showlegend=False)
+            
+            panel = item['facet']
+            if subplots:
+                panel += item['y_position'] * (len(facet_labels) if facet_column is not None else 1)
+            row, column = divmod(panel, panel_columns)
+            with stage('trace_build'):
+                fig.add_trace(trace, row=row + 1, col=column + 1)
+        
+        logger.debug("Rendering %d of %d points (method=%s)", rendered_points, original_points, method)
+        note(points=rendered_points)
+        if single:
             fig.update_layout(
-                title=f'Area Chart of {y_column} vs {x_column}',
-                xaxis_title=x_column,
-                yaxis_title=y_column
-            )
-        elif graph_type == 'heatmap':
-            # For heatmap, we need to pivot the data
-            # This is a simplified version, might need adjustment based on your data
-            fig = px.density_heatmap(
-                df_clean, 
-                x=x_column, 
-                y=y_column, 
-                title=f'Heatmap of {y_column} vs {x_column}',
-                color_continuous_scale='Blues'
-            )
-        elif graph_type == 'contour':
-            fig = px.density_contour(
-                df_clean, 
-                x=x_column, 
-                y=y_column, 
-                title=f'Contour Plot of {y_column} vs {x_column}'
-            )
-        elif graph_type == 'pie':
-            # For pie chart, we use x as labels and y as values
-            fig = px.pie(
-                df_clean, 
-                names=x_column, 
-                values=y_column, 
-                title=f'Pie Chart of {y_column} by {x_column}'
+                title=get_chart_title(graph_type, x_column, y_columns),
+                **({} if graph_type == 'pie' else {
+                    'xaxis_title': x_column,
+                    'yaxis_title': f'{y_columns[0]} ({agg})' if graph_type == 'bar' else y_columns[0],
+                }),
             )
         else:
-            # Default to scatter plot
-            fig = go.Figure()
-            fig.add_trace(
-                go.Scatter(
-                    x=df_clean[x_column].tolist(),  # Convert to list to ensure serialization
-                    y=df_clean[y_column].tolist(),  # Convert to list to ensure serialization
-                    mode='markers',
-                    marker=dict(
-                        size=10,
-                        color='rgba(0, 123, 255, 0.8)',
-                        line=dict(width=1, color='rgb(0, 0, 0)')
-                    ),
-                    name=y_column
-                )
-            )
-            fig.update_layout(
-                title=f'Scatter Plot of {y_column} vs {x_column}',
-                xaxis_title=x_column,
-                yaxis_title=y_column
-            )
+            title = get_chart_title(graph_type, x_column, y_columns)
+            if color_column is not None:
+                title += f' by {color_column}'
+            if facet_column is not None:
+                title += f', per {facet_column}'
+            fig.update_layout(title=title, barmode='group')
+            if graph_type == 'heatmap':
+                # Heatmap panels share one color scale
+                fig.update_layout(coloraxis=dict(colorscale='Blues', colorbar=dict(title='count')))
+            if graph_type != 'pie':
+                fig.update_xaxes(title_text=x_column)
         
         # Update layout for better appearance
         fig.update_layout(
+            meta={'points': {
+                'original': original_points,
+                'rendered': rendered_points,
+                'method': get_render_method(graph_type, method, downsampled),
+            }},
             template='plotly_white',
-            margin=dict(l=40, r=40, t=50, b=40),
+            margin=dict(l=40, r=40, t=50 if single else 80, b=40),
             autosize=True,
-            height=500,
+            height=max(500, PANEL_HEIGHT * panel_rows),
             showlegend=True,
             legend=dict(
                 orientation="h",
@@ -217,12 +256,10 @@ def generate_plotly_figure(df, graph_type, x_column, y_column):
             )
         )
         
-        print("DEBUG: Figure created successfully")
         return fig
     
     except Exception as e:
-        print(f"ERROR: Figure creation failed: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Figure creation failed")
         # Create an error figure
         fig = go.Figure()
         fig.update_layout(
@@ -240,6 +277,225 @@ def generate_plotly_figure(df, graph_type, x_column, y_column):
         )
         return fig
 
+def project_plot_columns(df, graph_type, x_column, y_columns):
+    """
+    Project the plotted columns, coerced to numbers (non-numeric cells become NaN)
+    Bar and pie charts group by x, which keeps its categories when it holds text
+    """
+    plot_columns = list(dict.fromkeys([x_column, *y_columns]))
+    try:
+        # Convert columns to numeric, coercing errors to NaN
+        df_plot = pd.DataFrame({
+            column: pd.to_numeric(df[column], errors='coerce') for column in plot_columns
+        })
+        
+        # Bar and pie charts group by x, which may hold categories instead of numbers
+        if (graph_type in ('bar', 'pie') and x_column not in y_columns
+                and df_plot[x_column].count() < df[x_column].count()):
+            df_plot[x_column] = df[x_column]
+    except Exception:
+        logger.exception("Numeric conversion failed")
+        df_plot = df[plot_columns]  # Use original columns if conversion fails
+    return df_plot
+
+def group_codes(df, column, max_groups):
+    """
+    Group code of every row for a color or facet column, and the group labels
+    The max_groups most frequent values keep a group each and the rest share an
+    "Other" group; missing values get -1. Without a column there is one group.
+    """
+    if column is None:
+        return np.zeros(len(df), dtype=np.int64), np.array([None], dtype=object)
+    
+    try:
+        codes, uniques = pd.factorize(df[column], sort=True)
+    except TypeError:
+        # Mixed numbers and text cannot be sorted
+        codes, uniques = pd.factorize(df[column])
+    labels = format_labels(np.asarray(uniques))
+    if len(uniques) > max_groups:
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        kept = np.sort(np.argsort(-counts, kind='stable')[:max_groups])
+        remap = np.full(len(uniques), max_groups)
+        remap[kept] = np.arange(max_groups)
+        codes = np.where(codes >= 0, remap[codes], -1)
+        labels = np.append(labels[kept], f'Other ({len(uniques) - max_groups} values)')
+    return codes, labels
+
+def split_groups(codes, valid, size):
+    """
+    Row positions of every non-empty group, in group order
+    Rows are sorted by group once (stably, so each group keeps the row order)
+    instead of masking the frame once per group
+    """
+    codes = np.where(valid & (codes >= 0), codes, size)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=size + 1))
+    start = 0
+    for group in range(size):
+        if bounds[group] > start:
+            yield group, order[start:bounds[group]]
+        start = bounds[group]
+
+def build_trace(graph_type, x, y, x_column, y_column, x_bins=DEFAULT_BINS, y_bins=DEFAULT_BINS,
+                agg='sum', top_n=DEFAULT_TOP_N):
+    """Build the trace of one series and return it with its number of rendered points"""
+    if graph_type == 'line':
+        # Create a line chart with explicit line and marker settings
+        return go.Scatter(
+            x=x,  # Arrays are serialized by get_plotly_json
+            y=y,  # Arrays are serialized by get_plotly_json
+            mode='lines+markers',
+            line=dict(width=3, color='rgb(0, 123, 255)'),
+            marker=dict(
+                size=8,
+                color='rgb(0, 123, 255)',
+                line=dict(width=1, color='rgb(0, 0, 0)')
+            ),
+            name=y_column
+        ), len(x)
+    if graph_type == 'bar':
+        # One bar per category or x bin instead of one per row
+        bars = aggregate_by_x(x, y, bins=x_bins, agg=agg, max_categories=MAX_BAR_CATEGORIES)
+        return go.Bar(
+            x=bars['x'],  # Arrays are serialized by get_plotly_json
+            y=bars['y'],  # Arrays are serialized by get_plotly_json
+            width=bars['width'],
+            marker_color='rgb(0, 123, 255)',
+            name=f'{agg} of {y_column}'
+        ), len(bars['x'])
+    if graph_type == 'area':
+        return go.Scatter(
+            x=x,  # Arrays are serialized by get_plotly_json
+            y=y,  # Arrays are serialized by get_plotly_json
+            mode='lines',
+            fill='tozeroy',
+            line=dict(width=1, color='rgb(0, 123, 255)'),
+            fillcolor='rgba(0, 123, 255, 0.3)',
+            name=y_column
+        ), len(x)
+    if graph_type in ('heatmap', 'contour'):
+        # Count points per cell on the server; only the grid is sent
+        x_centers, y_centers, counts = histogram_2d(x.astype('float64'), y, x_bins, y_bins)
+        hovertemplate = f'{x_column}=%{{x}}<br>{y_column}=%{{y}}<br>count=%{{z}}<extra></extra>'
+        if graph_type == 'heatmap':
+            trace = go.Heatmap(
+                x=x_centers,
+                y=y_centers,
+                z=counts,
+                colorscale='Blues',
+                colorbar=dict(title='count'),
+                hovertemplate=hovertemplate,
+            )
+        else:
+            trace = go.Contour(
+                x=x_centers,
+                y=y_centers,
+                z=counts,
+                contours_coloring='lines',
+                showscale=False,
+                hovertemplate=hovertemplate,
+            )
+        return trace, counts.size
+    if graph_type == 'pie':
+        # For pie chart, we use x as labels and y as values, summed per
+        # label and limited to the largest top_n slices plus "Other"
+        labels, values = top_categories(x, y, top_n)
+        return go.Pie(
+            labels=labels,
+            values=values,
+            sort=False,
+            hovertemplate=f'{x_column}=%{{label}}<br>{y_column}=%{{value}}<extra></extra>',
+        ), len(labels)
+    
+    # Scatter plots, and the default for unknown graph types
+    return go.Scatter(
+        x=x,  # Arrays are serialized by get_plotly_json
+        y=y,  # Arrays are serialized by get_plotly_json
+        mode='markers',
+        marker=dict(
+            size=10,
+            color='rgba(0, 123, 255, 0.8)',
+            line=dict(width=1, color='rgb(0, 0, 0)')
+        ),
+        name=y_column
+    ), len(x)
+
+def style_trace(trace, graph_type, color):
+    """Give a series of a multi-series chart its own color"""
+    if graph_type in ('scatter', 'line'):
+        trace.update(marker_color=color, marker_size=6 if graph_type == 'scatter' else 5)
+        if graph_type == 'line':
+            trace.update(line=dict(width=2, color=color))
+    elif graph_type == 'area':
+        trace.update(line_color=color, fillcolor=None, fill='tozeroy')
+    elif graph_type == 'bar':
+        trace.update(marker_color=color)
+    elif graph_type == 'heatmap':
+        trace.update(coloraxis='coloraxis')
+
+def get_chart_title(graph_type, x_column, y_columns):
+    """Chart title naming the plotted columns"""
+    joined = ', '.join(str(column) for column in y_columns)
+    if graph_type == 'pie':
+        return f'Pie Chart of {joined} by {x_column}'
+    return f'{CHART_NAMES.get(graph_type, CHART_NAMES["scatter"])} of {joined} vs {x_column}'
+
+def get_panel_grid(series_panels, facet_panels):
+    """
+    Rows and columns of subplot panels
+    With panels per y column and per facet value, rows are y columns and
+    columns are facet values; a single kind of panel wraps into a grid
+    """
+    if series_panels > 1 and facet_panels > 1:
+        return series_panels, facet_panels
+    panels = series_panels * facet_panels
+    columns = min(panels, MAX_PANEL_COLUMNS)
+    return -(-panels // columns), columns
+
+def get_panel_titles(y_columns, facet_labels, subplots, facet_column):
+    """Subplot titles, in the order panels are laid out"""
+    if facet_column is None:
+        return list(y_columns) if subplots else None
+    facets = [f'{facet_column} = {label}' for label in facet_labels]
+    if not subplots:
+        return facets
+    return [f'{column}, {facet}' for column in y_columns for facet in facets]
+
+def parse_bins(bins):
+    """Return (x_bins, y_bins) from a bin count or an [x_bins, y_bins] pair"""
+    if bins is None:
+        return DEFAULT_BINS, DEFAULT_BINS
+    if isinstance(bins, (list, tuple)):
+        if len(bins) != 2:
+            raise ValueError("bins must be a number or an [x, y] pair")
+        x_bins, y_bins = bins
+    else:
+        x_bins = y_bins = bins
+    for count in (x_bins, y_bins):
+        # bool is an int subclass, and int() would truncate floats
+        if isinstance(count, bool) or not isinstance(count, (int, str)):
+            raise TypeError(f"bins must be integers, not {count!r}")
+    x_bins, y_bins = int(x_bins), int(y_bins)
+    if x_bins < 1 or y_bins < 1:
+        raise ValueError("bins must be at least 1")
+    return x_bins, y_bins
+
+def get_render_method(graph_type, method, downsampled):
+    """How the rendered points were derived from the rows: a downsampling method, 'bin' or None"""
+    if graph_type in BINNED_GRAPH_TYPES:
+        return 'bin'
+    if graph_type == 'pie':
+        return 'top_n'
+    return method if downsampled else None
+
+def get_point_counts(fig):
+    """Return the original/rendered point counts recorded by generate_plotly_figure"""
+    meta = fig.layout.meta
+    if isinstance(meta, dict) and 'points' in meta:
+        return meta['points']
+    return None
+
 class PlotlyJSONEncoder(json.JSONEncoder):
     """Custom JSON encoder for Plotly figures"""
     def default(self, obj):
@@ -255,25 +511,116 @@ class PlotlyJSONEncoder(json.JSONEncoder):
             if pd.isna(obj):  # Handle NaN values
                 return None
             return json.JSONEncoder.default(self, obj)
-        except Exception as e:
-            print(f"ERROR in JSON encoding: {str(e)}")
+        except Exception:
+            logger.exception("JSON encoding failed for %r", type(obj))
             return None
 
-def get_plotly_json(fig):
-    """Convert a Plotly figure to JSON for rendering in the browser"""
+PLOT_ENCODINGS = ('json', 'base64')
+
+# Smallest array worth encoding; shorter ones are cheaper as plain JSON
+MIN_TYPED_ARRAY_LENGTH = 16
+
+# Values sampled when estimating the plain JSON size of a long array
+JSON_SIZE_SAMPLE_VALUES = 1000
+
+def estimate_json_length(array):
+    """
+    Characters the values of a numeric array take as a plain JSON list
+    Long arrays are sized from an evenly spaced sample of their values
+    """
+    values = array.ravel()
+    if len(values) <= JSON_SIZE_SAMPLE_VALUES:
+        return len(json.dumps(values.tolist()))
+    sample = values[np.linspace(0, len(values) - 1, JSON_SIZE_SAMPLE_VALUES).astype(np.intp)]
+    return int(len(json.dumps(sample.tolist())) * len(values) / JSON_SIZE_SAMPLE_VALUES)
+
+def to_typed_array(value):
+    """
+    Encode a numeric list or array as a Plotly.js typed array ({dtype, bdata})
+    Returns None when the value is not a purely numeric 1D or 2D array, or
+    when the plain JSON list would be no larger (small integers, short decimals)
+    """
     try:
-        # Convert the figure to a dictionary
-        fig_dict = fig.to_dict()
-        
-        # Serialize the dictionary to JSON using the custom encoder
-        json_str = json.dumps(fig_dict, cls=PlotlyJSONEncoder)
-        
-        print(f"DEBUG: JSON string length: {len(json_str)}")
-        # Print a sample of the JSON to verify it contains data
-        print(f"DEBUG: JSON sample (first 200 chars): {json_str[:200]}...")
+        array = np.asarray(value)
+    except ValueError:
+        # Ragged nested lists
+        return None
+    if array.dtype.kind not in 'iuf' or array.ndim not in (1, 2) or array.size < MIN_TYPED_ARRAY_LENGTH:
+        return None
+
+    original = array
+
+    # Use the narrowest type that holds every value exactly
+    int32 = np.iinfo(np.int32)
+    if array.dtype.kind == 'f' and np.isfinite(array).all() and (array == np.trunc(array)).all():
+        if int32.min <= array.min() and array.max() <= int32.max:
+            array = array.astype(np.int64)
+
+    if array.dtype.kind in 'iu' and int32.min <= array.min() and array.max() <= int32.max:
+        array = array.astype('<i4')
+        dtype = 'i4'
+    elif array.dtype.kind == 'f' and (array.astype('<f4') == array)[np.isfinite(array)].all():
+        array = array.astype('<f4')
+        dtype = 'f4'
+    else:
+        # Plotly.js has no 64-bit integer type
+        array = array.astype('<f8')
+        dtype = 'f8'
+
+    # Base64 takes 4 characters per 3 bytes
+    if 4 * -(-array.nbytes // 3) >= estimate_json_length(original):
+        return None
+
+    typed = {
+        'dtype': dtype,
+        'bdata': base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii'),
+    }
+    if array.ndim == 2:
+        typed['shape'] = f"{array.shape[0]},{array.shape[1]}"
+    return typed
+
+def encode_typed_arrays(obj):
+    """Replace numeric arrays inside trace attributes with typed arrays, recursively"""
+    if isinstance(obj, dict):
+        return {key: encode_typed_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        typed = to_typed_array(obj)
+        if typed is not None:
+            return typed
+        if isinstance(obj, np.ndarray):
+            return obj
+        return [encode_typed_arrays(item) if isinstance(item, dict) else item for item in obj]
+    return obj
+
+def get_plotly_json(fig, encoding='json'):
+    """
+    Convert a Plotly figure to JSON for rendering in the browser
+    With encoding='base64', numeric trace arrays are sent as base64 typed
+    arrays, which Plotly.js decodes without parsing every number as text
+    """
+    if encoding not in PLOT_ENCODINGS:
+        raise ValueError(f"Unknown plot encoding '{encoding}'")
+
+    try:
+        with stage('serialize'):
+            # Convert the figure to a dictionary
+            # Built from the traces directly: fig.to_dict() deep-copies the whole
+            # figure and, on recent Plotly versions, base64-encodes arrays regardless
+            # of the requested encoding
+            fig_dict = {
+                'data': [trace.to_plotly_json() for trace in fig.data],
+                'layout': fig.layout.to_plotly_json(),
+            }
+            
+            if encoding == 'base64':
+                fig_dict['data'] = [encode_typed_arrays(trace) for trace in fig_dict.get('data', [])]
+            
+            # Serialize the dictionary to JSON using the custom encoder
+            json_str = json.dumps(fig_dict, cls=PlotlyJSONEncoder)
         
+        note(plot_bytes=len(json_str))
+        logger.debug("Plot JSON is %d characters (%s encoding)", len(json_str), encoding)
         return json_str
     except Exception as e:
-        print(f"ERROR: JSON conversion failed: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("JSON conversion failed")
         return json.dumps({"error": str(e)})
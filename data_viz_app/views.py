@@ -1,25 +1,311 @@
 import os
 import json
+import time
+import hashlib
+import logging
+import numpy as np
 import pandas as pd
 from django.shortcuts import render, redirect
 from django.http import JsonResponse, HttpResponse
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.conf import settings
-from .models import Dataset, DataTable
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.utils.cache import get_conditional_response, patch_cache_control
+from .models import Dataset, DataTable, get_column_cache_path
 from .forms import DatasetUploadForm, GraphSelectionForm
+from .upload_handlers import (
+    StreamingCSVUploadHandler,
+    StreamedCSVUpload,
+    get_upload_id,
+    get_upload_progress,
+    update_upload_progress,
+    store_upload,
+)
 from .utils.data_processor import (
     read_and_preprocess_csv,
     create_dataframe_from_preprocessed_data,
     get_dataframe_from_json,
-    get_column_types,
     dataframe_to_json,
-    get_column_stats
+    get_row_order,
+    dataframe_window_to_columns,
+    apply_cell_changes,
 )
-from .utils.visualizer import generate_plotly_figure, get_plotly_json
+from .utils.visualizer import PLOT_ENCODINGS, parse_bins
+from .utils.downsample import DOWNSAMPLE_METHODS
+from .utils.binning import AGGREGATIONS, DEFAULT_TOP_N
+from .utils.profile import profile_dataframe, profile_column_types, get_column_profile, profile_column_stats
+from .utils.dataset_store import DatasetStore
+from .utils.column_cache import read_columns, write_columns, remove_columns, pack_columns, unpack_columns
+from .utils.job_queue import JobQueue, DONE, FAILED, get_process_owner, is_owner_alive
+from .utils.tasks import ingest_csv_file, render_chart
+from .utils.metrics import metrics, stage, note
+
+logger = logging.getLogger(__name__)
+
+# Frames are kept per session and dataset so concurrent users never share data
+dataset_store = DatasetStore(max_bytes=settings.DATASET_STORE_MAX_BYTES)
+
+# Dataset id of the session's own data: frames sent by process_data and
+# spreadsheet edits. Edits to an uploaded dataset or saved table are made to a
+# copy under this id, so the stored original is never changed. The workspace is
+# also written to a column cache, so it is reloaded after being evicted or by
+# another worker process; its version and edit lock are still per process, so
+# concurrent edits through two workers are not detected as conflicts.
+WORKSPACE_DATASET_ID = 'workspace'
+
+# Saved tables are opened under dataset ids of the form "table:<pk>"
+TABLE_ID_PREFIX = 'table:'
+
+# Ingestion and heavy chart rendering can run here instead of in the request
+job_queue = JobQueue(max_workers=settings.JOB_WORKERS, result_ttl=settings.JOB_RESULT_TTL)
+
+def get_session_key(request):
+    """Return the session key, creating the session if needed"""
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+def get_current_dataframe(request):
+    """Resolve the active DataFrame for this session"""
+    entry = get_current_entry(request)
+    return entry.df if entry is not None else None
+
+def get_current_entry(request):
+    """Resolve the dataset store entry holding this session's active DataFrame"""
+    dataset_id = request.session.get('dataset_id')
+    if dataset_id is None:
+        return None
+    return open_stored_frame(get_session_key(request), dataset_id)[0]
+
+def open_stored_frame(session_key, dataset_id):
+    """
+    Put a dataset or saved table in the store from the fastest representation available
+    Returns (entry, tier), where tier says what served it: 'memory' (already in
+    the store), 'cache' (memory-mapped column cache), 'blob' (a saved table's
+    packed columns) or 'csv' (the uploaded file, parsed again). Returns
+    (None, None) when the frame cannot be loaded.
+    """
+    entry = dataset_store.get(session_key, dataset_id)
+    if entry is not None:
+        return entry, 'memory'
+
+    if dataset_id == WORKSPACE_DATASET_ID:
+        df = read_columns(get_workspace_cache_path(session_key))
+        if df is None:
+            return None, None
+        return dataset_store.put(session_key, dataset_id, df), 'cache'
+
+    if dataset_id.startswith(TABLE_ID_PREFIX):
+        try:
+            data_table = DataTable.objects.get(pk=dataset_id[len(TABLE_ID_PREFIX):])
+        except (DataTable.DoesNotExist, ValueError):
+            return None, None
+        df, tier = read_columns(data_table.column_cache_path), 'cache'
+        if df is None:
+            try:
+                df, tier = load_data_table(data_table), 'blob'
+            except (OSError, ValueError):
+                return None, None
+        return dataset_store.put(session_key, dataset_id, df, profile=data_table.profile), tier
+
+    try:
+        dataset = Dataset.objects.get(pk=dataset_id)
+    except (Dataset.DoesNotExist, ValueError):
+        return None, None
+
+    df, tier = read_columns(dataset.column_cache_path), 'cache'
+    if df is None:
+        # Still being ingested by a background job, or ingestion failed
+        if dataset.status != Dataset.DONE:
+            return None, None
+        try:
+            df, tier = load_dataset_file(dataset), 'csv'
+        except OSError:
+            return None, None
+    elif dataset.profile is None:
+        # Datasets ingested before profiles existed are profiled once here
+        dataset.profile = profile_dataframe(df)
+        dataset.save(update_fields=['profile'])
+
+    return dataset_store.put(session_key, dataset_id, df, profile=dataset.profile), tier
+
+def get_workspace_cache_path(session_key):
+    """Column cache directory of a session's workspace"""
+    return get_column_cache_path(f"workspace-{session_key}")
+
+def save_workspace(session_key, df):
+    """Write a session's workspace to its column cache"""
+    try:
+        with stage('persist'):
+            write_columns(df, get_workspace_cache_path(session_key), overwrite=True)
+    except Exception as e:
+        # The frame stays in this worker's store, but is lost once evicted
+        logger.warning("Could not write workspace for session %s: %s", session_key, e)
+
+def load_dataset_file(dataset):
+    """Parse a dataset's CSV file and write its column cache for other workers"""
+    # Large files are parsed in byte ranges by INGEST_WORKERS processes
+    with stage('parse'):
+        header, cleaned_data = read_and_preprocess_csv(dataset.file.path, workers=settings.INGEST_WORKERS)
+        df = create_dataframe_from_preprocessed_data(header, cleaned_data)
+    cache_dataset_columns(dataset, df)
+    if dataset.profile is None:
+        with stage('profile'):
+            dataset.profile = profile_dataframe(df)
+        dataset.save(update_fields=['profile'])
+    return df
+
+def cache_dataset_columns(dataset, df):
+    """Persist parsed columns so workers can memory-map them instead of re-parsing"""
+    try:
+        write_columns(df, dataset.column_cache_path)
+    except Exception as e:
+        # The cache is an optimization; the CSV remains the source of truth
+        logger.warning("Could not write column cache for dataset %s: %s", dataset.pk, e)
+
+def find_processed_copy(content_hash):
+    """
+    Return (DataFrame, profile) of an ingested dataset with the same content, or None
+    The frame is memory-mapped from the column cache the datasets share.
+    """
+    original = Dataset.objects.filter(
+        content_hash=content_hash, status=Dataset.DONE, profile__isnull=False,
+    ).first()
+    if original is None:
+        return None
+    df = read_columns(original.column_cache_path)
+    if df is None:
+        return None
+    return df, original.profile
 
-# Global variable to store the current dataframe
-# In a production app, you'd use sessions or database storage
-current_df = None
+def delete_dataset(dataset):
+    """Delete a dataset, keeping its file and column cache if another dataset shares them"""
+    shared = Dataset.objects.filter(file=dataset.file.name).exclude(pk=dataset.pk).exists()
+    if not shared:
+        dataset.file.delete(save=False)
+        remove_columns(dataset.column_cache_path)
+    dataset.delete()
+
+def load_data_table(data_table):
+    """
+    Read a saved table's columns straight back into a DataFrame
+    The columns are also written to a column cache, so the table is
+    memory-mapped instead of decompressed the next time it is opened
+    """
+    with data_table.data_file.open('rb') as f:
+        df = unpack_columns(f)
+    try:
+        write_columns(df, data_table.column_cache_path)
+    except Exception as e:
+        logger.warning("Could not write column cache for table %s: %s", data_table.pk, e)
+    return df
+
+def set_current_dataframe(request, df, dataset_id=WORKSPACE_DATASET_ID, profile=None):
+    """Make a DataFrame the active one for this session (by default as its workspace)"""
+    session_key = get_session_key(request)
+    dataset_store.put(session_key, dataset_id, df, profile=profile)
+    if dataset_id == WORKSPACE_DATASET_ID:
+        save_workspace(session_key, df)
+    request.session['dataset_id'] = dataset_id
+
+def submit_ingest_job(request, dataset):
+    """
+    Queue parsing of an uploaded dataset file; the job updates the dataset's status
+    The dataset must already be saved as queued, with this process as its job_owner
+    """
+    dataset_id = dataset.pk
+
+    def on_start(job):
+        Dataset.objects.filter(pk=dataset_id, status=Dataset.QUEUED).update(status=Dataset.RUNNING)
+
+    def on_done(job):
+        if job.error is not None:
+            Dataset.objects.filter(pk=dataset_id).update(status=Dataset.FAILED, job_owner='')
+        else:
+            Dataset.objects.filter(pk=dataset_id).update(
+                status=Dataset.DONE, profile=job.result['profile'], job_owner='',
+            )
+
+    # Parsed in one process: the job pool already runs JOB_WORKERS ingest jobs at
+    # once, and byte-range pools inside each would multiply that by INGEST_WORKERS
+    return job_queue.submit(
+        'ingest', ingest_csv_file,
+        dataset.file.path, dataset.column_cache_path, settings.UPLOAD_PARSE_CHUNK_SIZE,
+        on_start=on_start,
+        on_done=on_done,
+        session_key=get_session_key(request),
+        dataset_id=str(dataset_id),
+        file_name=dataset.name,
+    )
+
+def fail_orphaned_datasets(datasets):
+    """
+    Mark queued or running datasets whose ingest job is gone as failed
+    Jobs only live in the memory of the process that queued them, so after a
+    restart (or a crash) nothing would ever finish them
+    """
+    orphaned = [
+        dataset.pk for dataset in datasets
+        if dataset.status in (Dataset.QUEUED, Dataset.RUNNING) and not is_owner_alive(dataset.job_owner)
+    ]
+    if orphaned:
+        Dataset.objects.filter(pk__in=orphaned, status__in=(Dataset.QUEUED, Dataset.RUNNING)).update(
+            status=Dataset.FAILED, job_owner='',
+        )
+        for dataset in datasets:
+            if dataset.pk in orphaned:
+                dataset.status = Dataset.FAILED
+    return datasets
+
+def get_session_job(request):
+    """Return the job named by ?job_id= if it was submitted by this session"""
+    job = job_queue.get(request.GET.get('job_id', ''))
+    if job is None or job.meta.get('session_key') != get_session_key(request):
+        return None
+    return job
+
+def get_chart_stats(entry, x_column, y_columns):
+    """
+    Summary statistics of the plotted columns, read from the entry's column profile
+    y_stats describes the first y column; with several, series_stats has them all
+    """
+    stats = {
+        'x_stats': profile_column_stats(get_column_profile(entry.profile, x_column)),
+        'y_stats': profile_column_stats(get_column_profile(entry.profile, y_columns[0])),
+    }
+    if len(y_columns) > 1:
+        stats['series_stats'] = {
+            column: profile_column_stats(get_column_profile(entry.profile, column))
+            for column in y_columns
+        }
+    return stats
+
+def get_figure_cache_key(fingerprint, graph_type, x_column, y_column, options):
+    """Cache key for a rendered chart: dataset content hash plus the chart spec"""
+    spec = json.dumps([graph_type, x_column, y_column, options], sort_keys=True, default=str)
+    return f"figure:{fingerprint}:{hashlib.sha1(spec.encode('utf-8')).hexdigest()}"
+
+def get_etag(*parts):
+    """
+    Weak ETag of a response determined by `parts` (a dataset content hash and
+    the request options), so it is known before the response is built
+    """
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+def get_not_modified(request, etag):
+    """304 response when a GET already holds the representation with this ETag, else None"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag)
+    return set_validators(response, etag) if response is not None else None
+
+def set_validators(response, etag):
+    """Let the browser keep a response and revalidate it with If-None-Match before reuse"""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 def index(request):
     """Main view for the data visualization dashboard"""
@@ -29,52 +315,124 @@ def index(request):
     context = {
         'upload_form': upload_form,
         'graph_form': graph_form,
-        'has_data': current_df is not None,
+        'has_data': 'dataset_id' in request.session,
     }
     
     return render(request, 'data_viz_app/index.html', context)
 
+@csrf_exempt
 def upload_file(request):
-    """Handle file upload with preprocessing"""
+    """
+    Handle file upload with preprocessing
+    The CSV is parsed by StreamingCSVUploadHandler while it is being received.
+    The handler has to be installed before anything reads the request body, so
+    CSRF protection is applied afterwards by process_upload.
+    """
+    if request.method == 'POST':
+        # With ?async=1 the file is only written here and parsed by a background job
+        run_async = request.GET.get('async') in ('1', 'true')
+        request.upload_handlers.insert(0, StreamingCSVUploadHandler(request, parse=not run_async))
+    return process_upload(request)
+
+@csrf_protect
+def process_upload(request):
+    """Create the dataset from an uploaded CSV file"""
+    upload_id = get_upload_id(request)
     if request.method == 'POST':
         form = DatasetUploadForm(request.POST, request.FILES)
+        uploaded_file = request.FILES.get('file')
+        streamed = isinstance(uploaded_file, StreamedCSVUpload)
         if form.is_valid():
-            dataset = form.save()
+            dataset = form.save(commit=False)
+            # Identical uploads share one stored file and one parsed column cache
+            dataset.file, dataset.content_hash = store_upload(uploaded_file)
             
-            try:
-                global current_df
-                
-                # Use the new preprocessing function
-                uploaded_file = request.FILES['file']
-                
-                # Reset file pointer to beginning (in case it was read during form validation)
-                uploaded_file.seek(0)
+            processed = find_processed_copy(dataset.content_hash)
+            if processed is not None:
+                # The same content was ingested before; nothing needs parsing
+                df, dataset.profile = processed
+                dataset.status = Dataset.DONE
+                dataset.save()
+                set_current_dataframe(request, df, dataset_id=str(dataset.pk), profile=dataset.profile)
                 
-                # Preprocess the CSV file
-                header, cleaned_data = read_and_preprocess_csv(uploaded_file)
+                update_upload_progress(upload_id, status='done', rows_processed=len(df))
+                return JsonResponse({
+                    'success': True,
+                    'message': 'File uploaded; identical content was already processed',
+                    'columns': list(df.columns),
+                    'file_name': dataset.name,
+                    'rows_processed': len(df),
+                    'deduplicated': True,
+                })
+            
+            if streamed and not uploaded_file.parsed:
+                dataset.status = Dataset.QUEUED
+                dataset.job_owner = get_process_owner()
+                dataset.save()
+                job = submit_ingest_job(request, dataset)
+                update_upload_progress(upload_id, status='queued', job_id=job.id)
+                return JsonResponse({
+                    'success': True,
+                    'message': 'File uploaded; processing in the background',
+                    'queued': True,
+                    'file_name': dataset.name,
+                    'dataset_id': dataset.pk,
+                    **job.to_dict(),
+                })
+            
+            dataset.status = Dataset.RUNNING
+            dataset.job_owner = get_process_owner()
+            dataset.save()
+            
+            try:
+                if streamed:
+                    if uploaded_file.error:
+                        raise ValueError(uploaded_file.error)
+                    header, cleaned_data = uploaded_file.header, uploaded_file.dataframe
+                else:
+                    # Reset file pointer to beginning (in case it was read during form validation)
+                    uploaded_file.seek(0)
+                    
+                    # Preprocess the CSV file
+                    with stage('parse'):
+                        header, cleaned_data = read_and_preprocess_csv(uploaded_file)
                 
                 # Create DataFrame from preprocessed data
-                current_df = create_dataframe_from_preprocessed_data(header, cleaned_data)
+                df = create_dataframe_from_preprocessed_data(header, cleaned_data)
+                note(rows=len(df))
+                cache_dataset_columns(dataset, df)
+                # Streamed uploads were profiled chunk by chunk while they were parsed
+                if streamed:
+                    dataset.profile = uploaded_file.profile
+                else:
+                    with stage('profile'):
+                        dataset.profile = profile_dataframe(df)
+                set_current_dataframe(request, df, dataset_id=str(dataset.pk), profile=dataset.profile)
                 
                 # Save processed status
-                dataset.processed = True
+                dataset.status = Dataset.DONE
                 dataset.save()
                 
+                update_upload_progress(upload_id, status='done', rows_processed=len(df))
                 return JsonResponse({
                     'success': True,
                     'message': 'File uploaded and preprocessed successfully',
-                    'columns': list(current_df.columns),
+                    'columns': list(df.columns),
                     'file_name': dataset.name,
                     'rows_processed': len(cleaned_data),
                 })
             except Exception as e:
                 # Delete the dataset if processing fails
-                dataset.delete()
+                delete_dataset(dataset)
+                update_upload_progress(upload_id, status='failed', message=str(e))
                 return JsonResponse({
                     'success': False,
                     'message': f'Error processing file: {str(e)}',
                 })
         else:
+            if streamed:
+                uploaded_file.discard()
+            update_upload_progress(upload_id, status='failed', message='Invalid form submission')
             return JsonResponse({
                 'success': False,
                 'message': 'Invalid form submission',
@@ -83,6 +441,17 @@ def upload_file(request):
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
+def upload_progress(request):
+    """Report bytes received and rows parsed for an upload started with ?upload_id="""
+    progress = get_upload_progress(get_upload_id(request))
+    if progress is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Unknown upload',
+        })
+    
+    return JsonResponse({'success': True, **progress})
+
 @csrf_exempt
 def process_data(request):
     """Process data from the spreadsheet interface"""
@@ -91,13 +460,13 @@ def process_data(request):
             data = json.loads(request.body)
             table_data = data.get('data', [])
             
-            global current_df
-            current_df = pd.DataFrame(table_data)
+            df = pd.DataFrame(table_data)
+            set_current_dataframe(request, df)
             
             return JsonResponse({
                 'success': True,
                 'message': 'Data processed successfully',
-                'columns': list(current_df.columns),
+                'columns': list(df.columns),
             })
         except Exception as e:
             return JsonResponse({
@@ -108,91 +477,519 @@ def process_data(request):
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
 def get_columns(request):
-    """Get columns from the current dataframe"""
-    if current_df is None:
+    """
+    Get columns from the current dataframe
+    Rows are served in windows by get_rows; pass include_data=1 to also
+    receive the whole dataset as a list of records
+    """
+    entry = get_current_entry(request)
+    if entry is None:
         return JsonResponse({
             'success': False,
             'message': 'No data available',
         })
+    current_df = entry.df
     
-    columns = list(current_df.columns)
-    column_types = get_column_types(current_df)
+    include_data = request.GET.get('include_data') in ('1', 'true')
+    etag = get_etag('columns', entry.fingerprint, entry.version, include_data)
+    not_modified = get_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
     
-    # Convert DataFrame to JSON for the spreadsheet
-    data_json = dataframe_to_json(current_df)
+    columns = list(current_df.columns)
+    column_types = profile_column_types(entry.profile)
     
-    return JsonResponse({
+    response = {
         'success': True,
         'columns': columns,
         'column_types': column_types,
-        'data': data_json,  # Return the data for the spreadsheet
-    })
+        'row_count': len(current_df),
+        'version': entry.version,
+    }
+    
+    if include_data:
+        # Convert DataFrame to JSON for the spreadsheet
+        response['data'] = dataframe_to_json(current_df)
+    
+    return set_validators(JsonResponse(response), etag)
+
+# Largest window get_rows will serve in one response
+MAX_ROW_WINDOW = 5000
+
+# Sorted/filtered row orders kept per stored frame
+MAX_CACHED_ROW_ORDERS = 8
+
+def get_rows(request):
+    """
+    Serve a window of rows for the spreadsheet, column-oriented
+    Query parameters: offset, limit, optional sort (column), order (asc/desc),
+    filter_column and filter_value
+    """
+    entry = get_current_entry(request)
+    if entry is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'No data available',
+        })
+    df = entry.df
+    
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', 200)), 0), MAX_ROW_WINDOW)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'message': 'offset and limit must be integers',
+        })
+    
+    sort_column = request.GET.get('sort') or None
+    ascending = request.GET.get('order', 'asc') != 'desc'
+    filter_column = request.GET.get('filter_column') or None
+    filter_value = request.GET.get('filter_value')
+    
+    for column in (sort_column, filter_column):
+        if column is not None and column not in df.columns:
+            return JsonResponse({
+                'success': False,
+                'message': f'Column {column} not found in data',
+            })
+    
+    etag = get_etag('rows', entry.fingerprint, entry.version, offset, limit,
+                    sort_column, ascending, filter_column, filter_value)
+    not_modified = get_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    
+    if sort_column is None and filter_column is None:
+        positions = np.arange(offset, min(offset + limit, len(df)))
+        total_rows = len(df)
+    else:
+        # Sorting/filtering is done once per query and reused while scrolling
+        query = (sort_column, ascending, filter_column, filter_value)
+        order = entry.row_orders.get(query)
+        if order is None:
+            order = get_row_order(df, sort_column, ascending, filter_column, filter_value)
+            if len(entry.row_orders) >= MAX_CACHED_ROW_ORDERS:
+                entry.row_orders.clear()
+            entry.row_orders[query] = order
+        positions = order[offset:offset + limit]
+        total_rows = len(order)
+    
+    return set_validators(JsonResponse({
+        'success': True,
+        'columns': list(df.columns),
+        'offset': offset,
+        'total_rows': total_rows,
+        'version': entry.version,
+        # Row positions in the stored frame, so edits can refer back to them
+        'row_ids': positions.tolist(),
+        'data': dataframe_window_to_columns(df, positions),
+    }), etag)
 
 @csrf_exempt
-def generate_graph(request):
-    """Generate a graph based on user selections"""
+def apply_changes(request):
+    """
+    Apply a batch of spreadsheet cell edits to the session's DataFrame
+    Body: {"version": n, "changes": [{"row": i, "column": name, "value": v}, ...]}
+    The change set is rejected with a conflict if the frame has moved on
+    from the version the client last saw
+    """
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            graph_type = data.get('graph_type')
-            x_column = data.get('x_column')
-            y_column = data.get('y_column')
+            changes = data.get('changes', [])
+            client_version = data.get('version')
+            
+            session_key = get_session_key(request)
+            entry = get_current_entry(request)
+            if entry is None:
+                # Data typed into an empty grid starts a new workspace frame
+                entry = dataset_store.put(session_key, WORKSPACE_DATASET_ID, pd.DataFrame())
+                request.session['dataset_id'] = WORKSPACE_DATASET_ID
             
-            if current_df is None:
+            with entry.edit_lock:
+                if client_version is not None and client_version != entry.version:
+                    return JsonResponse({
+                        'success': False,
+                        'conflict': True,
+                        'message': 'Data was changed elsewhere; reload before editing',
+                        'version': entry.version,
+                    }, status=409)
+                
+                if changes:
+                    # Values the edited cells held, merged out of the profile
+                    previous = {}
+                    if request.session['dataset_id'] == WORKSPACE_DATASET_ID:
+                        df = apply_cell_changes(entry.df, changes, max_new_rows=settings.EDIT_MAX_NEW_ROWS,
+                                                previous=previous)
+                    else:
+                        # Uploaded datasets and saved tables are edited as a workspace copy,
+                        # made once the changes are accepted; copy-on-write leaves the
+                        # stored frame's columns untouched
+                        copy = entry.df.copy(deep=False)
+                        df = apply_cell_changes(copy, changes, max_new_rows=settings.EDIT_MAX_NEW_ROWS,
+                                                previous=previous)
+                        entry = dataset_store.put(session_key, WORKSPACE_DATASET_ID, copy, profile=entry.profile)
+                        request.session['dataset_id'] = WORKSPACE_DATASET_ID
+                    dataset_store.record_edit(session_key, WORKSPACE_DATASET_ID, entry, df, changes, previous)
+                    save_workspace(session_key, entry.df)
+                
                 return JsonResponse({
-                    'success': False,
-                    'message': 'No data available',
+                    'success': True,
+                    'version': entry.version,
+                    'applied': len(changes),
+                    'columns': list(entry.df.columns),
+                    'row_count': len(entry.df),
                 })
+        except Exception as e:
+            return JsonResponse({
+                'success': False,
+                'message': f'Error applying changes: {str(e)}',
+            })
+    
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+def parse_max_points(value):
+    """
+    Point budget of a chart request: a positive integer (or digit string)
+    Larger values are lowered to GRAPH_MAX_POINTS, which bounds every response
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError(value)
+    max_points = int(value)
+    if max_points < 1:
+        raise ValueError(value)
+    return min(max_points, settings.GRAPH_MAX_POINTS)
+
+def parse_chart_spec(data, df):
+    """
+    Read the chart options of a generate_graph request and check them against df
+    Returns (spec, None), or (None, message) when an option is invalid
+    """
+    x_column = data.get('x_column')
+    # Several y columns are drawn as one series each
+    y_columns = data.get('y_columns') or [data.get('y_column')]
+    # Optional columns that split series by color and into facet panels
+    color_column = data.get('color_column') or None
+    facet_column = data.get('facet_column') or None
+    plot_encoding = data.get('plot_encoding', 'json')
+    # Bin count (or [x, y] pair) and bar aggregation for binned charts
+    bins = data.get('bins')
+    agg = data.get('agg', 'sum')
+    # Pie slices shown before the rest are collapsed into "Other"
+    top_n = data.get('top_n', DEFAULT_TOP_N)
+    downsample = data.get('downsample', 'auto')
+    
+    # Check if columns exist
+    if x_column not in df.columns:
+        return None, f'Column {x_column} not found in data'
+    
+    if not isinstance(y_columns, list) or len(y_columns) > settings.GRAPH_MAX_SERIES_COLUMNS:
+        return None, f'y_columns must be a list of at most {settings.GRAPH_MAX_SERIES_COLUMNS} columns'
+    
+    for column in [*y_columns, color_column, facet_column]:
+        if column is not None and column not in df.columns:
+            return None, f'Column {column} not found in data'
+    
+    # A single y column is passed on as before, so its chart is unchanged
+    y_columns = list(dict.fromkeys(y_columns))
+    
+    if plot_encoding not in PLOT_ENCODINGS:
+        return None, f'Unsupported plot encoding {plot_encoding}'
+    
+    if agg not in AGGREGATIONS:
+        return None, f'Unsupported aggregation {agg}'
+    
+    try:
+        bins = parse_bins(bins)
+    except (TypeError, ValueError) as e:
+        return None, f'Invalid bins: {str(e)}'
+    
+    if isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1:
+        return None, 'top_n must be a positive integer'
+    
+    if downsample not in DOWNSAMPLE_METHODS:
+        return None, f'Unsupported downsampling method {downsample}'
+    
+    try:
+        max_points = parse_max_points(data.get('max_points', settings.GRAPH_MAX_POINTS))
+    except (TypeError, ValueError):
+        return None, 'max_points must be a positive integer'
+    
+    return {
+        'graph_type': data.get('graph_type'),
+        'x_column': x_column,
+        'y_columns': y_columns,
+        'y_column': y_columns[0] if len(y_columns) == 1 else y_columns,
+        'color_column': color_column,
+        'facet_column': facet_column,
+        'subplots': bool(data.get('subplots', False)),
+        'max_points': max_points,
+        'downsample': downsample,
+        'plot_encoding': plot_encoding,
+        'bins': bins,
+        'agg': agg,
+        'top_n': top_n,
+    }, None
+
+def get_chart_cache_key(entry, spec):
+    """
+    Figure cache key of a chart spec
+    Charts are cached by dataset content, so an edit through process_data
+    (which changes the content) never hits a stale entry
+    """
+    return get_figure_cache_key(entry.fingerprint, spec['graph_type'], spec['x_column'], spec['y_column'], {
+        'max_points': spec['max_points'],
+        'downsample': spec['downsample'],
+        'plot_encoding': spec['plot_encoding'],
+        'bins': spec['bins'],
+        'agg': spec['agg'],
+        'top_n': spec['top_n'],
+        'color': spec['color_column'],
+        'facet': spec['facet_column'],
+        'subplots': spec['subplots'],
+    })
+
+def render_chart_spec(df, spec):
+    """Generate the figure (the shared frame is only read, never copied)"""
+    return render_chart(
+        df, spec['graph_type'], spec['x_column'], spec['y_column'],
+        spec['max_points'], spec['downsample'], spec['plot_encoding'],
+        bins=spec['bins'], agg=spec['agg'], top_n=spec['top_n'],
+        color_column=spec['color_column'], facet_column=spec['facet_column'], subplots=spec['subplots'],
+    )
+
+def submit_chart_job(session_key, df, spec, cache_key):
+    """Render a chart in a worker process; only the plotted columns are sent to it"""
+    figure_cache = caches['figures']
+    
+    def on_done(job):
+        if job.error is None:
+            figure_cache.set(cache_key, job.result)
+    
+    # Every series is built from this one projection of the plotted columns
+    plot_columns = list(dict.fromkeys(
+        column for column in [spec['x_column'], *spec['y_columns'], spec['color_column'], spec['facet_column']]
+        if column is not None
+    ))
+    return job_queue.submit(
+        'chart', render_chart,
+        df.loc[:, plot_columns],
+        spec['graph_type'], spec['x_column'], spec['y_column'], spec['max_points'], spec['downsample'],
+        spec['plot_encoding'], spec['bins'], spec['agg'], spec['top_n'],
+        spec['color_column'], spec['facet_column'], spec['subplots'],
+        on_done=on_done,
+        session_key=session_key,
+        x_column=spec['x_column'],
+        y_columns=spec['y_columns'],
+    )
+
+def get_chart_request_data(request):
+    """Chart options of a generate_graph request: POSTed JSON, or GET ?spec=<the same JSON>"""
+    if request.method == 'GET':
+        return json.loads(request.GET.get('spec') or '{}')
+    return json.loads(request.body)
+
+@csrf_exempt
+def generate_graph(request):
+    """
+    Generate a graph based on user selections
+    The options are POSTed as JSON, or sent as GET ?spec=<the same JSON> so the
+    browser can keep the chart and revalidate it with its ETag
+    """
+    if request.method in ('GET', 'POST'):
+        try:
+            data = get_chart_request_data(request)
             
-            # Print debug information
-            print(f"Generating {graph_type} graph with x={x_column}, y={y_column}")
-            print(f"DataFrame shape: {current_df.shape}")
-            print(f"DataFrame columns: {current_df.columns.tolist()}")
-            
-            # Check if columns exist
-            if x_column not in current_df.columns:
+            with stage('load'):
+                entry = get_current_entry(request)
+            if entry is None:
                 return JsonResponse({
                     'success': False,
-                    'message': f'Column {x_column} not found in data',
+                    'message': 'No data available',
                 })
-                
-            if y_column not in current_df.columns:
+            current_df = entry.df
+            logger.debug("Generating %s graph with x=%s, y=%s from %d rows",
+                         data.get('graph_type'), data.get('x_column'), data.get('y_columns'), len(current_df))
+            
+            spec, message = parse_chart_spec(data, current_df)
+            if spec is None:
                 return JsonResponse({
                     'success': False,
-                    'message': f'Column {y_column} not found in data',
-                })
+                    'message': message,
+                }, status=400)
             
-            # Print sample data for debugging
-            print(f"Sample data for {x_column}: {current_df[x_column].head().tolist()}")
-            print(f"Sample data for {y_column}: {current_df[y_column].head().tolist()}")
+            figure_cache = caches['figures']
+            cache_key = get_chart_cache_key(entry, spec)
+            # The ETag is known from the key, so a chart the browser holds is not even looked up
+            etag = get_etag('chart', cache_key)
+            not_modified = get_not_modified(request, etag)
+            if not_modified is not None:
+                return not_modified
             
-            # Make a copy of the dataframe to avoid modifying the original
-            df_for_plot = current_df.copy()
+            # Column statistics come from the profile, so they are never recomputed here
+            stats = get_chart_stats(entry, spec['x_column'], spec['y_columns'])
+            result = figure_cache.get(cache_key)
+            note(graph_type=spec['graph_type'], cached=result is not None)
+            if result is not None:
+                with stage('response'):
+                    return set_validators(
+                        JsonResponse({'success': True, 'cached': True, **result, **stats}), etag)
             
-            # Generate the figure
-            fig = generate_plotly_figure(df_for_plot, graph_type, x_column, y_column)
-            plot_json = get_plotly_json(fig)
+            if data.get('async') and len(current_df) >= settings.JOB_CHART_MIN_ROWS:
+                job = submit_chart_job(get_session_key(request), current_df, spec, cache_key)
+                return JsonResponse({'success': True, 'queued': True, **job.to_dict()})
             
-            # Print the JSON length for debugging
-            print(f"Plot JSON length: {len(plot_json)}")
+            result = render_chart_spec(current_df, spec)
+            figure_cache.set(cache_key, result)
+            
+            with stage('response'):
+                return set_validators(
+                    JsonResponse({'success': True, 'cached': False, **result, **stats}), etag)
+        except Exception as e:
+            logger.exception("Error generating graph")
+            note(failed=True)
+            return JsonResponse({
+                'success': False,
+                'message': f'Error generating graph: {str(e)}',
+            })
+    
+    return JsonResponse({'success': False, 'message': 'Invalid request method'})
+
+def list_datasets(request):
+    """List the uploaded datasets and saved tables that can be opened again"""
+    datasets = [{
+        'id': dataset.pk,
+        'name': dataset.name,
+        'uploaded_at': dataset.uploaded_at.isoformat(),
+        'status': dataset.status,
+        'rows': dataset.profile['rows'] if dataset.profile else None,
+    } for dataset in fail_orphaned_datasets(list(Dataset.objects.order_by('-uploaded_at')))]
+    
+    tables = [{
+        'id': data_table.pk,
+        'name': data_table.name,
+        'created_at': data_table.created_at.isoformat(),
+        'rows': data_table.profile['rows'] if data_table.profile else None,
+    } for data_table in DataTable.objects.order_by('-created_at')]
+    
+    return JsonResponse({'success': True, 'datasets': datasets, 'tables': tables})
+
+@csrf_exempt
+def open_dataset(request):
+    """
+    Make a stored dataset or saved table the session's current data
+    Body: {"dataset_id": n} or {"table_id": n}. The response has the same shape
+    as an upload, plus the tier that served the data and how long loading took.
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            if data.get('table_id') is not None:
+                data_table = DataTable.objects.filter(pk=data['table_id']).first()
+                if data_table is None:
+                    return JsonResponse({
+                        'success': False,
+                        'message': 'Saved table not found',
+                    })
+                dataset_id, name = f"{TABLE_ID_PREFIX}{data_table.pk}", data_table.name
+            else:
+                dataset = Dataset.objects.filter(pk=data.get('dataset_id')).first()
+                if dataset is None:
+                    return JsonResponse({
+                        'success': False,
+                        'message': 'Dataset not found',
+                    })
+                fail_orphaned_datasets([dataset])
+                if dataset.status != Dataset.DONE:
+                    return JsonResponse({
+                        'success': False,
+                        'message': f'Dataset is not ready (status: {dataset.status})',
+                    })
+                dataset_id, name = str(dataset.pk), dataset.name
+            
+            start = time.perf_counter()
+            entry, tier = open_stored_frame(get_session_key(request), dataset_id)
+            if entry is None:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Stored data could not be loaded',
+                })
+            request.session['dataset_id'] = dataset_id
             
             return JsonResponse({
                 'success': True,
-                'plot': plot_json,
-                'x_stats': get_column_stats(current_df, x_column),
-                'y_stats': get_column_stats(current_df, y_column),
+                'message': 'Dataset opened',
+                'columns': list(entry.df.columns),
+                'file_name': name,
+                'rows_processed': len(entry.df),
+                'tier': tier,
+                'load_ms': round((time.perf_counter() - start) * 1000, 1),
             })
         except Exception as e:
-            import traceback
-            print(f"Error generating graph: {str(e)}")
-            print(traceback.format_exc())
             return JsonResponse({
                 'success': False,
-                'message': f'Error generating graph: {str(e)}',
+                'message': f'Error opening dataset: {str(e)}',
             })
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
+def job_status(request):
+    """Report the state of a background job started by this session"""
+    job = get_session_job(request)
+    if job is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Unknown job',
+        })
+    
+    return JsonResponse({'success': True, **job.to_dict()})
+
+def job_result(request):
+    """
+    Return the result of a finished job, in the same shape as the request that queued it
+    Fetching the result of an ingest job makes its dataset the session's current one
+    """
+    job = get_session_job(request)
+    if job is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Unknown job',
+        })
+    
+    status = job.status
+    if status == FAILED:
+        return JsonResponse({
+            'success': False,
+            'status': status,
+            'message': f'Job failed: {job.error}',
+        })
+    if status != DONE:
+        return JsonResponse({
+            'success': False,
+            'status': status,
+            'message': 'Job has not finished yet',
+        })
+    
+    if job.kind == 'ingest':
+        request.session['dataset_id'] = job.meta['dataset_id']
+        return JsonResponse({
+            'success': True,
+            'message': 'File uploaded and preprocessed successfully',
+            'columns': job.result['columns'],
+            'file_name': job.meta['file_name'],
+            'rows_processed': job.result['rows_processed'],
+        })
+    
+    # A finished job's chart never changes; its statistics follow the session's data
+    entry = get_current_entry(request)
+    etag = get_etag('job', job.id, entry.fingerprint if entry is not None else None)
+    not_modified = get_not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    stats = get_chart_stats(entry, job.meta['x_column'], job.meta['y_columns']) if entry is not None else {}
+    return set_validators(JsonResponse({'success': True, 'cached': False, **job.result, **stats}), etag)
+
 @csrf_exempt
 def save_data(request):
     """Save the current data to the database"""
@@ -201,18 +998,17 @@ def save_data(request):
             data = json.loads(request.body)
             name = data.get('name', 'Untitled Dataset')
             
-            if current_df is None:
+            entry = get_current_entry(request)
+            if entry is None:
                 return JsonResponse({
                     'success': False,
                     'message': 'No data available to save',
                 })
             
-            # Convert DataFrame to JSON and save
-            data_json = dataframe_to_json(current_df)
-            data_table = DataTable.objects.create(
-                name=name,
-                data_json=data_json
-            )
+            # Store the columns as a compressed blob next to the other media files
+            data_table = DataTable(name=name, profile=entry.profile)
+            data_table.data_file.save(f"{name}.npz", ContentFile(pack_columns(entry.df)), save=False)
+            data_table.save()
             
             return JsonResponse({
                 'success': True,
@@ -227,4 +1023,24 @@ def save_data(request):
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
-print("Views created with preprocessing integration")
+def get_metrics(request):
+    """
+    Request and stage timings (count, mean, p50, p95, p99 in ms) and sizes
+    recorded by this worker process since it started or was last reset
+    POST with {"reset": true} (and a CSRF token) to clear them. Empty unless
+    METRICS_ENABLED is on. Only staff users can read them, unless DEBUG is on.
+    """
+    if not (settings.DEBUG or request.user.is_staff):
+        return JsonResponse({
+            'success': False,
+            'message': 'Metrics are only available to staff users',
+        }, status=403)
+    
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = {}
+        if data.get('reset'):
+            metrics.reset()
+    return JsonResponse({'success': True, **metrics.snapshot()})
@@ -46,6 +46,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so request timings and sizes include compression
+    'data_viz_app.middleware.RequestMetricsMiddleware',
+    'data_viz_app.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,10 +82,12 @@ WSGI_APPLICATION = 'data_viz_proj.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# DATA_VIZ_DB_PATH and DATA_VIZ_MEDIA_ROOT (below) move the database and uploads,
+# e.g. so the load_test command can run servers against a scratch copy
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DATA_VIZ_DB_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
@@ -127,7 +132,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # Media files (Uploaded files)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_ROOT = os.environ.get('DATA_VIZ_MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+# Caches
+# Rendered charts are kept in the "figures" cache, keyed by dataset content hash
+# and chart spec. Swap in FileBasedCache (or any other backend) to share
+# entries between worker processes:
+#     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#     'LOCATION': os.path.join(BASE_DIR, 'cache', 'figures'),
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'figures': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'figures',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            # Least recently used charts are culled past this many entries
+            'MAX_ENTRIES': 200,
+        },
+    },
+}
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -139,6 +165,92 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+
+# Dataset uploads are parsed while they are received, this many bytes at a time,
+# so only one chunk of raw CSV text is held in memory whatever the file size
+UPLOAD_PARSE_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
+# Seconds upload progress stays available to the upload_progress endpoint
+# Progress lives in the default cache; use a shared cache with several workers
+UPLOAD_PROGRESS_TIMEOUT = 60 * 60
+
+# Memory budget for parsed DataFrames kept in each worker process
+# Least recently used frames are evicted first once the budget is exceeded;
+# a session's edited workspace is also on disk, so it is reloaded, not lost
+DATASET_STORE_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+
+# Most rows one change set sent to apply_changes can append to a dataset
+EDIT_MAX_NEW_ROWS = 1000
+
+# Default point budget for line, area and scatter traces sent to the browser
+# Requests can lower it with "max_points" (never raise it); larger series are downsampled
+GRAPH_MAX_POINTS = 5000
+
+# Most y columns one chart request can plot; the point budget is shared by all series
+GRAPH_MAX_SERIES_COLUMNS = 10
+
+# JSON responses at least this large are compressed (zstd, brotli or gzip, as
+# negotiated); smaller ones cost more to compress than they save
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+
+# Background jobs (CSV ingestion, chart rendering) run in a local process pool
+JOB_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Seconds a finished job's status and result stay available
+JOB_RESULT_TTL = 10 * 60
+# Charts requested with "async" are only queued for datasets with at least this many rows
+JOB_CHART_MIN_ROWS = 200000
+
+# Processes that parse one large CSV file in parallel, each taking a byte range
+# of at least 16MB (smaller files are parsed in one process); 1 disables it.
+# Only used in the web process: ingest jobs parse serially, as the job pool
+# already runs JOB_WORKERS of them at once
+INGEST_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# Async variants of the upload, column and chart endpoints (data_viz_app.async_views),
+# for serving data_viz_proj.asgi with an ASGI server such as uvicorn
+# (DATA_VIZ_ASYNC_VIEWS=1 turns them on without editing this file)
+ASYNC_VIEWS = os.environ.get('DATA_VIZ_ASYNC_VIEWS') == '1'
+# Threads their pandas and Plotly work runs on, off the event loop
+ASYNC_COMPUTE_WORKERS = max(2, os.cpu_count() or 2)
+# Most of those threads one session dataset can use at a time; further requests wait
+ASYNC_DATASET_CONCURRENCY = 2
+# Most of them one dataset can use across all sessions, so a popular dataset
+# leaves threads for the others
+ASYNC_SHARED_DATASET_CONCURRENCY = max(2, ASYNC_COMPUTE_WORKERS // 2)
+# Rows serialized per block when get_columns streams a whole dataset
+ASYNC_STREAM_ROWS = 10000
+
+# Per-stage request timings, row counts and payload sizes, logged as one JSON line
+# per request (logger "data_viz_app.utils.metrics") and served as p50/p95
+# histograms by the metrics endpoint. Off, each instrumented stage costs one lookup
+# (DATA_VIZ_METRICS=1 turns it on without editing this file)
+METRICS_ENABLED = os.environ.get('DATA_VIZ_METRICS') == '1'
+
+# Logging
+# App messages go to the console at INFO; set the "data_viz_app" level to DEBUG
+# for chart and column details
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name}: {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'data_viz_app': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 